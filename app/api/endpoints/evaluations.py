@@ -0,0 +1,65 @@
+from dataclasses import asdict
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from app.api.schemas import EvaluationRequest, EvaluationJobResponse
+from app.evaluation.jobs import EvaluationJob, evaluation_jobs, load_prompts
+from typing import List
+import os
+
+router = APIRouter()
+
+def _get_job(job_id: str) -> EvaluationJob:
+    try:
+        return evaluation_jobs.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Evaluation not found")
+
+@router.post("", response_model=EvaluationJobResponse)
+async def create_evaluation(request: EvaluationRequest):
+    """
+    Evaluate system prompts against a question set in the background.
+
+    Poll the job for progress and fetch its answers as JSONL from /results.
+    Larger question files are better run with `python -m app.evaluation`.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions given")
+    try:
+        await load_prompts(request.prompt_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    job = EvaluationJob.create(request.prompt_ids, questions=request.questions, concurrency=request.concurrency, publish=request.publish)
+    evaluation_jobs.start(job)
+    return asdict(job.spec)
+
+@router.get("", response_model=List[EvaluationJobResponse])
+async def list_evaluations():
+    return [asdict(spec) for spec in evaluation_jobs.list()]
+
+@router.get("/{job_id}", response_model=EvaluationJobResponse)
+async def get_evaluation(job_id: str):
+    return asdict(_get_job(job_id).spec)
+
+@router.get("/{job_id}/results")
+async def evaluation_results(job_id: str):
+    job = _get_job(job_id)
+    if not os.path.exists(job.output_path):
+        raise HTTPException(status_code=404, detail="No results yet")
+    return FileResponse(job.output_path, media_type="application/x-ndjson", filename=f"{job_id}.jsonl")
+
+@router.post("/{job_id}/cancel", response_model=EvaluationJobResponse)
+async def cancel_evaluation(job_id: str):
+    job = _get_job(job_id)
+    if not evaluation_jobs.is_running(job_id):
+        raise HTTPException(status_code=409, detail="Evaluation is not running")
+    job.cancel()
+    return asdict(job.spec)
+
+@router.post("/{job_id}/resume", response_model=EvaluationJobResponse)
+async def resume_evaluation(job_id: str):
+    job = _get_job(job_id)
+    try:
+        evaluation_jobs.start(job)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return asdict(job.spec)
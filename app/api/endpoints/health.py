@@ -1,13 +1,18 @@
 from fastapi import APIRouter, HTTPException
-from app.core.llm import llm_service
+from fastapi.responses import JSONResponse
+from app.core.container import container
+from app.core.model_registry import model_registry
 
 router = APIRouter()
 
 @router.get("")
 async def health_check():
+    # Vector store and model config reachable; warm-up progress is reported by /ready.
+    # With lazy warm-up the first check builds the LLM service, as the first prompt would.
     try:
-        # Test vector store connection
-        llm_service.vector_store._client.get_collection(llm_service.vector_store.collection_name)
+        llm_service = await container.aget("llm_service")
+        # Test vector store connection for every searched collection
+        await llm_service.retriever.check()
         return {
             "status": "healthy",
             "model": llm_service.llm.model,
@@ -15,4 +20,22 @@ async def health_check():
             "embedding_model": llm_service.embed_model.model_name
         }
     except Exception as e:
-        raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
+
+@router.get("/live")
+async def liveness():
+    # The process is up and the event loop is responsive; says nothing about dependencies
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def readiness():
+    report = container.startup_report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@router.get("/startup")
+async def startup_report():
+    return container.startup_report()
+
+@router.get("/models")
+async def model_memory():
+    return model_registry.memory_report()
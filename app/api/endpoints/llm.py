@@ -1,19 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database.database import get_db
-from app.api.schemas import PromptRequest, LLMResponse
-from app.core.llm import llm_service
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.database import get_async_db
+from app.api.schemas import PromptRequest, LLMResponse, SessionResponse
+from app.core.container import container
 from app.core.prompt_service import PromptService
-from app.core.satirical_llm import satirical_llm_service
 from app.core.config import get_settings
+from app.core.response_cache import response_cache
+from app.core.embedding_service import embedding_service
+from app.core.toxicity import toxicity_scorer
+from app.core.context_packer import context_packer
+from app.core.llm_gateway import llm_gateway
+from app.core.metrics import stage
+from app.core.retrieval import RetrievalFilters, search_cache
+from app.core.admission import AdmissionRejected, AdmittedStreamingResponse, admission_controller
+from app.core.sessions import ConversationSession, session_store
 from typing import Optional
+import json
 import random
 
 router = APIRouter()
 settings = get_settings()
 
-def _handle_satirical_llm(query: str, context: Optional[str] = None):
-    response, articles = satirical_llm_service.generate_satirical_response(query, context)
+async def _handle_satirical_llm(query: str, context: Optional[str] = None, stream: bool = False, filters: Optional[RetrievalFilters] = None):
+    satirical_llm_service = await container.aget("satirical_llm_service")
+
+    if stream:
+        return _event_stream_response(
+            {"mode": "satirical", "prompt": query, "system_prompt_id": None},
+            satirical_llm_service.astream_satirical_response(query, context=context, filters=filters)
+        )
+
+    response, articles = await satirical_llm_service.agenerate_satirical_response(query, context=context, filters=filters)
 
     return LLMResponse(
         response=response,
@@ -23,27 +41,129 @@ def _handle_satirical_llm(query: str, context: Optional[str] = None):
         system_prompt_id=None
     )
 
-def _handle_llm(query: str, context: Optional[str] = None, db: Session = Depends(get_db)):
-    # Get a random system prompt
-    system_prompt = PromptService.get_favorite_prompt(db)
-    
-    # Use the system prompt in the query
-    response, articles = llm_service.query(
-        query,
-        system_prompt.prompt,
-        context
+async def _stream_first_response(query: str, prompt_ids: list, prompt_texts: list, context: Optional[str] = None, filters: Optional[RetrievalFilters] = None):
+    # One NDJSON line per response, in completion order. The first line is a full
+    # LLMResponse, the second only carries the second_* fields.
+    first = True
+    try:
+        llm_service = await container.aget("llm_service")
+        async for index, response, articles in llm_service.aquery_as_completed(query, prompt_texts, context, filters):
+            if first:
+                line = LLMResponse(
+                    response=response,
+                    mode="normal",
+                    prompt=query,
+                    articles=articles,
+                    system_prompt_id=prompt_ids[index]
+                ).model_dump()
+                first = False
+            else:
+                line = {
+                    "second_response": response,
+                    "second_system_prompt_id": prompt_ids[index]
+                }
+            yield json.dumps(line) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_events(meta, events):
+    # Server-Sent Events: meta, articles, token*, [retract, token*], done
+    # A callable meta is built with the first event, once a session turn has settled its system prompt
+    pending = callable(meta)
+    if not pending:
+        yield _sse("meta", meta)
+    try:
+        async for event, data in events:
+            if pending:
+                pending = False
+                yield _sse("meta", meta())
+            if event == "articles":
+                yield _sse(event, [article.model_dump() for article in data])
+            elif event == "token":
+                yield _sse(event, {"text": data})
+            elif event == "retract":
+                yield _sse(event, {"scores": data})
+            else:
+                yield _sse(event, {"response": data})
+    except Exception as e:
+        if pending:
+            yield _sse("meta", meta())
+        yield _sse("error", {"detail": str(e)})
+
+def _event_stream_response(meta, events) -> StreamingResponse:
+    return StreamingResponse(
+        _stream_events(meta, events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
+
+async def _handle_session(session: ConversationSession, query: str, db: AsyncSession, stream: bool = False, filters: Optional[RetrievalFilters] = None):
+    llm_service = await container.aget("llm_service")
+
+    # A session keeps the system prompt of its first turn; it is set under the session lock
+    system_prompt_id, system_prompt_text = session.system_prompt_id, session.system_prompt
+    if system_prompt_text is None:
+        with stage("prompt_select"):
+            system_prompt = await PromptService.get_favorite_prompt(db)
+        system_prompt_id, system_prompt_text = system_prompt.id, system_prompt.prompt
+
+    if stream:
+        return _event_stream_response(
+            lambda: {"mode": "normal", "prompt": query, "system_prompt_id": session.system_prompt_id, "session_id": session.id},
+            llm_service.astream_converse(session, query, system_prompt_text, filters, system_prompt_id=system_prompt_id)
+        )
+
+    response, articles = await llm_service.aconverse(session, query, system_prompt_text, filters, system_prompt_id=system_prompt_id)
+    return LLMResponse(
+        response=response,
+        mode="normal",
+        prompt=query,
+        articles=articles,
+        system_prompt_id=session.system_prompt_id,
+        session_id=session.id
+    )
+
+async def _handle_llm(query: str, db: AsyncSession, context: Optional[str] = None, stream_first: bool = False, stream: bool = False, filters: Optional[RetrievalFilters] = None):
+    llm_service = await container.aget("llm_service")
+
+    # Get the favorite system prompt
+    with stage("prompt_select"):
+        system_prompt = await PromptService.get_favorite_prompt(db)
+
+    if stream:
+        return _event_stream_response(
+            {"mode": "normal", "prompt": query, "system_prompt_id": system_prompt.id},
+            llm_service.astream_query(query, system_prompt.prompt, context, filters)
+        )
     
     # Check if we should return a second response
     if random.random() <= settings.MULTIPLE_PROMPT_PROB:
         # Get another random system prompt, excluding the first one
-        second_system_prompt = PromptService.get_random_prompt(db, [system_prompt.id])
-        
-        # Get second response
-        second_response, _ = llm_service.query(
+        with stage("prompt_select"):
+            second_system_prompt = await PromptService.get_random_prompt(db, [system_prompt.id])
+
+        if stream_first:
+            # Copy ids and texts out now: the DB session closes before the body streams
+            return StreamingResponse(
+                _stream_first_response(
+                    query,
+                    [system_prompt.id, second_system_prompt.id],
+                    [system_prompt.prompt, second_system_prompt.prompt],
+                    context,
+                    filters
+                ),
+                media_type="application/x-ndjson"
+            )
+
+        # Retrieve once and generate both responses concurrently
+        (response, second_response), articles = await llm_service.aquery_multi(
             query,
-            second_system_prompt.prompt,
-            context
+            [system_prompt.prompt, second_system_prompt.prompt],
+            context,
+            filters
         )
         
         return LLMResponse(
@@ -55,6 +175,14 @@ def _handle_llm(query: str, context: Optional[str] = None, db: Session = Depends
             second_response=second_response,
             second_system_prompt_id=second_system_prompt.id
         )
+
+    # Use the system prompt in the query
+    response, articles = await llm_service.aquery(
+        query,
+        system_prompt.prompt,
+        context,
+        filters
+    )
     
     return LLMResponse(
         response=response,
@@ -65,11 +193,107 @@ def _handle_llm(query: str, context: Optional[str] = None, db: Session = Depends
     )
 
 @router.post("/prompt", response_model=LLMResponse)
-async def prompt_llm(request: PromptRequest, db: Session = Depends(get_db)):
+async def prompt_llm(
+    request: PromptRequest,
+    db: AsyncSession = Depends(get_async_db),
+    x_request_timeout: Optional[float] = Header(None, description="Seconds the client will wait before giving up"),
+    x_priority: int = Header(0, description="Higher values are admitted first when queued")
+):
+    filters = RetrievalFilters.build(request.sources, request.published_after, request.published_before)
+    mode = "satirical" if request.mode == "satirical" else "normal"
+    session = None
+    if request.session_id:
+        _require_sessions()
+        if mode == "satirical":
+            raise HTTPException(status_code=400, detail="Sessions are only supported for normal prompts")
+        try:
+            session = session_store.get(request.session_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+
     try:
-        if request.mode == "satirical":
-            return _handle_satirical_llm(request.prompt, request.context)
+        ticket = await admission_controller.acquire(mode, x_priority, x_request_timeout)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
+    try:
+        if session is not None:
+            response = await _handle_session(session, request.prompt, db, request.stream, filters)
+        elif mode == "satirical":
+            response = await _handle_satirical_llm(request.prompt, request.context, request.stream, filters)
         else:
-            return _handle_llm(request.prompt, request.context, db)
+            response = await _handle_llm(request.prompt, db, request.context, request.stream_first, request.stream, filters)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        ticket.release()
+        raise HTTPException(status_code=500, detail=str(e))
+    except BaseException:
+        ticket.release()
+        raise
+
+    if isinstance(response, StreamingResponse):
+        # Streams keep generating after we return; hold the slot until they finish
+        return AdmittedStreamingResponse(response, ticket)
+    ticket.release()
+    return response
+
+def _require_sessions() -> None:
+    if not session_store.enabled:
+        raise HTTPException(status_code=501, detail="Sessions need a single worker process (SERVER_WORKERS=1)")
+
+@router.post("/sessions", response_model=SessionResponse)
+async def create_session():
+    _require_sessions()
+    return session_store.create().report()
+
+@router.get("/sessions")
+async def session_stats():
+    return session_store.stats()
+
+@router.get("/sessions/{session_id}", response_model=SessionResponse)
+async def get_session(session_id: str):
+    _require_sessions()
+    try:
+        return session_store.get(session_id).report()
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    _require_sessions()
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return {"message": "Session deleted", "session_id": session_id}
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
+
+@router.get("/embeddings/stats")
+async def embedding_stats():
+    return embedding_service.stats()
+
+@router.get("/toxicity/stats")
+async def toxicity_stats():
+    return toxicity_scorer.stats()
+
+@router.get("/context/stats")
+async def context_stats():
+    return context_packer.stats()
+
+@router.get("/gateway/stats")
+async def gateway_stats():
+    return llm_gateway.stats()
+
+@router.get("/admission/stats")
+async def admission_stats():
+    return admission_controller.stats()
+
+@router.get("/retrieval/stats")
+async def retrieval_stats():
+    return search_cache.stats()
+
+@router.post("/cache/invalidate")
+async def invalidate_cache(collection: Optional[str] = None):
+    await response_cache.invalidate(collection)
+    search_cache.clear(collection)
+    return {"message": "Cache invalidated", "collection": collection}
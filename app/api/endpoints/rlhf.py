@@ -1,6 +1,13 @@
 from app.core.config import get_settings
 from app.core.kafka_service import kafka_service, RLHFMessage
-from fastapi import APIRouter, HTTPException
+from app.core.prompt_service import PromptService
+from app.core.metrics import stage
+from app.database.database import get_async_db
+from app.api.schemas import FeedbackBatch, FeedbackBatchResponse, FeedbackItemStatus, PromptVote
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import defaultdict
 settings = get_settings()
 
 router = APIRouter()
@@ -8,7 +15,64 @@ router = APIRouter()
 @router.post("/reward")
 async def reward(message: RLHFMessage):
     try:
-        kafka_service.send_message(settings.KAFKA_TOPIC, message)
+        # Only appends to the local spool; delivery happens in the background
+        with stage("kafka_enqueue"):
+            kafka_service.send_message(settings.KAFKA_TOPIC, message)
         return {"message": "Reward sent"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/batch", response_model=FeedbackBatchResponse)
+async def feedback_batch(batch: FeedbackBatch, db: AsyncSession = Depends(get_async_db)):
+    """
+    Ingest many rewards and prompt votes in one request.
+
+    Each item is validated on its own and gets its own status. Votes are summed
+    per prompt and applied with one UPDATE per prompt in a single transaction;
+    rewards are handed to Kafka as one batch.
+    """
+    reward_statuses, rewards = [], []
+    for index, item in enumerate(batch.rewards):
+        try:
+            rewards.append(RLHFMessage.model_validate(item))
+            reward_statuses.append(FeedbackItemStatus(index=index, status="accepted"))
+        except ValidationError as e:
+            reward_statuses.append(FeedbackItemStatus(index=index, status="invalid", detail=str(e)))
+
+    vote_statuses, votes = [], []
+    totals = defaultdict(lambda: [0, 0])
+    for index, item in enumerate(batch.votes):
+        try:
+            vote = PromptVote.model_validate(item)
+        except ValidationError as e:
+            vote_statuses.append(FeedbackItemStatus(index=index, status="invalid", detail=str(e)))
+            continue
+        votes.append((index, vote))
+        vote_statuses.append(FeedbackItemStatus(index=index, status="accepted"))
+        totals[vote.prompt_id][0 if vote.vote == "like" else 1] += 1
+
+    if rewards:
+        try:
+            with stage("kafka_enqueue"):
+                kafka_service.send_batch(settings.KAFKA_TOPIC, rewards)
+        except Exception as e:
+            for status in reward_statuses:
+                if status.status == "accepted":
+                    status.status, status.detail = "error", str(e)
+
+    if votes:
+        try:
+            found = await PromptService.apply_votes(db, {prompt_id: tuple(counts) for prompt_id, counts in totals.items()})
+            for index, vote in votes:
+                if vote.prompt_id not in found:
+                    vote_statuses[index].status, vote_statuses[index].detail = "not_found", "Prompt not found"
+        except Exception as e:
+            await db.rollback()
+            for index, _ in votes:
+                vote_statuses[index].status, vote_statuses[index].detail = "error", str(e)
+
+    return FeedbackBatchResponse(rewards=reward_statuses, votes=vote_statuses)
+
+@router.get("/stats")
+async def producer_stats():
+    return kafka_service.metrics()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional
 from app.core.llm import ArticleMetadata
 from datetime import datetime
 
@@ -8,6 +8,16 @@ class PromptRequest(BaseModel):
     mode: str = "qa"  # Can be "qa" or "summarize"
     context: Optional[str] = None
     temperature: Optional[float] = 0.7
+    # When an A/B pair is sampled, stream each response as NDJSON as soon as it finishes
+    stream_first: bool = False
+    # Stream the answer as Server-Sent Events (articles, then tokens). A/B sampling is skipped.
+    stream: bool = False
+    # Optional retrieval filters on the article source and publication date
+    sources: Optional[List[str]] = None
+    published_after: Optional[datetime] = None
+    published_before: Optional[datetime] = None
+    # Continue a server-side conversation (POST /api/llm/sessions); `context` is then ignored
+    session_id: Optional[str] = None
 
 class LLMResponse(BaseModel):
     response: str
@@ -17,6 +27,19 @@ class LLMResponse(BaseModel):
     system_prompt_id: Optional[int] = None
     second_response: Optional[str] = None
     second_system_prompt_id: Optional[int] = None
+    session_id: Optional[str] = None
+
+class SessionResponse(BaseModel):
+    session_id: str
+    turns: int
+    retrievals: int
+    retrievals_reused: int
+    compactions: int
+    history_turns: int
+    history_tokens: int
+    summary: str
+    nodes: int
+    system_prompt_id: Optional[int] = None
 
 class QueryResponse(BaseModel):
     id: int
@@ -36,6 +59,7 @@ class SystemPromptCreate(SystemPromptBase):
 class SystemPromptResponse(SystemPromptBase):
     id: int
     likes: int
+    dislikes: Optional[int] = 0
     created_at: datetime
     last_used: Optional[datetime]
     used: int
@@ -46,4 +70,42 @@ class RLHFMessage(BaseModel):
     prompt: str
     response: str
     system_prompt: Optional[str] = None
-    reward: float
\ No newline at end of file
+    reward: float
+
+class PromptVote(BaseModel):
+    prompt_id: int
+    vote: Literal["like", "dislike"]
+
+class FeedbackBatch(BaseModel):
+    # Items are validated one by one so a bad item doesn't reject the batch
+    rewards: List[Dict[str, Any]] = []
+    votes: List[Dict[str, Any]] = []
+
+class FeedbackItemStatus(BaseModel):
+    index: int
+    status: Literal["accepted", "invalid", "not_found", "error"]
+    detail: Optional[str] = None
+
+class FeedbackBatchResponse(BaseModel):
+    rewards: List[FeedbackItemStatus]
+    votes: List[FeedbackItemStatus]
+
+class EvaluationRequest(BaseModel):
+    prompt_ids: List[int]
+    questions: List[str]
+    # Questions evaluated at once; defaults to EVALUATION_CONCURRENCY
+    concurrency: Optional[int] = None
+    # Also send every answer to the RLHF Kafka topic
+    publish: bool = False
+
+class EvaluationJobResponse(BaseModel):
+    job_id: str
+    status: str
+    prompt_ids: List[int]
+    questions: int
+    completed: int
+    failed: int
+    publish: bool
+    created_at: float
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.responses import StreamingResponse
+from app.core.config import get_settings
+from app.core.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, ADMISSION_WAIT
+
+settings = get_settings()
+
+
+class AdmissionRejected(Exception):
+    """The request was not admitted; maps to an HTTP error with Retry-After."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A held slot. Releasing it more than once is a no-op."""
+
+    def __init__(self, controller: "AdmissionController", mode: str):
+        self._controller = controller
+        self.mode = mode
+        self.admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+
+class _ModeState:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.queue: List[Tuple[int, float, int, float, asyncio.Future]] = []
+        self.service_seconds = 1.0  # EWMA of how long a slot is held
+        self.stats = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_deadline": 0}
+
+    def waiting(self) -> int:
+        return sum(1 for *_, future in self.queue if not future.done())
+
+
+class AdmissionController:
+    """
+    Admission control in front of the LLM services.
+
+    Each mode ("normal", "satirical") runs at most its configured number of
+    requests at once. Further requests wait in a bounded priority queue, with
+    higher `priority` first and the earliest deadline first within a priority.
+    A request is rejected straight away with 429 when its mode's queue is full.
+    It is rejected with 503 when its deadline has passed, or when the expected
+    wait already exceeds it, instead of waiting for work the client will
+    abandon. Both responses carry a Retry-After estimated from the queue length
+    and the observed time a slot is held.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None, max_queue: Optional[int] = None):
+        limits = limits or {
+            "normal": settings.ADMISSION_NORMAL_CONCURRENCY,
+            "satirical": settings.ADMISSION_SATIRICAL_CONCURRENCY,
+        }
+        self.max_queue = max_queue if max_queue is not None else settings.ADMISSION_MAX_QUEUE
+        self._modes = {mode: _ModeState(limit) for mode, limit in limits.items()}
+        self._sequence = itertools.count()
+
+    def _retry_after(self, state: _ModeState) -> int:
+        return max(1, math.ceil((state.waiting() + 1) * state.service_seconds / state.limit))
+
+    def _reject(self, mode: str, state: _ModeState, status_code: int, reason: str) -> AdmissionRejected:
+        state.stats["rejected_full" if status_code == 429 else "rejected_deadline"] += 1
+        ADMISSION_REJECTED.labels(mode, reason).inc()
+        return AdmissionRejected(status_code, reason, self._retry_after(state))
+
+    async def acquire(self, mode: str, priority: int = 0, timeout: Optional[float] = None) -> Ticket:
+        """
+        Wait for a slot in `mode`.
+
+        Args:
+            mode (str): "normal" or "satirical"
+            priority (int): Higher is served first
+            timeout (float, optional): Seconds the client is prepared to wait; defaults to ADMISSION_QUEUE_TIMEOUT
+
+        Returns:
+            Ticket: The held slot; release it when the response is complete
+
+        Raises:
+            AdmissionRejected: 429 when the queue is full, 503 when the deadline cannot be met
+        """
+        state = self._modes[mode]
+        started = time.monotonic()
+        timeout = settings.ADMISSION_QUEUE_TIMEOUT if timeout is None else timeout
+        deadline = started + timeout
+
+        if timeout <= 0:
+            raise self._reject(mode, state, 503, "deadline")
+        if state.active < state.limit and not state.waiting():
+            return self._admit(mode, state, started)
+        if state.waiting() >= self.max_queue:
+            raise self._reject(mode, state, 429, "queue_full")
+        # Expected wait: everyone ahead of us plus ourselves, spread over the slots
+        if state.waiting() * state.service_seconds / state.limit > timeout:
+            raise self._reject(mode, state, 503, "deadline")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(state.queue, (-priority, deadline, next(self._sequence), started, future))
+        state.stats["queued"] += 1
+        ADMISSION_QUEUE_DEPTH.labels(mode).set(state.waiting())
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # A slot handed over just as the wait timed out would otherwise never be released
+            self._give_back(future)
+            raise self._reject(mode, state, 503, "deadline")
+        except asyncio.CancelledError:
+            # The client went away after we were handed a slot; give it back
+            self._give_back(future)
+            raise
+        finally:
+            ADMISSION_QUEUE_DEPTH.labels(mode).set(state.waiting())
+
+    @staticmethod
+    def _give_back(future: asyncio.Future) -> None:
+        if future.done() and not future.cancelled() and future.exception() is None:
+            future.result().release()
+
+    def _admit(self, mode: str, state: _ModeState, enqueued_at: float) -> Ticket:
+        state.active += 1
+        state.stats["admitted"] += 1
+        ADMISSION_ACTIVE.labels(mode).set(state.active)
+        ADMISSION_WAIT.labels(mode).observe(time.monotonic() - enqueued_at)
+        return Ticket(self, mode)
+
+    def _release(self, ticket: Ticket) -> None:
+        state = self._modes[ticket.mode]
+        state.active -= 1
+        state.service_seconds = 0.8 * state.service_seconds + 0.2 * (time.monotonic() - ticket.admitted_at)
+        ADMISSION_ACTIVE.labels(ticket.mode).set(state.active)
+        self._dispatch(ticket.mode, state)
+
+    def _dispatch(self, mode: str, state: _ModeState) -> None:
+        now = time.monotonic()
+        while state.active < state.limit and state.queue:
+            _, deadline, _, enqueued_at, future = heapq.heappop(state.queue)
+            if future.done():
+                continue  # Timed out or cancelled while queued
+            if deadline <= now:
+                future.set_exception(self._reject(mode, state, 503, "deadline"))
+                continue
+            future.set_result(self._admit(mode, state, enqueued_at))
+        ADMISSION_QUEUE_DEPTH.labels(mode).set(state.waiting())
+
+    def divide(self, workers: int) -> None:
+        """Keep this process to its share of limits set for all `workers` together; call before serving."""
+        for state in self._modes.values():
+            state.limit = max(1, state.limit // workers)
+        self.max_queue = max(1, self.max_queue // workers)
+
+    def busy(self) -> bool:
+        """True while any mode has every slot taken, i.e. interactive traffic is queueing."""
+        return any(state.waiting() or state.active >= state.limit for state in self._modes.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            mode: {
+                **state.stats,
+                "active": state.active,
+                "limit": state.limit,
+                "waiting": state.waiting(),
+                "avg_service_seconds": round(state.service_seconds, 3),
+            }
+            for mode, state in self._modes.items()
+        }
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """A streaming response that keeps its admission slot until the body is sent or the client disconnects."""
+
+    def __init__(self, response: StreamingResponse, ticket: Ticket):
+        self.__dict__.update(response.__dict__)
+        self._ticket = ticket
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._ticket.release()
+
+
+admission_controller = AdmissionController()
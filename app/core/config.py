@@ -7,12 +7,104 @@ load_dotenv()
 
 class Settings(BaseSettings):
     QDRANT_URL: str = os.getenv("QDRANT_URL", "")
+    QDRANT_PREFER_GRPC: bool = os.getenv("QDRANT_PREFER_GRPC", True)
+    QDRANT_GRPC_PORT: int = os.getenv("QDRANT_GRPC_PORT", 6334)
+    QDRANT_GRPC_POOL_SIZE: int = os.getenv("QDRANT_GRPC_POOL_SIZE", 4)
+    QDRANT_TIMEOUT: int = os.getenv("QDRANT_TIMEOUT", 10)
+    QDRANT_HNSW_EF: int = os.getenv("QDRANT_HNSW_EF", 0)
+    QDRANT_EXACT: bool = os.getenv("QDRANT_EXACT", False)
+    QDRANT_QUANTIZATION_RESCORE: bool = os.getenv("QDRANT_QUANTIZATION_RESCORE", True)
+    QDRANT_QUANTIZATION_OVERSAMPLING: float = os.getenv("QDRANT_QUANTIZATION_OVERSAMPLING", 0)
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "BAAI/bge-large-en-v1.5")
     OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "mistral")
+    OLLAMA_URL: str = os.getenv("OLLAMA_URL", "http://localhost:11434")
+    OLLAMA_HOSTS: str = os.getenv("OLLAMA_HOSTS", "")  # Comma separated; defaults to OLLAMA_URL
+    OLLAMA_PARALLEL: int = os.getenv("OLLAMA_PARALLEL", 4)
+    OLLAMA_KEEP_ALIVE: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    OLLAMA_KEEPALIVE_INTERVAL: float = os.getenv("OLLAMA_KEEPALIVE_INTERVAL", 240)
+    OLLAMA_REQUEST_TIMEOUT: float = os.getenv("OLLAMA_REQUEST_TIMEOUT", 120)
+    OLLAMA_HOST_COOLDOWN: float = os.getenv("OLLAMA_HOST_COOLDOWN", 10)
+    LLM_COALESCE: bool = os.getenv("LLM_COALESCE", True)
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
+    DB_POOL_SIZE: int = os.getenv("DB_POOL_SIZE", 5)
+    DB_MAX_OVERFLOW: int = os.getenv("DB_MAX_OVERFLOW", 10)
+    DB_POOL_TIMEOUT: float = os.getenv("DB_POOL_TIMEOUT", 30)
+    DB_POOL_RECYCLE: int = os.getenv("DB_POOL_RECYCLE", 1800)
     MULTIPLE_PROMPT_PROB: float = os.getenv("MULTIPLE_PROMPT_PROB", 0.3)
     KAFKA_BROKER: str = os.getenv("KAFKA_BROKER", "localhost:9092")
     KAFKA_TOPIC: str = os.getenv("KAFKA_TOPIC", "rlhf")
+    KAFKA_LINGER_MS: int = os.getenv("KAFKA_LINGER_MS", 50)
+    KAFKA_BATCH_SIZE: int = os.getenv("KAFKA_BATCH_SIZE", 65536)
+    KAFKA_COMPRESSION: str = os.getenv("KAFKA_COMPRESSION", "gzip")
+    KAFKA_MAX_BLOCK_MS: int = os.getenv("KAFKA_MAX_BLOCK_MS", 1000)
+    KAFKA_SPOOL_SIZE: int = os.getenv("KAFKA_SPOOL_SIZE", 10000)
+    KAFKA_MAX_ATTEMPTS: int = os.getenv("KAFKA_MAX_ATTEMPTS", 5)
+    KAFKA_RETRY_BACKOFF_SECONDS: float = os.getenv("KAFKA_RETRY_BACKOFF_SECONDS", 2)
+    DETOXIFY_MODEL: str = os.getenv("DETOXIFY_MODEL", "original")  # or a lighter "original-small"
+    TOXICITY_BACKEND: str = os.getenv("TOXICITY_BACKEND", "torch")  # "torch" or "onnx"
+    TOXICITY_QUANTIZE: bool = os.getenv("TOXICITY_QUANTIZE", False)
+    TOXICITY_ONNX_PATH: str = os.getenv("TOXICITY_ONNX_PATH", "./models/detoxify.onnx")
+    TOXICITY_POOL: str = os.getenv("TOXICITY_POOL", "thread")  # "thread" or "process"
+    TOXICITY_WORKERS: int = os.getenv("TOXICITY_WORKERS", 2)
+    TOXICITY_BATCH_MAX_SIZE: int = os.getenv("TOXICITY_BATCH_MAX_SIZE", 16)
+    TOXICITY_BATCH_WAIT_MS: float = os.getenv("TOXICITY_BATCH_WAIT_MS", 5)
+    TOXICITY_CACHE_SIZE: int = os.getenv("TOXICITY_CACHE_SIZE", 4096)
+    STARTUP_WARMUP: str = os.getenv("STARTUP_WARMUP", "background")  # "background", "eager" or "lazy"
+    METRICS_TIMING_HEADER: bool = os.getenv("METRICS_TIMING_HEADER", False)
+    CPU_EXECUTOR_WORKERS: int = os.getenv("CPU_EXECUTOR_WORKERS", 4)
+    CPU_EXECUTOR_MAX_PENDING: int = os.getenv("CPU_EXECUTOR_MAX_PENDING", 64)
+    PROMPT_SAMPLING_STRATEGY: str = os.getenv("PROMPT_SAMPLING_STRATEGY", "uniform")  # "uniform", "weighted" or "thompson"
+    PROMPT_SAMPLER_REFRESH_SECONDS: float = os.getenv("PROMPT_SAMPLER_REFRESH_SECONDS", 30)
+    PROMPT_SAMPLER_FULL_REFRESH_SECONDS: float = os.getenv("PROMPT_SAMPLER_FULL_REFRESH_SECONDS", 300)
+    COUNTER_FLUSH_INTERVAL: float = os.getenv("COUNTER_FLUSH_INTERVAL", 5)
+    EMBED_CACHE_SIZE: int = os.getenv("EMBED_CACHE_SIZE", 4096)
+    EMBED_BATCH_MAX_SIZE: int = os.getenv("EMBED_BATCH_MAX_SIZE", 32)
+    EMBED_BATCH_WAIT_MS: float = os.getenv("EMBED_BATCH_WAIT_MS", 5)
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", True)
+    SEMANTIC_CACHE_BACKEND: str = os.getenv("SEMANTIC_CACHE_BACKEND", "memory")  # "memory" or "redis"
+    SEMANTIC_CACHE_REDIS_URL: str = os.getenv("SEMANTIC_CACHE_REDIS_URL", "redis://localhost:6379/0")
+    SEMANTIC_CACHE_THRESHOLD: float = os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95)
+    SEMANTIC_CACHE_MAX_ENTRIES: int = os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 2048)
+    SEMANTIC_CACHE_TTL: float = os.getenv("SEMANTIC_CACHE_TTL", 3600)
+    SEMANTIC_CACHE_CHECK_INTERVAL: float = os.getenv("SEMANTIC_CACHE_CHECK_INTERVAL", 30)
+    RETRIEVAL_COLLECTIONS: str = os.getenv("RETRIEVAL_COLLECTIONS", "articles")  # Comma separated
+    SATIRICAL_RETRIEVAL_COLLECTIONS: str = os.getenv("SATIRICAL_RETRIEVAL_COLLECTIONS", "satirical_articles")
+    RETRIEVAL_HYBRID: bool = os.getenv("RETRIEVAL_HYBRID", True)
+    RETRIEVAL_CANDIDATE_MULTIPLIER: int = os.getenv("RETRIEVAL_CANDIDATE_MULTIPLIER", 4)
+    RETRIEVAL_RRF_K: int = os.getenv("RETRIEVAL_RRF_K", 60)
+    RETRIEVAL_MAX_CHUNKS_PER_ARTICLE: int = os.getenv("RETRIEVAL_MAX_CHUNKS_PER_ARTICLE", 1)
+    RETRIEVAL_SOURCE_FIELD: str = os.getenv("RETRIEVAL_SOURCE_FIELD", "source")
+    RETRIEVAL_DATE_FIELD: str = os.getenv("RETRIEVAL_DATE_FIELD", "published_at")
+    RETRIEVAL_PAYLOAD_FIELDS: str = os.getenv("RETRIEVAL_PAYLOAD_FIELDS", "content,title,url")  # Comma separated
+    RETRIEVAL_VECTOR_NAME: str = os.getenv("RETRIEVAL_VECTOR_NAME", "")
+    RETRIEVAL_CACHE_TTL: float = os.getenv("RETRIEVAL_CACHE_TTL", 30)
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", 512)
+    CONTEXT_TOKEN_BUDGET: int = os.getenv("CONTEXT_TOKEN_BUDGET", 1536)
+    CONTEXT_OUTPUT_RESERVE: int = os.getenv("CONTEXT_OUTPUT_RESERVE", 512)
+    CONTEXT_DEDUPE_THRESHOLD: float = os.getenv("CONTEXT_DEDUPE_THRESHOLD", 0.8)
+    SESSION_HISTORY_TOKENS: int = os.getenv("SESSION_HISTORY_TOKENS", 1024)
+    SESSION_SUMMARY_TOKENS: int = os.getenv("SESSION_SUMMARY_TOKENS", 256)
+    SESSION_MAX_NODES: int = os.getenv("SESSION_MAX_NODES", 10)
+    SESSION_REUSE_THRESHOLD: float = os.getenv("SESSION_REUSE_THRESHOLD", 0.92)
+    SESSION_IDLE_TTL: float = os.getenv("SESSION_IDLE_TTL", 1800)
+    SESSION_MAX_COUNT: int = os.getenv("SESSION_MAX_COUNT", 1000)
+    INGEST_CHUNK_TOKENS: int = os.getenv("INGEST_CHUNK_TOKENS", 256)
+    INGEST_CHUNK_OVERLAP: int = os.getenv("INGEST_CHUNK_OVERLAP", 32)
+    INGEST_EMBED_BATCH_SIZE: int = os.getenv("INGEST_EMBED_BATCH_SIZE", 128)
+    INGEST_UPSERT_BATCH_SIZE: int = os.getenv("INGEST_UPSERT_BATCH_SIZE", 256)
+    INGEST_UPSERT_WORKERS: int = os.getenv("INGEST_UPSERT_WORKERS", 4)
+    INGEST_STATE_DIR: str = os.getenv("INGEST_STATE_DIR", ".ingest_state")
+    ADMISSION_NORMAL_CONCURRENCY: int = os.getenv("ADMISSION_NORMAL_CONCURRENCY", 8)
+    ADMISSION_SATIRICAL_CONCURRENCY: int = os.getenv("ADMISSION_SATIRICAL_CONCURRENCY", 4)
+    ADMISSION_MAX_QUEUE: int = os.getenv("ADMISSION_MAX_QUEUE", 64)
+    ADMISSION_QUEUE_TIMEOUT: float = os.getenv("ADMISSION_QUEUE_TIMEOUT", 30)
+    EVALUATION_DIR: str = os.getenv("EVALUATION_DIR", ".evaluations")
+    EVALUATION_CONCURRENCY: int = os.getenv("EVALUATION_CONCURRENCY", 4)
+    SERVER_HOST: str = os.getenv("SERVER_HOST", "0.0.0.0")
+    SERVER_PORT: int = os.getenv("SERVER_PORT", 8000)
+    SERVER_WORKERS: int = os.getenv("SERVER_WORKERS", 1)
+    SERVER_RELOAD: bool = os.getenv("SERVER_RELOAD", False)
+    PREFORK_MODELS: str = os.getenv("PREFORK_MODELS", "embed_model,detoxifier")  # Comma separated
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """
+    Lifespan-managed owner of the services behind the API.
+
+    Nothing is built at import. Components are built on first use (`aget`) or
+    warmed up from the application lifespan, either before the app starts
+    accepting traffic (`eager`) or in the background (`background`). In `lazy`
+    mode only the components marked `warm` are built up front. Components
+    marked `blocking` (the schema) are built before the app accepts traffic in
+    every mode, since requests cannot do without them.
+
+    The process is ready once every component in its warm-up set has been built;
+    liveness does not depend on any of them. Each component's build time and any
+    failure are kept for the startup report.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._always_warm: List[str] = []
+        self._blocking: List[str] = []
+        self._instances: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._report: Dict[str, Dict[str, Any]] = {}
+        self._warm_set: List[str] = []
+        self._warm_task: Optional[asyncio.Task] = None
+        self._started_at: Optional[float] = None
+        self._warmed_at: Optional[float] = None
+
+    def register(self, name: str, factory: Callable[[], Any], warm: bool = False, blocking: bool = False) -> None:
+        """
+        Register a component factory.
+
+        Args:
+            name (str): Component name
+            factory (Callable[[], Any]): Builds the component; may block
+            warm (bool): Build it at startup even in lazy mode
+            blocking (bool): Build it before startup finishes in every mode; failures abort startup
+        """
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+        self._report[name] = {"status": "pending"}
+        if warm or blocking:
+            self._always_warm.append(name)
+        if blocking:
+            self._blocking.append(name)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in self._factories:
+            raise KeyError(f"Unknown service: {name}")
+
+        with self._locks[name]:
+            # Another thread may have finished building while we waited
+            if name in self._instances:
+                return self._instances[name]
+
+            self._report[name] = {"status": "loading"}
+            started = time.perf_counter()
+            try:
+                instance = self._factories[name]()
+            except Exception as e:
+                self._report[name] = {
+                    "status": "failed",
+                    "seconds": round(time.perf_counter() - started, 3),
+                    "error": str(e),
+                }
+                raise
+            self._report[name] = {"status": "ready", "seconds": round(time.perf_counter() - started, 3)}
+            self._instances[name] = instance
+            return instance
+
+    async def aget(self, name: str) -> Any:
+        """Return a component, building it off the event loop on first use."""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        return await asyncio.to_thread(self.get, name)
+
+    async def warm_up(self, names: Optional[Iterable[str]] = None) -> None:
+        """Build components concurrently in worker threads. Failures are recorded, not raised."""
+        names = list(names or self._factories)
+
+        async def build(name: str):
+            try:
+                await self.aget(name)
+            except Exception as e:
+                logger.error("Failed to start %s: %s", name, e)
+
+        await asyncio.gather(*(build(name) for name in names))
+        self._warmed_at = time.monotonic()
+        logger.info("Warm-up finished in %.2fs", self._warmed_at - self._started_at)
+
+    async def start(self, mode: Optional[str] = None) -> None:
+        """
+        Warm up according to STARTUP_WARMUP.
+
+        Args:
+            mode (str, optional): "eager", "background" or "lazy"; defaults to the setting
+        """
+        mode = mode or settings.STARTUP_WARMUP
+        self._started_at = time.monotonic()
+        self._warmed_at = None
+        self._warm_set = list(self._factories) if mode in ("eager", "background") else list(self._always_warm)
+        for name in self._blocking:
+            await self.aget(name)
+        if mode == "eager":
+            await self.warm_up(self._warm_set)
+        else:
+            self._warm_task = asyncio.create_task(self.warm_up(self._warm_set))
+
+    async def stop(self) -> None:
+        if self._warm_task is not None and not self._warm_task.done():
+            self._warm_task.cancel()
+            try:
+                await self._warm_task
+            except asyncio.CancelledError:
+                pass
+        self._warm_task = None
+
+    def is_ready(self) -> bool:
+        return self._started_at is not None and all(name in self._instances for name in self._warm_set)
+
+    def startup_report(self) -> Dict[str, Any]:
+        """
+        Report how far startup has got.
+
+        Returns:
+            Dict[str, Any]: Readiness, total warm-up time and per-component status and build time.
+        """
+        return {
+            "ready": self.is_ready(),
+            "warm_up_seconds": (
+                round(self._warmed_at - self._started_at, 3)
+                if self._warmed_at is not None and self._started_at is not None else None
+            ),
+            "components": {
+                name: {**report, "warm": name in self._warm_set}
+                for name, report in self._report.items()
+            },
+        }
+
+
+# Columns added to existing tables after their first release: (table, column, DDL type)
+_ADDED_COLUMNS = [
+    ("SystemPrompts", "dislikes", "INTEGER DEFAULT 0"),
+]
+
+
+def _create_tables():
+    from sqlalchemy import inspect, text
+    from app.database.database import engine
+    from app.models.models import Base
+    Base.metadata.create_all(bind=engine)
+    # create_all leaves existing tables alone; add the newer columns they lack
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        # PostgreSQL also tolerates another process adding the column first; SQLite lacks IF NOT EXISTS here
+        if_not_exists = "IF NOT EXISTS " if conn.dialect.name == "postgresql" else ""
+        for table, column, ddl in _ADDED_COLUMNS:
+            if column not in {existing["name"] for existing in inspector.get_columns(table)}:
+                conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {if_not_exists}{column} {ddl}'))
+                logger.info("Added column %s.%s", table, column)
+    return engine
+
+
+def _load_model(name: str) -> Callable[[], Any]:
+    def load():
+        from app.core.model_registry import model_registry
+        return model_registry.get(name)
+    return load
+
+
+def _load_tokenizer():
+    # tiktoken may download and parse its BPE file; keep that off the request path
+    from app.core.context_packer import load_tokenizer
+    return load_tokenizer()
+
+
+def _build_llm_service():
+    from app.core.llm import LLMService
+    return LLMService()
+
+
+def _build_satirical_llm_service():
+    from app.core.satirical_llm import SatiricalLLMService
+    return SatiricalLLMService()
+
+
+container = ServiceContainer()
+container.register("database", _create_tables, blocking=True)
+container.register("tokenizer", _load_tokenizer, warm=True)
+container.register("embed_model", _load_model("embed_model"))
+container.register("detoxifier", _load_model("detoxifier"))
+container.register("llm_service", _build_llm_service)
+container.register("satirical_llm_service", _build_satirical_llm_service)
@@ -0,0 +1,227 @@
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from llama_index.core.llms import LLM, ChatMessage
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from app.core.config import get_settings
+from app.core.metrics import PROMPT_TOKENS, stage
+from app.core.retrieval import bm25_scores
+from app.core.streaming import SENTENCE_END, conversation_messages, qa_messages
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=1)
+def _tokenizer() -> Optional[Callable[[str], List[Any]]]:
+    try:
+        from llama_index.core.utils import get_tokenizer
+        tokenizer = get_tokenizer()
+        tokenizer("probe")
+        return tokenizer
+    except Exception as e:
+        # tiktoken downloads its BPE file on first use; without it fall back to an estimate
+        logger.warning("Tokenizer unavailable, estimating 4 characters per token: %s", e)
+        return None
+
+
+def load_tokenizer() -> bool:
+    """Load the tokenizer ahead of the first `count_tokens`; False when token counts will be estimated."""
+    return _tokenizer() is not None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    tokenizer = _tokenizer()
+    return len(tokenizer(text)) if tokenizer else max(1, len(text) // 4)
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = _WORD.findall(text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _jaccard(a: Set, b: Set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+@dataclass
+class ContextUsage:
+    """Token accounting for one assembled prompt."""
+
+    system_tokens: int
+    query_tokens: int
+    context_tokens: int
+    prompt_tokens: int
+    source_tokens: int
+    nodes_in: int
+    nodes_used: int
+    duplicates_dropped: int
+    history_tokens: int = 0
+
+
+@dataclass
+class _Passage:
+    node_rank: int
+    position: int
+    text: str
+    tokens: int
+    score: float = 0.0
+
+
+class ContextPacker:
+    """
+    Assemble the synthesis prompt within a token budget.
+
+    Retrieved chunks that are near duplicates of a better ranked chunk (word
+    3-gram Jaccard >= CONTEXT_DEDUPE_THRESHOLD) are dropped, the rest are split
+    into sentences and sentences repeated verbatim are dropped. Sentences are
+    scored by BM25 against the query, the rank of their chunk and whether they
+    lead the chunk, and picked greedily until CONTEXT_TOKEN_BUDGET is used (or
+    less, if the model's context window minus system prompt, query and
+    CONTEXT_OUTPUT_RESERVE is smaller). The chosen sentences are emitted in
+    their original order under their article title, so the whole prompt goes to
+    the LLM in a single call instead of compact-and-refine passes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"prompts": 0, "source_tokens": 0, "context_tokens": 0, "prompt_tokens": 0, "duplicates_dropped": 0}
+
+    def build_messages(self, llm: LLM, query: str, nodes: List[NodeWithScore], system_prompt: Optional[str] = None, mode: str = "normal", history: Sequence[ChatMessage] = (), summary: Optional[str] = None) -> Tuple[List[ChatMessage], ContextUsage]:
+        """
+        Build the chat messages for answering `query` from `nodes`.
+
+        Args:
+            llm (LLM): The model the prompt is for; its context window caps the budget
+            query (str): The question as sent to the model
+            nodes (List[NodeWithScore]): Retrieved nodes, best first
+            system_prompt (str, optional): Instructions placed in the system message
+            mode (str): Label for the token metrics
+            history (Sequence[ChatMessage]): Earlier turns of a conversation, oldest first
+            summary (str, optional): Summary of the turns no longer in `history`
+
+        Returns:
+            Tuple[List[ChatMessage], ContextUsage]: The messages and their token counts
+        """
+        with stage("context_pack"):
+            system_tokens = count_tokens(system_prompt or "") + count_tokens(summary or "")
+            query_tokens = count_tokens(query)
+            history_tokens = sum(count_tokens(message.content or "") for message in history)
+            window = getattr(llm.metadata, "context_window", None) or settings.CONTEXT_TOKEN_BUDGET
+            budget = min(
+                settings.CONTEXT_TOKEN_BUDGET,
+                window - system_tokens - query_tokens - history_tokens - settings.CONTEXT_OUTPUT_RESERVE,
+            )
+            context_str, source_tokens, nodes_used, duplicates = self._pack(query, nodes, max(budget, 0))
+            if history or summary:
+                messages = conversation_messages(llm, context_str, query, history, system_prompt, summary)
+            else:
+                messages = qa_messages(llm, context_str, query, system_prompt)
+
+        usage = ContextUsage(
+            system_tokens=system_tokens,
+            query_tokens=query_tokens,
+            context_tokens=count_tokens(context_str),
+            prompt_tokens=sum(count_tokens(message.content or "") for message in messages),
+            source_tokens=source_tokens,
+            nodes_in=len(nodes),
+            nodes_used=nodes_used,
+            duplicates_dropped=duplicates,
+            history_tokens=history_tokens,
+        )
+        self._record(mode, usage)
+        return messages, usage
+
+    def _pack(self, query: str, nodes: List[NodeWithScore], budget: int) -> Tuple[str, int, int, int]:
+        kept: List[Tuple[int, NodeWithScore]] = []
+        kept_shingles: List[Set] = []
+        duplicates = 0
+        source_tokens = 0
+        for rank, node in enumerate(nodes):
+            # What the node would cost unpacked: its text plus the metadata the LLM sees
+            source_tokens += count_tokens(node.node.get_content(metadata_mode=MetadataMode.LLM))
+            shingles = _shingles(node.node.get_content())
+            if any(_jaccard(shingles, other) >= settings.CONTEXT_DEDUPE_THRESHOLD for other in kept_shingles):
+                duplicates += 1
+                continue
+            kept.append((rank, node))
+            kept_shingles.append(shingles)
+
+        passages: List[_Passage] = []
+        seen: Set[str] = set()
+        for rank, node in kept:
+            for position, sentence in enumerate(SENTENCE_END.split(node.node.get_content().strip())):
+                key = " ".join(_WORD.findall(sentence.lower()))
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                passages.append(_Passage(rank, position, sentence.strip(), count_tokens(sentence)))
+
+        if not passages:
+            return "", source_tokens, 0, duplicates
+
+        relevance = bm25_scores(query, [passage.text for passage in passages])
+        top = max(relevance) or 1.0
+        for passage, score in zip(passages, relevance):
+            passage.score = score / top + 0.5 / (1 + passage.node_rank) + (0.1 if passage.position == 0 else 0.0)
+
+        headers = {rank: self._header(node) for rank, node in kept}
+        header_tokens = {rank: count_tokens(header) for rank, header in headers.items()}
+
+        selected: List[_Passage] = []
+        used = 0
+        opened: Set[int] = set()
+        for passage in sorted(passages, key=lambda p: p.score, reverse=True):
+            # The first passage taken from a chunk also pays for its title line
+            cost = passage.tokens + (0 if passage.node_rank in opened else header_tokens[passage.node_rank])
+            if used + cost <= budget:
+                selected.append(passage)
+                opened.add(passage.node_rank)
+                used += cost
+
+        by_node: Dict[int, List[_Passage]] = {}
+        for passage in sorted(selected, key=lambda p: (p.node_rank, p.position)):
+            by_node.setdefault(passage.node_rank, []).append(passage)
+
+        sections = [
+            headers[rank] + " ".join(passage.text for passage in node_passages)
+            for rank, node_passages in by_node.items()
+        ]
+        return "\n\n".join(sections), source_tokens, len(by_node), duplicates
+
+    @staticmethod
+    def _header(node: NodeWithScore) -> str:
+        title = node.node.metadata.get("title")
+        return f"[{title}]\n" if title else ""
+
+    def _record(self, mode: str, usage: ContextUsage) -> None:
+        for part in ("system", "query", "history", "context", "prompt", "source"):
+            PROMPT_TOKENS.labels(mode, part).observe(getattr(usage, f"{part}_tokens"))
+        with self._lock:
+            self._stats["prompts"] += 1
+            for key in ("source_tokens", "context_tokens", "prompt_tokens", "duplicates_dropped"):
+                self._stats[key] += getattr(usage, key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            prompts = self._stats["prompts"]
+            return {
+                **self._stats,
+                "budget": settings.CONTEXT_TOKEN_BUDGET,
+                "avg_prompt_tokens": round(self._stats["prompt_tokens"] / prompts, 1) if prompts else 0.0,
+                "context_reduction": (
+                    round(1 - self._stats["context_tokens"] / self._stats["source_tokens"], 4)
+                    if self._stats["source_tokens"] else 0.0
+                ),
+            }
+
+
+context_packer = ContextPacker()
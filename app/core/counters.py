@@ -0,0 +1,132 @@
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core.config import get_settings
+from app.database.database import SessionLocal
+from app.models.models import SystemPrompt
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingCounts:
+    used: int = 0
+    likes: int = 0
+    dislikes: int = 0
+    last_used: Optional[datetime] = None
+
+    def merge(self, other: "PendingCounts") -> None:
+        self.used += other.used
+        self.likes += other.likes
+        self.dislikes += other.dislikes
+        if other.last_used and (self.last_used is None or other.last_used > self.last_used):
+            self.last_used = other.last_used
+
+
+class CounterAggregator:
+    """
+    Write-behind counters for SystemPrompt usage and votes.
+
+    Increments are accumulated in memory and flushed every COUNTER_FLUSH_INTERVAL
+    seconds as one atomic `SET used = used + :n, ...` UPDATE per touched prompt,
+    so the request path never commits and concurrent votes are never lost.
+    `stop()` flushes whatever is left on shutdown.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, interval: float = settings.COUNTER_FLUSH_INTERVAL):
+        self._session_factory = session_factory
+        self.interval = interval
+        self._pending: Dict[int, PendingCounts] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record_use(self, prompt_id: int) -> None:
+        self._add(prompt_id, PendingCounts(used=1, last_used=datetime.now()))
+
+    def record_vote(self, prompt_id: int, likes: int = 0, dislikes: int = 0) -> None:
+        self._add(prompt_id, PendingCounts(likes=likes, dislikes=dislikes))
+
+    def _add(self, prompt_id: int, counts: PendingCounts) -> None:
+        with self._lock:
+            self._pending.setdefault(prompt_id, PendingCounts()).merge(counts)
+
+    def pending(self, prompt_id: int) -> PendingCounts:
+        with self._lock:
+            counts = PendingCounts()
+            if prompt_id in self._pending:
+                counts.merge(self._pending[prompt_id])
+            return counts
+
+    def overlay(self, db: AsyncSession, prompt: SystemPrompt) -> SystemPrompt:
+        """Detach a loaded row and add the not yet flushed increments to it."""
+        db.expunge(prompt)
+        counts = self.pending(prompt.id)
+        prompt.used = (prompt.used or 0) + counts.used
+        prompt.likes = (prompt.likes or 0) + counts.likes
+        prompt.dislikes = (prompt.dislikes or 0) + counts.dislikes
+        if counts.last_used:
+            prompt.last_used = counts.last_used
+        return prompt
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        db = self._session_factory()
+        try:
+            for prompt_id, counts in batch.items():
+                values = {}
+                if counts.used:
+                    values[SystemPrompt.used] = SystemPrompt.used + counts.used
+                if counts.likes:
+                    values[SystemPrompt.likes] = SystemPrompt.likes + counts.likes
+                if counts.dislikes:
+                    values[SystemPrompt.dislikes] = SystemPrompt.dislikes + counts.dislikes
+                if counts.last_used:
+                    values[SystemPrompt.last_used] = counts.last_used
+                if values:
+                    db.execute(update(SystemPrompt).where(SystemPrompt.id == prompt_id).values(values))
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Put the increments back so the next flush retries them
+            with self._lock:
+                for prompt_id, counts in batch.items():
+                    self._pending.setdefault(prompt_id, PendingCounts()).merge(counts)
+            raise
+        finally:
+            db.close()
+        return len(batch)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Failed to flush prompt counters: %s", e)
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="counter-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+counter_aggregator = CounterAggregator()
@@ -0,0 +1,105 @@
+import asyncio
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.core.batching import MicroBatcher
+from app.core.config import get_settings
+from app.core.model_registry import model_registry
+from app.core.metrics import stage
+
+settings = get_settings()
+
+
+def normalize_query(text: str, lowercase: bool = False) -> str:
+    """Fold whitespace and Unicode compatibility forms; lowercase only for a model whose tokenizer does."""
+    text = unicodedata.normalize("NFKC", " ".join(text.split()))
+    return text.lower() if lowercase else text
+
+
+def _lowercases(embed_model) -> bool:
+    # HuggingFaceEmbedding keeps its SentenceTransformer in the private _model
+    # (llama-index-embeddings-huggingface is pinned in requirments.txt). Uncased
+    # tokenizers such as bge-large-en's report do_lower_case
+    tokenizer = getattr(getattr(embed_model, "_model", None), "tokenizer", None)
+    return bool(getattr(tokenizer, "do_lower_case", False))
+
+
+class EmbeddingService:
+    """
+    Query embeddings shared by both LLM services.
+
+    Repeated queries are served from an LRU cache keyed on the normalized text
+    (case-insensitive once the model turns out to be uncased); identical
+    queries in flight share one computation; the rest are micro-batched into a
+    single forward pass of the shared embedding model.
+    """
+
+    def __init__(self):
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._batcher = MicroBatcher(
+            self._embed_queries,
+            max_batch_size=settings.EMBED_BATCH_MAX_SIZE,
+            max_wait_ms=settings.EMBED_BATCH_WAIT_MS,
+        )
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0}
+        self._lowercase: Optional[bool] = None  # Read from the tokenizer with the first batch
+
+    @property
+    def embed_model(self):
+        return model_registry.get("embed_model")
+
+    async def aget_query_embedding(self, query: str) -> List[float]:
+        with stage("embedding"):
+            return await self._aget_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        key = normalize_query(query, bool(self._lowercase))
+
+        embedding = self._cache.get(key)
+        if embedding is not None:
+            self._cache.move_to_end(key)
+            self._stats["hits"] += 1
+            return embedding
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        self._stats["misses"] += 1
+        future = asyncio.ensure_future(self._batcher.submit(key))
+        self._inflight[key] = future
+        try:
+            embedding = await asyncio.shield(future)
+        finally:
+            self._inflight.pop(key, None)
+
+        self._cache[key] = embedding
+        while len(self._cache) > settings.EMBED_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return embedding
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        embed_model = self.embed_model
+        if self._lowercase is None:
+            self._lowercase = _lowercases(embed_model)
+        # HuggingFaceEmbedding only exposes batched *query* encoding (with the bge
+        # query instruction) through the private _embed, whose signature is that of
+        # the pinned llama-index-embeddings-huggingface==0.5.3; other models fall
+        # back to the public get_query_embedding one by one
+        if hasattr(embed_model, "_embed"):
+            return embed_model._embed(queries, prompt_name="query")
+        return [embed_model.get_query_embedding(query) for query in queries]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "cached": len(self._cache),
+            "batches": self._batcher.batches,
+            "avg_batch_size": round(self._batcher.items / self._batcher.batches, 2) if self._batcher.batches else 0.0,
+        }
+
+
+embedding_service = EmbeddingService()
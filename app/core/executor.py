@@ -0,0 +1,36 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# Dedicated pool for CPU-bound model work (embeddings, Detoxify) so it never
+# runs on the event loop and never starves Starlette's own threadpool.
+cpu_executor = ThreadPoolExecutor(
+    max_workers=settings.CPU_EXECUTOR_WORKERS,
+    thread_name_prefix="cpu-model",
+)
+
+_pending: Optional[asyncio.Semaphore] = None
+
+
+def _pending_slots() -> asyncio.Semaphore:
+    global _pending
+    if _pending is None:
+        _pending = asyncio.Semaphore(settings.CPU_EXECUTOR_MAX_PENDING)
+    return _pending
+
+
+async def run_cpu(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking, CPU-bound callable on the shared model executor.
+
+    At most CPU_EXECUTOR_MAX_PENDING calls may be queued or running at once;
+    further callers wait here instead of growing the executor queue unbounded.
+    """
+    async with _pending_slots():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cpu_executor, functools.partial(func, *args, **kwargs))
@@ -1,21 +1,166 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
 from kafka import KafkaProducer
 from app.core.config import get_settings
 from app.api.schemas import RLHFMessage
+from app.core.metrics import observe_stage
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# topic, payload, enqueued_at, attempts
+Record = Tuple[str, bytes, float, int]
+
+
+def _build_producer() -> KafkaProducer:
+    return KafkaProducer(
+        bootstrap_servers=settings.KAFKA_BROKER,
+        linger_ms=settings.KAFKA_LINGER_MS,
+        batch_size=settings.KAFKA_BATCH_SIZE,
+        compression_type=settings.KAFKA_COMPRESSION or None,
+        acks=1,
+        # Never let a missing broker stall the delivery thread for long
+        max_block_ms=settings.KAFKA_MAX_BLOCK_MS,
+    )
+
 
 class KafkaService:
-    def __init__(self):
-        self.producer = KafkaProducer(
-            bootstrap_servers=settings.KAFKA_BROKER
-        )
-        
-    def send_message(self, topic: str, message: RLHFMessage):
+    """
+    Buffered, non-blocking Kafka producer.
+
+    `send_message` only appends to a bounded local spool and returns. A background
+    delivery thread hands records to the producer, which batches them by
+    KAFKA_LINGER_MS / KAFKA_BATCH_SIZE and compresses them. Records that cannot be
+    delivered (broker down, producer buffer full) stay in the spool and are retried;
+    when the spool is full the oldest records are dropped and counted.
+    """
+
+    def __init__(self, producer_factory: Callable[[], Any] = _build_producer):
+        self._producer_factory = producer_factory
+        self._producer = None
+        self._spool: Deque[Record] = deque()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._in_flight = 0
+        self._stats = {"enqueued": 0, "delivered": 0, "failed": 0, "retried": 0, "dropped": 0}
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def send_message(self, topic: str, message: RLHFMessage) -> None:
+        self._enqueue((topic, message.model_dump_json().encode('utf-8'), time.monotonic(), 0))
+
+    def send_batch(self, topic: str, messages: List[RLHFMessage]) -> None:
+        now = time.monotonic()
+        records = [(topic, message.model_dump_json().encode('utf-8'), now, 0) for message in messages]
+        with self._condition:
+            for record in records:
+                self._enqueue(record)
+
+    def _enqueue(self, record: Record, front: bool = False) -> None:
+        with self._condition:
+            if len(self._spool) >= settings.KAFKA_SPOOL_SIZE:
+                self._spool.popleft()
+                self._stats["dropped"] += 1
+            if front:
+                self._spool.appendleft(record)
+            else:
+                self._spool.append(record)
+                self._stats["enqueued"] += 1
+            self._ensure_thread()
+            self._condition.notify()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._closed = False
+            self._thread = threading.Thread(target=self._deliver_loop, name="kafka-delivery", daemon=True)
+            self._thread.start()
+
+    def _deliver_loop(self) -> None:
+        while True:
+            with self._condition:
+                while not self._spool and not self._closed:
+                    self._condition.wait()
+                if not self._spool and self._closed:
+                    return
+                record = self._spool.popleft()
+
+            if not self._deliver(record):
+                # Broker unavailable: put the record back and back off before retrying
+                self._enqueue(record, front=True)
+                with self._condition:
+                    if self._closed:
+                        return
+                    self._condition.wait(settings.KAFKA_RETRY_BACKOFF_SECONDS)
+
+    def _deliver(self, record: Record) -> bool:
+        topic, payload, enqueued_at, attempts = record
         try:
-            print(f"Sending message to {topic}: {message}")
-            self.producer.send(topic, message.model_dump_json().encode('utf-8'))
-            self.producer.flush()
+            if self._producer is None:
+                self._producer = self._producer_factory()
+            future = self._producer.send(topic, payload)
         except Exception as e:
-            print(f"Error sending message to {topic}: {e}")
+            logger.warning("Kafka unavailable, %d record(s) spooled: %s", len(self._spool) + 1, e)
+            return False
+
+        with self._condition:
+            self._in_flight += 1
+        future.add_callback(self._on_delivered, enqueued_at)
+        future.add_errback(self._on_failed, record)
+        return True
+
+    def _on_delivered(self, enqueued_at: float, _metadata=None) -> None:
+        latency = time.monotonic() - enqueued_at
+        observe_stage("kafka_delivery", latency)
+        with self._condition:
+            self._in_flight -= 1
+            self._stats["delivered"] += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def _on_failed(self, record: Record, error: Exception) -> None:
+        topic, payload, enqueued_at, attempts = record
+        with self._condition:
+            self._in_flight -= 1
+            retry = attempts + 1 < settings.KAFKA_MAX_ATTEMPTS
+            self._stats["retried" if retry else "failed"] += 1
+        if retry:
+            self._enqueue((topic, payload, enqueued_at, attempts + 1), front=True)
+        else:
+            logger.error("Dropping Kafka record for %s after %d attempts: %s", topic, attempts + 1, error)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until the spool is drained and the producer has sent everything."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            while self._spool and (deadline is None or time.monotonic() < deadline):
+                self._condition.wait(0.05)
+        if self._producer is not None:
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            self._producer.flush(timeout=max(remaining, 0) if remaining is not None else None)
+
+    def close(self, timeout: float = 10.0) -> None:
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._producer is not None:
+            self._producer.close(timeout=timeout)
+            self._producer = None
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._condition:
+            delivered = self._stats["delivered"]
+            return {
+                **self._stats,
+                "queue_depth": len(self._spool),
+                "in_flight": self._in_flight,
+                "avg_delivery_latency_ms": round(1000 * self._latency_total / delivered, 3) if delivered else 0.0,
+                "max_delivery_latency_ms": round(1000 * self._latency_max, 3),
+            }
 
-kafka_service = KafkaService()
\ No newline at end of file
+kafka_service = KafkaService()
@@ -1,87 +1,304 @@
-from llama_index.core import VectorStoreIndex
-from llama_index.vector_stores.qdrant import QdrantVectorStore
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.llms.ollama import Ollama
-from llama_index.core.base.query_pipeline.query import QueryBundle
-from qdrant_client import QdrantClient
+from llama_index.core.schema import NodeWithScore
 from app.core.config import get_settings
-from typing import List, Tuple, Optional
+from app.core.llm_gateway import GatewayLLM
+from app.core.model_registry import model_registry
+from app.core.toxicity import toxicity_scorer
+from app.core.metrics import stage
+from app.core.embedding_service import embedding_service
+from app.core.streaming import StreamEvent, moderated_stream
+from app.core.context_packer import context_packer
+from app.core.response_cache import CachedResponse, response_cache
+from app.core.retrieval import RetrievalEngine, RetrievalFilters
+from app.core.sessions import ConversationSession, session_store
+from typing import AsyncIterator, Dict, List, Tuple, Optional
 from pydantic import BaseModel
-from detoxify import Detoxify
+import asyncio
 
 settings = get_settings()
 
+NO_CONTENT_RESPONSE = "No relevant content found."
+CACHE_MODE = "normal"
+
 class ArticleMetadata(BaseModel):
     title: str
     url: str
 
+def extract_articles(nodes) -> List[ArticleMetadata]:
+    # Extract metadata from nodes
+    articles = []
+    for node in nodes:
+        if hasattr(node, 'metadata') and node.metadata:
+            metadata = node.metadata
+            if 'title' in metadata and 'url' in metadata:
+                articles.append(ArticleMetadata(
+                    title=metadata['title'],
+                    url=metadata['url']
+                ))
+    return articles
+
 class LLMService:
+    TOXICITY_THRESHOLD = 0.5
+
     def __init__(self):
-        # Initialize Qdrant client
-        self.qdrant_client = QdrantClient(url=settings.QDRANT_URL, prefer_grpc=False)
-        
-        # Initialize vector store
-        self.vector_store = QdrantVectorStore(
-            client=self.qdrant_client,
-            collection_name="articles",
-            text_key="content",
-        )
+        # Fan-out retrieval over the news collections
+        self.retriever = RetrievalEngine(settings.RETRIEVAL_COLLECTIONS.split(","), top_k=10)
         
-        # Initialize embedding model
-        self.embed_model = HuggingFaceEmbedding(model_name=settings.EMBEDDING_MODEL)
+        # Shared embedding model
+        self.embed_model = model_registry.get("embed_model")
         
-        # Initialize index
-        self.index = VectorStoreIndex.from_vector_store(
-            vector_store=self.vector_store,
-            embed_model=self.embed_model
-        )
-        
-        # Initialize Ollama LLM
-        self.llm = Ollama(
-            model=settings.OLLAMA_MODEL,
-            request_timeout=120.0,
+        # Ollama LLM through the shared gateway
+        self.llm = GatewayLLM(
             temperature=0.7,
             context_window=4096,
         )
         
-        # Initialize query engine
-        self.query_engine = self.index.as_query_engine(
-            similarity_top_k=10,
-            llm=self.llm
-        )
+    async def aquery(self, query: str, system_prompt: str, context: Optional[str] = None, filters: Optional[RetrievalFilters] = None) -> Tuple[str, List[ArticleMetadata]]:
+        responses, articles = await self.aquery_multi(query, [system_prompt], context, filters)
+        return responses[0], articles
 
-        # Initialize detoxifier
-        self.detoxifier = Detoxify('original')
+    async def aquery_multi(self, query: str, system_prompts: List[str], context: Optional[str] = None, filters: Optional[RetrievalFilters] = None) -> Tuple[List[str], List[ArticleMetadata]]:
+        """
+        Answer one query under several system prompts.
 
-    def query(self, query: str, system_prompt: str, context: Optional[str] = None) -> Tuple[str, List[ArticleMetadata]]:
+        Retrieval runs once and the syntheses (with their detox passes) run
+        concurrently over the shared node set.
 
-        if context:
-            query = context + query
-        else:
-            query = query
+        Args:
+            query (str): The user's query
+            system_prompts (List[str]): System prompts to answer with
+            context (str, optional): Conversation context prepended to the query
+            filters (RetrievalFilters, optional): Source / date filters for retrieval
 
-        nodes = self.query_engine.retrieve(query)
-        nodes = [node for node in nodes if node]
+        Returns:
+            Tuple[List[str], List[ArticleMetadata]]: One response per system prompt, in order, and the referenced articles
+        """
+        mode = self._cache_mode(filters)
+        query, embedding = await self._aembed(query, context)
+        cached = await self._cached(system_prompts, embedding, mode)
+        if all(cached):
+            return [hit.response for hit in cached], [ArticleMetadata(**article) for article in cached[0].articles]
 
+        nodes = await self._aretrieve(query, embedding, filters)
         if not nodes:
-            return "No relevant content found.", []
-
-        # Extract metadata from nodes
-        articles = []
-        for node in nodes:
-            if hasattr(node, 'metadata') and node.metadata:
-                metadata = node.metadata
-                if 'title' in metadata and 'url' in metadata:
-                    articles.append(ArticleMetadata(
-                        title=metadata['title'],
-                        url=metadata['url']
-                    ))
-        query_bundle = QueryBundle(query_str=system_prompt + query)
-        response = self.query_engine.synthesize(nodes=nodes, query_bundle=query_bundle)
-        response = self._detoxify(str(response))
-        return str(response), articles
-    
-    def _detoxify(self, text: str) -> str:
+            return [NO_CONTENT_RESPONSE] * len(system_prompts), []
+
+        articles = extract_articles(nodes)
+        responses = await asyncio.gather(*(
+            self._arespond_cached(query, embedding, nodes, articles, system_prompt, mode, hit)
+            for system_prompt, hit in zip(system_prompts, cached)
+        ))
+        return list(responses), articles
+
+    async def aevaluate(self, query: str, system_prompts: List[str], filters: Optional[RetrievalFilters] = None) -> Tuple[List[str], List[ArticleMetadata]]:
+        """
+        Like `aquery_multi`, but always generates and leaves the response cache alone.
+
+        Used by offline prompt evaluation, which must not be answered from
+        earlier responses nor flood the cache interactive traffic relies on.
+
+        Args:
+            query (str): The question
+            system_prompts (List[str]): System prompts to answer with
+            filters (RetrievalFilters, optional): Source / date filters for retrieval
+
+        Returns:
+            Tuple[List[str], List[ArticleMetadata]]: One response per system prompt, in order, and the referenced articles
+        """
+        query, embedding = await self._aembed(query)
+        nodes = await self._aretrieve(query, embedding, filters)
+        if not nodes:
+            return [NO_CONTENT_RESPONSE] * len(system_prompts), []
+
+        responses = await asyncio.gather(*(self._arespond(query, nodes, system_prompt) for system_prompt in system_prompts))
+        return list(responses), extract_articles(nodes)
+
+    async def aquery_as_completed(self, query: str, system_prompts: List[str], context: Optional[str] = None, filters: Optional[RetrievalFilters] = None) -> AsyncIterator[Tuple[int, str, List[ArticleMetadata]]]:
+        """
+        Like `aquery_multi`, but yield each response as soon as it is ready.
+
+        Yields:
+            Tuple[int, str, List[ArticleMetadata]]: Index of the system prompt, its response and the referenced articles
+        """
+        mode = self._cache_mode(filters)
+        query, embedding = await self._aembed(query, context)
+        cached = await self._cached(system_prompts, embedding, mode)
+        for index, hit in enumerate(cached):
+            if hit:
+                yield index, hit.response, [ArticleMetadata(**article) for article in hit.articles]
+        if all(cached):
+            return
+
+        nodes = await self._aretrieve(query, embedding, filters)
+        if not nodes:
+            for index, hit in enumerate(cached):
+                if not hit:
+                    yield index, NO_CONTENT_RESPONSE, []
+            return
+
+        articles = extract_articles(nodes)
+        pending = {
+            asyncio.ensure_future(self._arespond_cached(query, embedding, nodes, articles, system_prompt, mode)): index
+            for index, (system_prompt, hit) in enumerate(zip(system_prompts, cached))
+            if not hit
+        }
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield pending.pop(task), task.result(), articles
+        finally:
+            # The client went away or a synthesis failed; don't leave work running
+            for task in pending:
+                task.cancel()
+
+    async def astream_query(self, query: str, system_prompt: str, context: Optional[str] = None, filters: Optional[RetrievalFilters] = None) -> AsyncIterator[StreamEvent]:
+        """
+        Stream an answer as events: the articles once retrieval finishes, then tokens.
+
+        Yields:
+            StreamEvent: ("articles", List[ArticleMetadata]), ("token", str), ("retract", scores) and ("done", str)
+        """
+        mode = self._cache_mode(filters)
+        query, embedding = await self._aembed(query, context)
+        [hit] = await self._cached([system_prompt], embedding, mode)
+        if hit:
+            yield "articles", [ArticleMetadata(**article) for article in hit.articles]
+            yield "token", hit.response
+            yield "done", hit.response
+            return
+
+        nodes = await self._aretrieve(query, embedding, filters)
+        articles = extract_articles(nodes)
+        yield "articles", articles
+
+        if not nodes:
+            yield "token", NO_CONTENT_RESPONSE
+            yield "done", NO_CONTENT_RESPONSE
+            return
+
+        messages, _ = context_packer.build_messages(self.llm, query, nodes, system_prompt, CACHE_MODE)
+        async for event, data in moderated_stream(self.llm, messages, self._score_toxicity, self.TOXICITY_THRESHOLD, self._rewrite_prompt):
+            if event == "done":
+                await response_cache.store(mode, system_prompt, self.retriever.scope, embedding, data, articles)
+            yield event, data
+
+    async def aconverse(self, session: ConversationSession, query: str, system_prompt: str, filters: Optional[RetrievalFilters] = None, system_prompt_id: Optional[int] = None) -> Tuple[str, List[ArticleMetadata]]:
+        """
+        Answer the next question of a conversation session.
+
+        Retrieval runs on the question (plus the previous question, for
+        follow-ups) rather than on the whole history, and is skipped when the
+        question is close to the previous one. The answer sees the session's
+        summary and recent turns. Answers are not cached, since they depend on
+        the history.
+
+        Args:
+            session (ConversationSession): The conversation
+            query (str): The user's new question
+            system_prompt (str): Used if the session has none yet; a session keeps its first system prompt
+            filters (RetrievalFilters, optional): Source / date filters for retrieval
+            system_prompt_id (int, optional): Id of `system_prompt`, kept with it on the session
+
+        Returns:
+            Tuple[str, List[ArticleMetadata]]: The response and the referenced articles
+        """
+        response = ""
+        articles: List[ArticleMetadata] = []
+        async for event, data in self.astream_converse(session, query, system_prompt, filters, stream=False, system_prompt_id=system_prompt_id):
+            if event == "articles":
+                articles = data
+            elif event == "done":
+                response = data
+        return response, articles
+
+    async def astream_converse(self, session: ConversationSession, query: str, system_prompt: str, filters: Optional[RetrievalFilters] = None, stream: bool = True, system_prompt_id: Optional[int] = None) -> AsyncIterator[StreamEvent]:
+        """
+        Like `aconverse`, but as stream events (see `astream_query`).
+
+        Yields:
+            StreamEvent: ("articles", List[ArticleMetadata]), ("token", str), ("retract", scores) and ("done", str)
+        """
+        async with session.lock:
+            await session_store.ready(session)
+            if session.system_prompt is None:
+                session.system_prompt, session.system_prompt_id = system_prompt, system_prompt_id
+
+            nodes = await self._session_nodes(session, query, filters)
+            articles = extract_articles(nodes)
+            yield "articles", articles
+
+            if not nodes:
+                response = NO_CONTENT_RESPONSE
+                yield "token", response
+            else:
+                # The same host keeps the conversation's prompt prefix cached between turns
+                llm = self.llm.model_copy(update={"affinity": session.id})
+                messages, _ = context_packer.build_messages(
+                    llm, query, nodes, session.system_prompt, CACHE_MODE, session.history_messages(), session.summary
+                )
+                if stream:
+                    response = ""
+                    async for event, data in moderated_stream(llm, messages, self._score_toxicity, self.TOXICITY_THRESHOLD, self._rewrite_prompt):
+                        if event == "done":
+                            response = data
+                        else:
+                            yield event, data
+                else:
+                    with stage("llm_synthesis"):
+                        response = (await llm.achat(messages)).message.content or ""
+                    response = await self._adetoxify(response)
+
+            session.record(query, response)
+            session_store.schedule_compaction(session, self.llm)
+            yield "done", response
+
+    async def _session_nodes(self, session: ConversationSession, query: str, filters: Optional[RetrievalFilters] = None) -> List[NodeWithScore]:
+        previous = session.last_question()
+        retrieval_query = f"{previous}\n\n{query}" if previous else query
+        embedding = await embedding_service.aget_query_embedding(retrieval_query)
+        filters_key = filters.cache_key() if filters else ""
+        if session.can_reuse(embedding, filters_key):
+            session.stats["retrievals_reused"] += 1
+            return session.nodes
+        session.stats["retrievals"] += 1
+        nodes = await self._aretrieve(retrieval_query, embedding, filters)
+        return session.remember_nodes(nodes, embedding, filters_key)
+
+    async def _aembed(self, query: str, context: Optional[str] = None) -> Tuple[str, List[float]]:
+        if context:
+            query = f"{context}\n\n{query}"
+
+        # Cached, coalesced and micro-batched on the model executor
+        return query, await embedding_service.aget_query_embedding(query)
+
+    async def _aretrieve(self, query: str, embedding: List[float], filters: Optional[RetrievalFilters] = None) -> List[NodeWithScore]:
+        return await self.retriever.aretrieve(query, embedding, filters)
+
+    def _cache_mode(self, filters: Optional[RetrievalFilters]) -> str:
+        # Answers retrieved under different filters must not be served for each other
+        return CACHE_MODE + filters.cache_key() if filters else CACHE_MODE
+
+    async def _cached(self, system_prompts: List[str], embedding: List[float], mode: str = CACHE_MODE) -> List[Optional[CachedResponse]]:
+        return await asyncio.gather(*(
+            response_cache.lookup(mode, system_prompt, self.retriever.scope, embedding)
+            for system_prompt in system_prompts
+        ))
+
+    async def _arespond(self, query: str, nodes: List[NodeWithScore], system_prompt: str) -> str:
+        # One call over a budgeted context, with the system prompt as the system message
+        messages, _ = context_packer.build_messages(self.llm, query, nodes, system_prompt, CACHE_MODE)
+        with stage("llm_synthesis"):
+            response = await self.llm.achat(messages)
+        return await self._adetoxify(response.message.content or "")
+
+    async def _arespond_cached(self, query: str, embedding: List[float], nodes: List[NodeWithScore], articles: List[ArticleMetadata], system_prompt: str, mode: str = CACHE_MODE, hit: Optional[CachedResponse] = None) -> str:
+        if hit:
+            return hit.response
+        response = await self._arespond(query, nodes, system_prompt)
+        await response_cache.store(mode, system_prompt, self.retriever.scope, embedding, response, articles)
+        return response
+
+    async def _adetoxify(self, text: str) -> str:
         """
         Detoxify the input text using the Detoxify library.
 
@@ -91,12 +308,17 @@ class LLMService:
         Returns:
             str: The detoxified text.
         """
-        toxicityResult = self.detoxifier.predict(text)
-        if any(value > 0.5 for value in toxicityResult.values()):
-            toxicityResultString = ", ".join([f"{key} is {round(float(value), 2)}" for key, value in toxicityResult.items()])
-            response = self.llm.complete(f"Toxicity analysis detected problematic content ({toxicityResultString}). Rewrite the following text using respectful language while preserving the essential meaning: {text}")
+        toxicityResult = await self._score_toxicity(text)
+        if any(value > self.TOXICITY_THRESHOLD for value in toxicityResult.values()):
+            with toxicity_scorer.stages.time("rewrite"):
+                response = await self.llm.acomplete(self._rewrite_prompt(toxicityResult, text))
             return str(response)
 
         return text
 
-llm_service = LLMService() 
\ No newline at end of file
+    async def _score_toxicity(self, text: str) -> Dict[str, float]:
+        return await toxicity_scorer.score(text)
+
+    def _rewrite_prompt(self, toxicityResult: Dict[str, float], text: str) -> str:
+        toxicityResultString = ", ".join([f"{key} is {round(float(value), 2)}" for key, value in toxicityResult.items()])
+        return f"Toxicity analysis detected problematic content ({toxicityResultString}). Rewrite the following text using respectful language while preserving the essential meaning: {text}"
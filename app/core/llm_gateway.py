@@ -0,0 +1,328 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import httpx
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.llms import LLM
+from pydantic import Field
+from app.core.config import get_settings
+from app.core.metrics import observe_stage
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class OllamaHost:
+    """One Ollama server: its parallel slots, current load and health."""
+
+    def __init__(self, url: str, slots: int):
+        self.url = url.rstrip("/")
+        self.slots = slots
+        self.semaphore = asyncio.Semaphore(slots)
+        self.load = 0  # Requests running or waiting for a slot
+        self.down_until = 0.0
+        self.last_used = 0.0
+        self.stats = {"requests": 0, "errors": 0, "keepalives": 0}
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def report(self) -> Dict[str, Any]:
+        return {**self.stats, "load": self.load, "slots": self.slots, "available": self.available}
+
+
+class _SharedCall:
+    """One upstream generation and the number of callers waiting for it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class LLMGateway:
+    """
+    Shared access to one or more Ollama servers.
+
+    All requests go through one pooled HTTP client. Each host allows at most
+    OLLAMA_PARALLEL concurrent generations (match it to the server's
+    OLLAMA_NUM_PARALLEL); a request goes to the available host with the lowest
+    load per slot and waits for a slot there. A host that refuses connections
+    or returns 5xx is skipped for OLLAMA_HOST_COOLDOWN seconds and the request is
+    retried on another host (streams only until their first chunk).
+
+    Requests carrying the same `affinity` key (a conversation) go to the same
+    host while it has a free slot, so Ollama can reuse the KV cache of the
+    prompt prefix they share. Identical non-streaming requests in flight at the
+    same time share one generation. Every request carries OLLAMA_KEEP_ALIVE, and a background task
+    prewarms the model on every host at startup and pings idle hosts so the
+    model is not unloaded between bursts.
+    """
+
+    def __init__(self, hosts: Optional[Sequence[str]] = None):
+        urls = hosts or [url for url in settings.OLLAMA_HOSTS.split(",") if url.strip()] or [settings.OLLAMA_URL]
+        self.hosts = [OllamaHost(url.strip(), settings.OLLAMA_PARALLEL) for url in urls]
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[str, _SharedCall] = {}
+        self._keepalive_task: Optional[asyncio.Task] = None
+        self._stats = {"requests": 0, "coalesced": 0, "retries": 0, "affinity_hits": 0}
+
+    def divide(self, workers: int) -> None:
+        """Keep this process to its share of every host's slots when `workers` processes share the hosts."""
+        for host in self.hosts:
+            host.slots = max(1, host.slots // workers)
+            host.semaphore = asyncio.Semaphore(host.slots)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            connections = sum(host.slots for host in self.hosts) * 2
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.OLLAMA_REQUEST_TIMEOUT, connect=5.0),
+                limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+            )
+        return self._client
+
+    async def chat(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any], affinity: Optional[str] = None) -> str:
+        """Run a chat completion and return the assistant message."""
+        payload = {"model": model, "messages": messages, "options": options}
+        return await self._coalesced("/api/chat", payload, lambda data: data.get("message", {}).get("content", ""), affinity)
+
+    async def generate(self, model: str, prompt: str, options: Dict[str, Any], affinity: Optional[str] = None) -> str:
+        """Run a plain completion and return the generated text."""
+        payload = {"model": model, "prompt": prompt, "options": options}
+        return await self._coalesced("/api/generate", payload, lambda data: data.get("response", ""), affinity)
+
+    async def stream_chat(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any], affinity: Optional[str] = None) -> AsyncIterator[str]:
+        """Yield the assistant message as it is generated."""
+        payload = {"model": model, "messages": messages, "options": options}
+        async for data in self._stream("/api/chat", payload, affinity):
+            yield data.get("message", {}).get("content", "")
+
+    async def stream_generate(self, model: str, prompt: str, options: Dict[str, Any], affinity: Optional[str] = None) -> AsyncIterator[str]:
+        payload = {"model": model, "prompt": prompt, "options": options}
+        async for data in self._stream("/api/generate", payload, affinity):
+            yield data.get("response", "")
+
+    async def _coalesced(self, path: str, payload: Dict[str, Any], extract, affinity: Optional[str] = None) -> str:
+        self._stats["requests"] += 1
+        if not settings.LLM_COALESCE:
+            return extract(await self._post(path, payload, affinity))
+
+        key = hashlib.sha1((path + json.dumps(payload, sort_keys=True)).encode("utf-8")).hexdigest()
+        shared = self._inflight.get(key)
+        if shared is None:
+            # The generation runs in its own task, so a caller that is cancelled does not cancel it for the others
+            shared = self._inflight[key] = _SharedCall(asyncio.create_task(self._post(path, payload, affinity)))
+            shared.task.add_done_callback(lambda task: self._finish_shared(key, shared))
+        else:
+            self._stats["coalesced"] += 1
+
+        shared.waiters += 1
+        try:
+            return extract(await asyncio.shield(shared.task))
+        finally:
+            shared.waiters -= 1
+            if shared.waiters == 0 and not shared.task.done():
+                # The last caller left; nobody wants the answer any more
+                self._inflight.pop(key, None)
+                shared.task.cancel()
+
+    def _finish_shared(self, key: str, shared: "_SharedCall") -> None:
+        if self._inflight.get(key) is shared:
+            del self._inflight[key]
+        if not shared.task.cancelled():
+            shared.task.exception()  # Retrieved by the waiters; marked here in case they all left
+
+    def _pick(self, exclude: Sequence[OllamaHost] = (), affinity: Optional[str] = None) -> OllamaHost:
+        candidates = [host for host in self.hosts if host.available and host not in exclude]
+        if not candidates:
+            # Everything is cooling down: try the one that failed longest ago
+            candidates = [min((host for host in self.hosts if host not in exclude), key=lambda host: host.down_until, default=self.hosts[0])]
+        if affinity:
+            preferred = self.hosts[zlib.crc32(affinity.encode("utf-8")) % len(self.hosts)]
+            if preferred in candidates and preferred.load < preferred.slots:
+                self._stats["affinity_hits"] += 1
+                return preferred
+        return min(candidates, key=lambda host: (host.load / host.slots, host.last_used))
+
+    def _mark_down(self, host: OllamaHost, error: Exception) -> None:
+        host.stats["errors"] += 1
+        host.down_until = time.monotonic() + settings.OLLAMA_HOST_COOLDOWN
+        logger.warning("Ollama host %s failed, skipping it for %ss: %s", host.url, settings.OLLAMA_HOST_COOLDOWN, error)
+
+    def _body(self, payload: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+        return {**payload, "stream": stream, "keep_alive": settings.OLLAMA_KEEP_ALIVE}
+
+    async def _post(self, path: str, payload: Dict[str, Any], affinity: Optional[str] = None) -> Dict[str, Any]:
+        tried: List[OllamaHost] = []
+        while True:
+            host = self._pick(tried, affinity)
+            tried.append(host)
+            host.load += 1
+            try:
+                started = time.perf_counter()
+                async with host.semaphore:
+                    observe_stage("llm_queue", time.perf_counter() - started)
+                    host.stats["requests"] += 1
+                    host.last_used = time.monotonic()
+                    response = await self.client.post(host.url + path, json=self._body(payload, False))
+                    response.raise_for_status()
+                    return response.json()
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+                    raise
+                self._mark_down(host, e)
+                if len(tried) >= len(self.hosts):
+                    raise
+                self._stats["retries"] += 1
+            finally:
+                host.load -= 1
+
+    async def _stream(self, path: str, payload: Dict[str, Any], affinity: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        self._stats["requests"] += 1
+        tried: List[OllamaHost] = []
+        while True:
+            host = self._pick(tried, affinity)
+            tried.append(host)
+            host.load += 1
+            yielded = False
+            try:
+                started = time.perf_counter()
+                async with host.semaphore:
+                    observe_stage("llm_queue", time.perf_counter() - started)
+                    host.stats["requests"] += 1
+                    host.last_used = time.monotonic()
+                    async with self.client.stream("POST", host.url + path, json=self._body(payload, True)) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if line:
+                                yielded = True
+                                yield json.loads(line)
+                    return
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+                    raise
+                self._mark_down(host, e)
+                # Once tokens have reached the client the answer cannot be restarted elsewhere
+                if yielded or len(tried) >= len(self.hosts):
+                    raise
+                self._stats["retries"] += 1
+            finally:
+                host.load -= 1
+
+    async def keepalive(self, host: OllamaHost) -> None:
+        """Load the model on a host (or keep it loaded) without generating anything."""
+        try:
+            response = await self.client.post(
+                host.url + "/api/generate",
+                json={"model": settings.OLLAMA_MODEL, "keep_alive": settings.OLLAMA_KEEP_ALIVE},
+            )
+            response.raise_for_status()
+            host.stats["keepalives"] += 1
+            host.last_used = time.monotonic()
+        except httpx.HTTPError as e:
+            self._mark_down(host, e)
+
+    async def _keepalive_loop(self, prewarm: bool) -> None:
+        if prewarm:
+            await asyncio.gather(*(self.keepalive(host) for host in self.hosts))
+        while True:
+            await asyncio.sleep(settings.OLLAMA_KEEPALIVE_INTERVAL)
+            idle = [host for host in self.hosts if time.monotonic() - host.last_used >= settings.OLLAMA_KEEPALIVE_INTERVAL]
+            await asyncio.gather(*(self.keepalive(host) for host in idle))
+
+    async def start(self, prewarm: bool = True) -> None:
+        if settings.OLLAMA_KEEPALIVE_INTERVAL > 0 or prewarm:
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop(prewarm))
+
+    async def stop(self) -> None:
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            try:
+                await self._keepalive_task
+            except asyncio.CancelledError:
+                pass
+            self._keepalive_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "inflight_unique": len(self._inflight),
+            "hosts": {host.url: host.report() for host in self.hosts},
+        }
+
+
+llm_gateway = LLMGateway()
+
+
+def _message_dicts(messages: Sequence[ChatMessage]) -> List[Dict[str, str]]:
+    return [{"role": message.role.value, "content": message.content or ""} for message in messages]
+
+
+class GatewayLLM(LLM):
+    """llama_index LLM backed by the shared gateway, so prompts, streaming and moderation work unchanged."""
+
+    model: str = Field(default_factory=lambda: settings.OLLAMA_MODEL)
+    temperature: float = 0.7
+    context_window: int = 4096
+    # Host affinity key, e.g. a conversation id; see LLMGateway
+    affinity: Optional[str] = None
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=self.context_window, is_chat_model=True, model_name=self.model)
+
+    def _options(self) -> Dict[str, Any]:
+        return {"temperature": self.temperature, "num_ctx": self.context_window}
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        text = await llm_gateway.chat(self.model, _message_dicts(messages), self._options(), self.affinity)
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text))
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return CompletionResponse(text=await llm_gateway.generate(self.model, prompt, self._options(), self.affinity))
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        async def gen() -> ChatResponseAsyncGen:
+            text = ""
+            async for delta in llm_gateway.stream_chat(self.model, _message_dicts(messages), self._options(), self.affinity):
+                text += delta
+                yield ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text), delta=delta)
+        return gen()
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        async def gen() -> CompletionResponseAsyncGen:
+            text = ""
+            async for delta in llm_gateway.stream_generate(self.model, prompt, self._options(), self.affinity):
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+        return gen()
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        raise NotImplementedError("GatewayLLM is async only")
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        raise NotImplementedError("GatewayLLM is async only")
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        raise NotImplementedError("GatewayLLM is async only")
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        raise NotImplementedError("GatewayLLM is async only")
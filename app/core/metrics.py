@@ -0,0 +1,216 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# Buckets from 5 ms to 2 minutes: covers a cache hit as well as a cold Ollama call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REQUEST_LATENCY = Histogram(
+    "udllm_request_duration_seconds", "HTTP request latency", ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge("udllm_requests_in_flight", "HTTP requests being served")
+STAGE_LATENCY = Histogram(
+    "udllm_stage_duration_seconds", "Latency of one pipeline stage", ["stage"], buckets=LATENCY_BUCKETS
+)
+STAGES_IN_FLIGHT = Gauge("udllm_stages_in_flight", "Pipeline stages currently running", ["stage"])
+STAGE_ERRORS = Counter("udllm_stage_errors_total", "Pipeline stages that raised", ["stage"])
+PROMPT_TOKENS = Histogram(
+    "udllm_prompt_tokens", "Tokens in each part of the synthesis prompt", ["mode", "part"],
+    buckets=(16, 64, 128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192)
+)
+DB_POOL_WAIT = Histogram(
+    "udllm_db_pool_wait_seconds", "Time spent waiting for a pooled database connection", ["engine"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 30)
+)
+ADMISSION_QUEUE_DEPTH = Gauge("udllm_admission_queue_depth", "Prompts waiting for an admission slot", ["mode"])
+ADMISSION_ACTIVE = Gauge("udllm_admission_active", "Prompts holding an admission slot", ["mode"])
+ADMISSION_WAIT = Histogram(
+    "udllm_admission_wait_seconds", "Time a prompt waited for an admission slot", ["mode"], buckets=LATENCY_BUCKETS
+)
+ADMISSION_REJECTED = Counter("udllm_admission_rejected_total", "Prompts turned away by admission control", ["mode", "reason"])
+
+# (stage, seconds) recorded during the current request, for the Server-Timing header
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_LATENCY.labels(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a pipeline stage into the stage histogram and the request's breakdown."""
+    in_flight = STAGES_IN_FLIGHT.labels(name)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(name).inc()
+        raise
+    finally:
+        in_flight.dec()
+        observe_stage(name, time.perf_counter() - started)
+
+
+def instrument_engine(engine) -> None:
+    """Time every SQL statement executed through `engine` as the db_query stage."""
+    from sqlalchemy import event
+
+    # One statement runs at a time per connection, so a single start time is enough
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_started", None)
+        if started is not None:
+            observe_stage("db_query", time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        # Failed statements never reach after_cursor_execute
+        if exception_context.connection is not None:
+            started = exception_context.connection.info.pop("query_started", None)
+            if started is not None:
+                STAGE_ERRORS.labels("db_query").inc()
+                observe_stage("db_query", time.perf_counter() - started)
+
+
+def _server_timing(timings: List[Tuple[str, float]]) -> str:
+    totals = {}
+    for name, seconds in timings:
+        count, total = totals.get(name, (0, 0.0))
+        totals[name] = (count + 1, total + seconds)
+    return ", ".join(
+        f'{name};dur={1000 * total:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+        for name, (count, total) in totals.items()
+    )
+
+
+class MetricsMiddleware:
+    """
+    Record request latency and in-flight gauges per route.
+
+    When METRICS_TIMING_HEADER is enabled, or the client sends `X-Debug-Timing: 1`,
+    the per-stage breakdown of the request is returned in a `Server-Timing` header
+    (for streaming responses it covers the stages finished before the first byte).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        want_header = settings.METRICS_TIMING_HEADER or (b"x-debug-timing", b"1") in scope.get("headers", [])
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        status = "500"
+        started = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                if want_header and timings:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(timings).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # Label with the route template (/{prompt_id}/like), not the raw path
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_LATENCY.labels(scope["method"], route, status).observe(time.perf_counter() - started)
+            _request_timings.reset(token)
+
+
+class ServiceStatsCollector:
+    """Export the counters the services already keep (caches, batchers, Kafka spool, models) at scrape time."""
+
+    def describe(self):
+        # Keep registration from calling collect() while the services are still importing
+        return []
+
+    def collect(self):
+        from app.core.admission import admission_controller
+        from app.core.container import container
+        from app.core.context_packer import context_packer
+        from app.core.embedding_service import embedding_service
+        from app.core.kafka_service import kafka_service
+        from app.core.llm_gateway import llm_gateway
+        from app.core.model_registry import model_registry
+        from app.core.response_cache import response_cache
+        from app.core.retrieval import search_cache
+        from app.core.sessions import session_store
+        from app.core.toxicity import toxicity_scorer
+        from app.database.database import pool_status
+
+        sources = {
+            "response_cache": response_cache.stats(),
+            "embedding": embedding_service.stats(),
+            "toxicity": toxicity_scorer.stats(),
+            "kafka": kafka_service.metrics(),
+            "context": context_packer.stats(),
+            "llm_gateway": llm_gateway.stats(),
+            "sessions": session_store.stats(),
+            "search_cache": search_cache.stats(),
+        }
+        for mode, stats in admission_controller.stats().items():
+            sources[f"admission_{mode}"] = stats
+        family = GaugeMetricFamily("udllm_component_stat", "Internal component counters", labels=["component", "stat"])
+        for component, stats in sources.items():
+            for name, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    family.add_metric([component, name], value)
+        yield family
+
+        memory = GaugeMetricFamily("udllm_model_rss_megabytes", "RSS growth measured while loading each model", labels=["model"])
+        for name, info in model_registry.memory_report()["models"].items():
+            if info.get("loaded"):
+                memory.add_metric([name], info.get("rss_mb", 0.0))
+        yield memory
+
+        pool = GaugeMetricFamily("udllm_db_pool_connections", "Database pool connections by state", labels=["engine", "state"])
+        for engine, status in pool_status().items():
+            for state, value in status.items():
+                pool.add_metric([engine, state], value)
+        yield pool
+
+        startup = container.startup_report()
+        ready = GaugeMetricFamily("udllm_ready", "1 once every warm-up component has been built")
+        ready.add_metric([], 1.0 if startup["ready"] else 0.0)
+        yield ready
+        build = GaugeMetricFamily("udllm_component_startup_seconds", "Time taken to build each service component", labels=["component"])
+        for name, info in startup["components"].items():
+            if "seconds" in info:
+                build.add_metric([name], info["seconds"])
+        yield build
+
+
+REGISTRY.register(ServiceStatsCollector())
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
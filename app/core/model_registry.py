@@ -0,0 +1,136 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+import psutil
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of heavy models and clients.
+
+    Every entry is built at most once per process, either lazily on first use or
+    eagerly through `preload`. The resident memory growth observed while loading
+    each entry is recorded so we can size workers per node.
+
+    Entries registered as `shareable` hold only in-memory weights and survive a
+    fork, so a pre-fork parent can load them once for all its workers. Anything
+    else (clients with sockets or channels) is dropped in the child by
+    `after_fork` and rebuilt on first use.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._shareable: Set[str] = set()
+        self._instances: Dict[str, Any] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.RLock()
+        self._process = psutil.Process()
+
+    def register(self, name: str, factory: Callable[[], Any], shareable: bool = False) -> None:
+        with self._lock:
+            self._factories[name] = factory
+            if shareable:
+                self._shareable.add(name)
+            else:
+                self._shareable.discard(name)
+
+    def is_shareable(self, name: str) -> bool:
+        return name in self._shareable
+
+    def override(self, name: str, instance: Any) -> None:
+        """Install an already built instance, e.g. a local stand-in."""
+        with self._lock:
+            self._instances[name] = instance
+            self._stats[name] = {"load_seconds": 0.0, "rss_mb": 0.0}
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            if name in self._instances:
+                return self._instances[name]
+            if name not in self._factories:
+                raise KeyError(f"Unknown model: {name}")
+
+            rss_before = self._process.memory_info().rss
+            started = time.perf_counter()
+            instance = self._factories[name]()
+            self._stats[name] = {
+                "load_seconds": round(time.perf_counter() - started, 3),
+                "rss_mb": round((self._process.memory_info().rss - rss_before) / (1024 * 1024), 1),
+            }
+            self._instances[name] = instance
+            return instance
+
+    def preload(self, names: Optional[Iterable[str]] = None) -> None:
+        for name in names or list(self._factories):
+            self.get(name)
+
+    def after_fork(self) -> None:
+        """Reset per-process state in a forked child; shareable models are kept."""
+        self._lock = threading.RLock()
+        self._process = psutil.Process()
+        for name in list(self._instances):
+            if name not in self._shareable:
+                del self._instances[name]
+                self._stats.pop(name, None)
+
+    def memory_report(self) -> Dict[str, Any]:
+        """
+        Report the resident memory attributed to each loaded model.
+
+        Returns:
+            Dict[str, Any]: Per-model load time and RSS growth plus the process total.
+        """
+        return {
+            "process_rss_mb": round(self._process.memory_info().rss / (1024 * 1024), 1),
+            "models": {
+                name: {"loaded": name in self._instances, **self._stats.get(name, {})}
+                for name in self._factories
+            },
+        }
+
+
+def _build_embed_model():
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    return HuggingFaceEmbedding(model_name=settings.EMBEDDING_MODEL)
+
+
+def _build_qdrant_client():
+    from qdrant_client import QdrantClient
+    from app.core.qdrant import client_options
+    return QdrantClient(**client_options())
+
+
+def _build_async_qdrant_client():
+    from qdrant_client import AsyncQdrantClient
+    from app.core.qdrant import client_options
+    return AsyncQdrantClient(**client_options())
+
+
+def _build_qdrant_search_pool():
+    from app.core.qdrant import QdrantClientPool
+    return QdrantClientPool(model_registry.get("async_qdrant_client"), settings.QDRANT_GRPC_POOL_SIZE)
+
+
+def _build_detoxifier():
+    from app.core.toxicity import build_detoxifier
+    return build_detoxifier()
+
+
+model_registry = ModelRegistry()
+model_registry.register("embed_model", _build_embed_model, shareable=True)
+model_registry.register("qdrant_client", _build_qdrant_client)
+model_registry.register("async_qdrant_client", _build_async_qdrant_client)
+model_registry.register("qdrant_search_pool", _build_qdrant_search_pool)
+model_registry.register("detoxifier", _build_detoxifier, shareable=True)
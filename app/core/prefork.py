@@ -0,0 +1,200 @@
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Any, Dict, Optional
+
+import uvicorn
+from uvicorn.importer import import_from_string
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def _set_torch_threads(threads: int) -> None:
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+
+def reinit_after_fork(workers: int = 1) -> None:
+    """
+    Give a freshly forked worker its own connections, clients and random state.
+
+    The admission and Ollama slot limits are meant for the whole server, so
+    each of `workers` processes keeps to its share of them. Sessions cannot
+    follow a conversation across workers and are turned off when there are
+    several.
+    """
+    from app.core.admission import admission_controller
+    from app.core.llm_gateway import llm_gateway
+    from app.core.model_registry import model_registry
+    from app.core.prompt_sampler import prompt_sampler
+    from app.core.sessions import session_store
+    from app.database.database import async_engine, engine
+
+    # Pooled connections opened by the parent belong to it; close=False leaves them alone
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    model_registry.after_fork()
+    prompt_sampler.reseed()
+    if workers > 1:
+        admission_controller.divide(workers)
+        llm_gateway.divide(workers)
+        session_store.enabled = False
+
+
+def _warn_per_worker_state(workers: int) -> None:
+    if workers <= 1:
+        return
+    logger.warning("Conversation sessions are disabled with %d workers; run one worker per instance to use them", workers)
+    if settings.SEMANTIC_CACHE_ENABLED and settings.SEMANTIC_CACHE_BACKEND != "redis":
+        logger.warning(
+            "The response cache is kept per worker and POST /api/llm/cache/invalidate reaches only one of them; "
+            "set SEMANTIC_CACHE_BACKEND=redis to share it"
+        )
+
+
+class PreforkServer:
+    """
+    Serve the app from worker processes forked off a parent that has loaded the models.
+
+    The parent imports the app, loads the shareable models listed in
+    PREFORK_MODELS, then freezes everything it has allocated into the garbage
+    collector's permanent generation and forks the workers. Weights are only
+    read after loading, so their pages stay shared copy-on-write between the
+    workers; `gc.freeze` keeps collections in the workers from writing to the
+    objects that own them.
+
+    The parent also creates the database schema once, so the workers do not
+    race each other running `create_all`. Each worker resets its per-process
+    state (`reinit_after_fork`) and then runs the normal lifespan, which opens
+    its own DB pool, Kafka producer and HTTP clients. Workers that exit are
+    restarted; SIGTERM / SIGINT stop them all.
+    """
+
+    def __init__(self, app: str, host: str, port: int, workers: int, preload: bool = True):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = max(workers, 1)
+        self.preload = preload
+        self._app: Any = None
+        self._socket: Optional[socket.socket] = None
+        self._children: Dict[int, float] = {}
+        self._stopping = False
+
+    def load(self) -> None:
+        from app.core.container import container
+        from app.core.model_registry import model_registry
+        from app.database.database import engine
+
+        self._app = import_from_string(self.app)
+        # The workers inherit the built component and skip create_all
+        container.get("database")
+        engine.dispose()
+        if self.preload:
+            names = [name.strip() for name in settings.PREFORK_MODELS.split(",") if name.strip()]
+            for name in names:
+                if not model_registry.is_shareable(name):
+                    raise ValueError(f"{name} cannot be shared across workers")
+            # Worker threads (OpenMP, tokenizers) do not survive a fork; load single-threaded
+            os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+            _set_torch_threads(1)
+            started = time.perf_counter()
+            model_registry.preload(names)
+            logger.info("Loaded %s in %.2fs before forking", ", ".join(names), time.perf_counter() - started)
+        gc.collect()
+        gc.freeze()
+
+    def bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def run(self) -> None:
+        logging.basicConfig(level=logging.INFO, format="%(levelname)s:     %(message)s")
+        self.load()
+        self._socket = self.bind()
+        logger.info("Serving %s on %s:%d with %d workers", self.app, self.host, self.port, self.workers)
+        _warn_per_worker_state(self.workers)
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        for _ in range(self.workers):
+            self._spawn()
+        try:
+            while not self._stopping:
+                self._reap()
+                time.sleep(0.5)
+        finally:
+            self._shutdown()
+
+    def _handle_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._serve()
+            except BaseException:
+                logger.exception("Worker %d failed", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        self._children[pid] = time.monotonic()
+
+    def _serve(self) -> None:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        reinit_after_fork(self.workers)
+        _set_torch_threads(max(1, (os.cpu_count() or 1) // self.workers))
+        config = uvicorn.Config(self._app, host=self.host, port=self.port)
+        uvicorn.Server(config).run(sockets=[self._socket])
+
+    def _reap(self) -> None:
+        while self._children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            started = self._children.pop(pid, None)
+            if started is None or self._stopping:
+                continue
+            logger.warning("Worker %d exited with status %d, restarting", pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < 1.0:
+                time.sleep(1.0)  # Do not spin on a worker that fails at startup
+            self._spawn()
+
+    def _shutdown(self, timeout: float = 30.0) -> None:
+        for pid in list(self._children):
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        while self._children and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self._children.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        for pid in list(self._children):
+            self._signal(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self._children.clear()
+        if self._socket is not None:
+            self._socket.close()
+
+    @staticmethod
+    def _signal(pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
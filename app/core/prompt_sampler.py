@@ -0,0 +1,179 @@
+import random
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import get_settings
+from app.core.counters import counter_aggregator
+from app.models.models import SystemPrompt
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class PromptSnapshot:
+    id: int
+    prompt: str
+    likes: int
+    dislikes: int
+
+
+class AliasTable:
+    """Vose's alias method: O(n) to build, O(1) per weighted draw."""
+
+    def __init__(self, weights: List[float]):
+        n = len(weights)
+        total = sum(weights)
+        scaled = [weight * n / total for weight in weights]
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+        small = [i for i, weight in enumerate(scaled) if weight < 1.0]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def sample(self, rng: random.Random) -> int:
+        i = rng.randrange(len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+
+class PromptSampler:
+    """
+    In-memory view of the SystemPrompts table for the request hot path.
+
+    New prompts are picked up incrementally (`id > max seen id`) every
+    PROMPT_SAMPLER_REFRESH_SECONDS and like/dislike counters are reloaded every
+    PROMPT_SAMPLER_FULL_REFRESH_SECONDS; changes made through this process are
+    applied immediately via `notify_added` / `notify_votes`. The favorite prompt
+    and the sampling structure are rebuilt on every change, so sampling and
+    `favorite()` never touch the database between refreshes.
+
+    Strategies (PROMPT_SAMPLING_STRATEGY):
+        uniform:  every prompt equally likely, O(1)
+        weighted: proportional to the posterior mean like rate, alias table, O(1)
+        thompson: Thompson sampling over Beta(likes + 1, dislikes + 1), O(n) vectorized
+    """
+
+    def __init__(self, strategy: str = settings.PROMPT_SAMPLING_STRATEGY):
+        if strategy not in ("uniform", "weighted", "thompson"):
+            raise ValueError(f"Unknown prompt sampling strategy: {strategy}")
+        self.strategy = strategy
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+        self._np_rng = np.random.default_rng()
+        self._prompts: Dict[int, PromptSnapshot] = {}
+        self._order: List[PromptSnapshot] = []
+        self._alias: Optional[AliasTable] = None
+        self._favorite: Optional[PromptSnapshot] = None
+        self._max_id = 0
+        self._refreshed_at = 0.0
+        self._fully_refreshed_at = 0.0
+        self._refreshing = False
+
+    def reseed(self) -> None:
+        # Forked workers would otherwise all draw the same prompt sequence
+        self._rng = random.Random()
+        self._np_rng = np.random.default_rng()
+
+    async def _ensure_fresh(self, db: AsyncSession) -> None:
+        # While one request refreshes, the others keep serving the current view
+        if self._refreshing and self._order:
+            return
+        now = time.monotonic()
+        if now - self._fully_refreshed_at >= settings.PROMPT_SAMPLER_FULL_REFRESH_SECONDS:
+            await self.refresh(db, full=True)
+        elif now - self._refreshed_at >= settings.PROMPT_SAMPLER_REFRESH_SECONDS:
+            await self.refresh(db)
+
+    async def refresh(self, db: AsyncSession, full: bool = False) -> None:
+        query = select(SystemPrompt.id, SystemPrompt.prompt, SystemPrompt.likes, SystemPrompt.dislikes)
+        if not full:
+            query = query.where(SystemPrompt.id > self._max_id)
+        self._refreshing = True
+        try:
+            result = await db.execute(query)
+        finally:
+            self._refreshing = False
+        rows = []
+        for id, prompt, likes, dislikes in result:
+            # Include votes that are still waiting for the write-behind flush
+            pending = counter_aggregator.pending(id)
+            rows.append(PromptSnapshot(id, prompt, (likes or 0) + pending.likes, (dislikes or 0) + pending.dislikes))
+
+        with self._lock:
+            prompts = {} if full else dict(self._prompts)
+            prompts.update((row.id, row) for row in rows)
+            self._rebuild(prompts)
+            now = time.monotonic()
+            self._refreshed_at = now
+            if full:
+                self._fully_refreshed_at = now
+
+    def notify_added(self, prompt: SystemPrompt) -> None:
+        with self._lock:
+            prompts = dict(self._prompts)
+            prompts[prompt.id] = PromptSnapshot(prompt.id, prompt.prompt, prompt.likes or 0, prompt.dislikes or 0)
+            self._rebuild(prompts)
+
+    def notify_votes(self, prompt_id: int, likes: int = 0, dislikes: int = 0) -> None:
+        with self._lock:
+            current = self._prompts.get(prompt_id)
+            if current is None:
+                return
+            prompts = dict(self._prompts)
+            prompts[prompt_id] = replace(current, likes=current.likes + likes, dislikes=current.dislikes + dislikes)
+            self._rebuild(prompts)
+
+    def _rebuild(self, prompts: Dict[int, PromptSnapshot]) -> None:
+        # Called with the lock held; readers only ever see complete structures
+        order = sorted(prompts.values(), key=lambda prompt: prompt.id)
+        self._prompts = prompts
+        self._order = order
+        self._max_id = max(prompts, default=0)
+        self._favorite = max(order, key=lambda prompt: prompt.likes, default=None)
+        self._alias = AliasTable([
+            (prompt.likes + 1) / (prompt.likes + prompt.dislikes + 2) for prompt in order
+        ]) if order and self.strategy == "weighted" else None
+
+    async def favorite(self, db: AsyncSession) -> PromptSnapshot:
+        await self._ensure_fresh(db)
+        if self._favorite is None:
+            raise ValueError("No favorite prompt found")
+        return self._favorite
+
+    async def sample(self, db: AsyncSession, exclude: Iterable[int] = ()) -> PromptSnapshot:
+        await self._ensure_fresh(db)
+        exclude = set(exclude)
+        order, alias = self._order, self._alias
+        candidates = len(order) - len(exclude.intersection(self._prompts))
+        if candidates <= 0:
+            raise ValueError("No system prompts available")
+
+        if self.strategy == "thompson":
+            draws = self._np_rng.beta(
+                [prompt.likes + 1 for prompt in order],
+                [prompt.dislikes + 1 for prompt in order],
+            )
+            for i in np.argsort(-draws):
+                if order[i].id not in exclude:
+                    return order[i]
+
+        # Rejection sampling keeps draws O(1) while only a few prompts are excluded
+        for _ in range(16):
+            i = alias.sample(self._rng) if alias else self._rng.randrange(len(order))
+            if order[i].id not in exclude:
+                return order[i]
+        return self._rng.choice([prompt for prompt in order if prompt.id not in exclude])
+
+
+prompt_sampler = PromptSampler()
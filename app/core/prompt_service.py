@@ -1,63 +1,86 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.models import SystemPrompt
-from datetime import datetime
-import random
+from app.core.prompt_sampler import PromptSnapshot, prompt_sampler
+from app.core.counters import counter_aggregator
+from typing import Dict, Set, Tuple
 
 class PromptService:
     @staticmethod
-    def get_random_prompt(db: Session, other_prompt_ids: list[int] = []) -> SystemPrompt:
-        # Get all prompts
-        query = db.query(SystemPrompt)
-        if other_prompt_ids:
-            query = query.filter(SystemPrompt.id.notin_(other_prompt_ids))
-        prompts = query.all()
-        
-        if not prompts:
-            raise ValueError("No system prompts available")
-        
-        # Select a random prompt
-        prompt = random.choice(prompts)
-        
-        # Update last_used
-        prompt.last_used = datetime.now()
-        prompt.used += 1
-        db.commit()
-        
+    async def get_random_prompt(db: AsyncSession, other_prompt_ids: list[int] = []) -> PromptSnapshot:
+        # Sample from the in-memory prompt table
+        prompt = await prompt_sampler.sample(db, other_prompt_ids)
+
+        # Update used / last_used in the background flush
+        counter_aggregator.record_use(prompt.id)
+
         return prompt
-    
+
     @staticmethod
-    def get_favorite_prompt(db: Session) -> SystemPrompt:
-        prompt = db.query(SystemPrompt).order_by(SystemPrompt.likes.desc()).first()
-        if not prompt:
-            raise ValueError("No favorite prompt found")
-        return prompt
+    async def get_favorite_prompt(db: AsyncSession) -> PromptSnapshot:
+        # Precomputed by the sampler; db is only used when its view is stale
+        return await prompt_sampler.favorite(db)
 
     @staticmethod
-    def add_prompt(db: Session, prompt_text: str) -> SystemPrompt:
+    async def add_prompt(db: AsyncSession, prompt_text: str) -> SystemPrompt:
         prompt = SystemPrompt(prompt=prompt_text)
         db.add(prompt)
-        db.commit()
-        db.refresh(prompt)
+        await db.commit()
+        await db.refresh(prompt)
+        prompt_sampler.notify_added(prompt)
         return prompt
 
     @staticmethod
-    def like_prompt(db: Session, prompt_id: int) -> SystemPrompt:
-        prompt = db.query(SystemPrompt).filter(SystemPrompt.id == prompt_id).first()
+    async def like_prompt(db: AsyncSession, prompt_id: int) -> SystemPrompt:
+        prompt = await db.get(SystemPrompt, prompt_id)
         if not prompt:
             raise ValueError("Prompt not found")
-        prompt.likes += 1
-        db.commit()
-        return prompt
+        counter_aggregator.record_vote(prompt_id, likes=1)
+        prompt_sampler.notify_votes(prompt_id, likes=1)
+        return counter_aggregator.overlay(db, prompt)
 
     @staticmethod
-    def dislike_prompt(db: Session, prompt_id: int) -> SystemPrompt:
-        prompt = db.query(SystemPrompt).filter(SystemPrompt.id == prompt_id).first()
+    async def dislike_prompt(db: AsyncSession, prompt_id: int) -> SystemPrompt:
+        prompt = await db.get(SystemPrompt, prompt_id)
         if not prompt:
             raise ValueError("Prompt not found")
-        prompt.dislikes += 1
-        db.commit()
-        return prompt
+        counter_aggregator.record_vote(prompt_id, dislikes=1)
+        prompt_sampler.notify_votes(prompt_id, dislikes=1)
+        return counter_aggregator.overlay(db, prompt)
+
+    @staticmethod
+    async def apply_votes(db: AsyncSession, votes: Dict[int, Tuple[int, int]]) -> Set[int]:
+        """
+        Apply aggregated votes in one transaction, one UPDATE per prompt.
+
+        Args:
+            db (AsyncSession): Database session
+            votes (Dict[int, Tuple[int, int]]): (likes, dislikes) to add, by prompt id
+
+        Returns:
+            Set[int]: The prompt ids that exist and were updated
+        """
+        if not votes:
+            return set()
+        result = await db.execute(select(SystemPrompt.id).where(SystemPrompt.id.in_(votes)))
+        existing = set(result.scalars())
+        for prompt_id in existing:
+            likes, dislikes = votes[prompt_id]
+            await db.execute(
+                update(SystemPrompt)
+                .where(SystemPrompt.id == prompt_id)
+                .values({
+                    SystemPrompt.likes: SystemPrompt.likes + likes,
+                    SystemPrompt.dislikes: SystemPrompt.dislikes + dislikes,
+                })
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+        for prompt_id in existing:
+            prompt_sampler.notify_votes(prompt_id, *votes[prompt_id])
+        return existing
 
     @staticmethod
-    def get_prompt_stats(db: Session) -> list:
-        return db.query(SystemPrompt).all() 
\ No newline at end of file
+    async def get_prompt_stats(db: AsyncSession) -> list:
+        result = await db.execute(select(SystemPrompt))
+        return [counter_aggregator.overlay(db, prompt) for prompt in result.scalars().all()]
@@ -0,0 +1,100 @@
+import itertools
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+from qdrant_client import AsyncQdrantClient, models
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+def client_options() -> Dict[str, Any]:
+    """Connection settings shared by every Qdrant client the app builds."""
+    return {
+        "url": settings.QDRANT_URL,
+        "prefer_grpc": settings.QDRANT_PREFER_GRPC,
+        "grpc_port": settings.QDRANT_GRPC_PORT,
+        "timeout": settings.QDRANT_TIMEOUT,
+        "grpc_options": {
+            # Keep idle channels open between bursts instead of reconnecting
+            "grpc.keepalive_time_ms": 30000,
+            "grpc.keepalive_permit_without_calls": 1,
+        },
+    }
+
+
+def search_params() -> Optional[models.SearchParams]:
+    """HNSW / quantization parameters for every search, or None to use the collection defaults."""
+    quantization = None
+    if settings.QDRANT_QUANTIZATION_OVERSAMPLING > 0:
+        quantization = models.QuantizationSearchParams(
+            rescore=settings.QDRANT_QUANTIZATION_RESCORE,
+            oversampling=settings.QDRANT_QUANTIZATION_OVERSAMPLING,
+        )
+    if not settings.QDRANT_HNSW_EF and not settings.QDRANT_EXACT and quantization is None:
+        return None
+    return models.SearchParams(
+        hnsw_ef=settings.QDRANT_HNSW_EF or None,
+        exact=settings.QDRANT_EXACT,
+        quantization=quantization,
+    )
+
+
+class QdrantClientPool:
+    """
+    Async Qdrant clients used round robin for searches.
+
+    With gRPC every client holds one HTTP/2 channel, which multiplexes a bounded
+    number of concurrent calls; a few channels spread the search fan-out of
+    concurrent requests. The first client is the shared `async_qdrant_client`.
+    """
+
+    def __init__(self, first: AsyncQdrantClient, size: int):
+        self.clients: List[AsyncQdrantClient] = [first] + [
+            AsyncQdrantClient(**client_options()) for _ in range(max(size, 1) - 1)
+        ]
+        self._next = itertools.cycle(self.clients)
+
+    def client(self) -> AsyncQdrantClient:
+        return next(self._next)
+
+    async def close(self) -> None:
+        for client in self.clients[1:]:
+            await client.close()
+
+
+# One point per collection whose payload changes whenever the collection's content does
+VERSIONS_COLLECTION = "_collection_versions"
+
+
+def _version_point_id(collection: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"collection-version:{collection}"))
+
+
+async def bump_collection_version(client: AsyncQdrantClient, collection: str) -> str:
+    """Record that `collection` changed, so answers cached against its previous version are dropped."""
+    if not await client.collection_exists(VERSIONS_COLLECTION):
+        try:
+            await client.create_collection(VERSIONS_COLLECTION, vectors_config=models.VectorParams(size=1, distance=models.Distance.DOT))
+        except Exception:
+            if not await client.collection_exists(VERSIONS_COLLECTION):
+                raise  # Anything but a concurrent run creating it first
+    version = uuid.uuid4().hex
+    await client.upsert(VERSIONS_COLLECTION, [models.PointStruct(
+        id=_version_point_id(collection),
+        vector=[1.0],
+        payload={"collection": collection, "version": version, "updated_at": time.time()},
+    )], wait=True)
+    return version
+
+
+async def collection_versions(client: AsyncQdrantClient, collections: Sequence[str]) -> List[str]:
+    """The version last recorded for each collection, or "" if it was never bumped."""
+    try:
+        points = await client.retrieve(VERSIONS_COLLECTION, [_version_point_id(name) for name in collections], with_payload=["version"])
+    except Exception:
+        # The versions collection only exists once something has been ingested
+        return [""] * len(collections)
+    versions = {str(point.id): (point.payload or {}).get("version", "") for point in points}
+    return [versions.get(_version_point_id(name), "") for name in collections]
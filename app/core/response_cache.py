@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from app.core.config import get_settings
+from app.core.model_registry import model_registry
+from app.core.metrics import stage
+from app.core.qdrant import collection_versions
+
+settings = get_settings()
+
+BucketKey = Tuple[str, str, str, str]
+
+
+@dataclass
+class CachedResponse:
+    response: str
+    articles: List[Dict[str, str]]
+    similarity: float = 1.0
+
+
+@dataclass
+class _Entry:
+    embedding: np.ndarray
+    response: str
+    articles: List[Dict[str, str]]
+    expires_at: float
+
+
+def _normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _prompt_key(system_prompt: Optional[str]) -> str:
+    # The prompt text identifies a SystemPrompt row as well as its id does
+    return hashlib.sha1((system_prompt or "").encode("utf-8")).hexdigest()[:16]
+
+
+class InMemoryCacheBackend:
+    """Per-process cache with a global LRU bound and per-entry TTL."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._buckets: Dict[BucketKey, "OrderedDict[str, _Entry]"] = {}
+        self._lru: "OrderedDict[str, BucketKey]" = OrderedDict()
+
+    async def lookup(self, bucket: BucketKey, embedding: np.ndarray, threshold: float) -> Optional[CachedResponse]:
+        entries = self._buckets.get(bucket)
+        if not entries:
+            return None
+
+        now = time.monotonic()
+        for entry_id in [entry_id for entry_id, entry in entries.items() if entry.expires_at <= now]:
+            self._remove(entry_id)
+        if not entries:
+            return None
+
+        ids = list(entries)
+        matrix = np.stack([entries[entry_id].embedding for entry_id in ids])
+        similarities = matrix @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < threshold:
+            return None
+
+        self._lru.move_to_end(ids[best])
+        entry = entries[ids[best]]
+        return CachedResponse(entry.response, entry.articles, float(similarities[best]))
+
+    async def store(self, bucket: BucketKey, embedding: np.ndarray, response: str, articles: List[Dict[str, str]]) -> None:
+        entry_id = uuid.uuid4().hex
+        self._buckets.setdefault(bucket, OrderedDict())[entry_id] = _Entry(
+            embedding, response, articles, time.monotonic() + self.ttl
+        )
+        self._lru[entry_id] = bucket
+        while len(self._lru) > self.max_entries:
+            self._remove(next(iter(self._lru)))
+
+    async def invalidate(self, collection: Optional[str] = None) -> None:
+        for bucket in list(self._buckets):
+            if collection is None or set(collection.split("+")) & set(bucket[2].split("+")):
+                for entry_id in list(self._buckets[bucket]):
+                    self._remove(entry_id)
+
+    def size(self) -> int:
+        return len(self._lru)
+
+    def _remove(self, entry_id: str) -> None:
+        bucket = self._lru.pop(entry_id, None)
+        if bucket is None:
+            return
+        entries = self._buckets[bucket]
+        entries.pop(entry_id, None)
+        if not entries:
+            del self._buckets[bucket]
+
+
+class RedisCacheBackend:
+    """
+    Cache shared by every worker, stored as one Redis hash per bucket.
+
+    Each bucket keeps at most `max_per_bucket` entries (oldest evicted first)
+    and expires `ttl` seconds after its last write.
+    """
+
+    def __init__(self, url: str, ttl: float, max_per_bucket: int = 256):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("SEMANTIC_CACHE_BACKEND=redis requires the 'redis' package") from e
+        self._redis = redis.from_url(url)
+        self.ttl = ttl
+        self.max_per_bucket = max_per_bucket
+
+    @staticmethod
+    def _key(bucket: BucketKey) -> str:
+        return "udllm:response-cache:" + ":".join(bucket)
+
+    async def lookup(self, bucket: BucketKey, embedding: np.ndarray, threshold: float) -> Optional[CachedResponse]:
+        raw = await self._redis.hgetall(self._key(bucket))
+        best, best_similarity = None, threshold
+        now = time.time()
+        for value in raw.values():
+            entry = json.loads(value)
+            if entry["expires_at"] <= now:
+                continue
+            similarity = float(np.asarray(entry["embedding"], dtype=np.float32) @ embedding)
+            if similarity >= best_similarity:
+                best, best_similarity = entry, similarity
+        if best is None:
+            return None
+        return CachedResponse(best["response"], best["articles"], best_similarity)
+
+    async def store(self, bucket: BucketKey, embedding: np.ndarray, response: str, articles: List[Dict[str, str]]) -> None:
+        key = self._key(bucket)
+        now = time.time()
+        entry = {
+            "embedding": embedding.tolist(),
+            "response": response,
+            "articles": articles,
+            "created_at": now,
+            "expires_at": now + self.ttl,
+        }
+        await self._redis.hset(key, uuid.uuid4().hex, json.dumps(entry))
+        await self._redis.expire(key, int(self.ttl))
+
+        if await self._redis.hlen(key) > self.max_per_bucket:
+            raw = await self._redis.hgetall(key)
+            oldest = sorted(raw, key=lambda entry_id: json.loads(raw[entry_id])["created_at"])
+            await self._redis.hdel(key, *oldest[: len(raw) - self.max_per_bucket])
+
+    async def invalidate(self, collection: Optional[str] = None) -> None:
+        pattern = self._key(("*", "*", f"*{collection}*" if collection else "*", "*"))
+        async for key in self._redis.scan_iter(match=pattern):
+            await self._redis.delete(key)
+
+    def size(self) -> int:
+        return -1  # Not tracked for the shared backend
+
+
+class SemanticResponseCache:
+    """
+    Response cache keyed on mode, system prompt and query embedding.
+
+    A lookup returns the cached answer of the most similar previous query in the
+    same bucket when cosine similarity reaches SEMANTIC_CACHE_THRESHOLD. Buckets
+    also carry a fingerprint of the Qdrant collection (its point count), so any
+    upsert or delete in `articles` / `satirical_articles` makes older entries
+    unreachable in every worker; the in-process backend also drops them.
+    """
+
+    def __init__(self):
+        self.enabled = settings.SEMANTIC_CACHE_ENABLED
+        self.threshold = settings.SEMANTIC_CACHE_THRESHOLD
+        if settings.SEMANTIC_CACHE_BACKEND == "redis":
+            self.backend = RedisCacheBackend(settings.SEMANTIC_CACHE_REDIS_URL, settings.SEMANTIC_CACHE_TTL)
+        else:
+            self.backend = InMemoryCacheBackend(settings.SEMANTIC_CACHE_MAX_ENTRIES, settings.SEMANTIC_CACHE_TTL)
+        self._fingerprints: Dict[str, Tuple[str, float]] = {}
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+        self._lookup_seconds = 0.0
+
+    async def _fingerprint(self, collection: str) -> str:
+        cached = self._fingerprints.get(collection)
+        now = time.monotonic()
+        if cached and now - cached[1] < settings.SEMANTIC_CACHE_CHECK_INTERVAL:
+            return cached[0]
+
+        # A multi-collection scope ("articles+wire") changes when any of its collections does
+        # Point counts catch any write; the version marker catches in-place rewrites by the ingestion pipeline
+        client = model_registry.get("async_qdrant_client")
+        names = collection.split("+")
+        infos, versions = await asyncio.gather(
+            asyncio.gather(*(client.get_collection(name) for name in names)),
+            collection_versions(client, names),
+        )
+        fingerprint = "-".join(f"{info.points_count}:{version}" for info, version in zip(infos, versions))
+        if cached and cached[0] != fingerprint:
+            await self.invalidate(collection)
+        self._fingerprints[collection] = (fingerprint, now)
+        return fingerprint
+
+    async def _bucket(self, mode: str, system_prompt: Optional[str], collection: str) -> BucketKey:
+        return (mode, _prompt_key(system_prompt), collection, await self._fingerprint(collection))
+
+    async def lookup(self, mode: str, system_prompt: Optional[str], collection: str, embedding) -> Optional[CachedResponse]:
+        if not self.enabled:
+            return None
+        started = time.perf_counter()
+        try:
+            with stage("cache_lookup"):
+                bucket = await self._bucket(mode, system_prompt, collection)
+                hit = await self.backend.lookup(bucket, _normalize(embedding), self.threshold)
+        finally:
+            self._lookup_seconds += time.perf_counter() - started
+        self._stats["hits" if hit else "misses"] += 1
+        return hit
+
+    async def store(self, mode: str, system_prompt: Optional[str], collection: str, embedding, response: str, articles: List[Any]) -> None:
+        if not self.enabled:
+            return
+        bucket = await self._bucket(mode, system_prompt, collection)
+        await self.backend.store(
+            bucket,
+            _normalize(embedding),
+            response,
+            [article.model_dump() if hasattr(article, "model_dump") else dict(article) for article in articles],
+        )
+        self._stats["stores"] += 1
+
+    async def invalidate(self, collection: Optional[str] = None) -> None:
+        await self.backend.invalidate(collection)
+        self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "enabled": self.enabled,
+            "backend": settings.SEMANTIC_CACHE_BACKEND,
+            "entries": self.backend.size(),
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            "avg_lookup_ms": round(1000 * self._lookup_seconds / lookups, 3) if lookups else 0.0,
+        }
+
+
+response_cache = SemanticResponseCache()
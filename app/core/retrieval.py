@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import math
+import re
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core.schema import NodeWithScore, TextNode
+from qdrant_client import models
+from app.core.config import get_settings
+from app.core.metrics import stage
+from app.core.model_registry import model_registry
+from app.core.qdrant import search_params
+
+settings = get_settings()
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what when where "
+    "which who why will with about how did does do".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def bm25_scores(query: str, documents: Sequence[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """
+    Score documents against a query with Okapi BM25.
+
+    Document frequencies come from `documents` themselves, so this is meant for
+    reranking a candidate pool rather than searching a whole corpus.
+
+    Args:
+        query (str): The query text
+        documents (Sequence[str]): Candidate texts
+        k1 (float): Term frequency saturation
+        b (float): Length normalisation
+
+    Returns:
+        List[float]: One score per document, in order
+    """
+    terms = set(tokenize(query))
+    tokenized = [tokenize(document) for document in documents]
+    if not terms or not tokenized:
+        return [0.0] * len(documents)
+
+    avg_length = sum(len(tokens) for tokens in tokenized) / len(tokenized) or 1.0
+    df = Counter(term for tokens in tokenized for term in set(tokens) & terms)
+    idf = {term: math.log(1 + (len(tokenized) - df[term] + 0.5) / (df[term] + 0.5)) for term in terms}
+
+    scores = []
+    for tokens in tokenized:
+        tf = Counter(token for token in tokens if token in terms)
+        norm = k1 * (1 - b + b * len(tokens) / avg_length)
+        scores.append(sum(idf[term] * count * (k1 + 1) / (count + norm) for term, count in tf.items()))
+    return scores
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> Dict[str, float]:
+    """
+    Fuse several rankings of the same items.
+
+    Args:
+        rankings (Sequence[Sequence[str]]): Item keys, best first, one list per ranking
+        k (int): Damping constant; larger values flatten the contribution of top ranks
+
+    Returns:
+        Dict[str, float]: Fused score per item key
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return fused
+
+
+@dataclass(frozen=True)
+class RetrievalFilters:
+    """Metadata filters applied inside Qdrant on RETRIEVAL_SOURCE_FIELD and RETRIEVAL_DATE_FIELD."""
+
+    sources: Optional[tuple] = None
+    published_after: Optional[datetime] = None
+    published_before: Optional[datetime] = None
+
+    @classmethod
+    def build(cls, sources: Optional[List[str]] = None, published_after: Optional[datetime] = None, published_before: Optional[datetime] = None) -> Optional["RetrievalFilters"]:
+        if not sources and published_after is None and published_before is None:
+            return None
+        return cls(tuple(sorted(sources)) if sources else None, published_after, published_before)
+
+    def to_qdrant(self) -> models.Filter:
+        conditions = []
+        if self.sources:
+            conditions.append(models.FieldCondition(key=settings.RETRIEVAL_SOURCE_FIELD, match=models.MatchAny(any=list(self.sources))))
+        if self.published_after is not None or self.published_before is not None:
+            conditions.append(models.FieldCondition(
+                key=settings.RETRIEVAL_DATE_FIELD,
+                range=models.DatetimeRange(gte=self.published_after, lte=self.published_before),
+            ))
+        return models.Filter(must=conditions)
+
+    def cache_key(self) -> str:
+        """Suffix that keeps cached answers for different filters apart."""
+        parts = [
+            ",".join(self.sources or ()),
+            self.published_after.isoformat() if self.published_after else "",
+            self.published_before.isoformat() if self.published_before else "",
+        ]
+        return "|" + "|".join(parts)
+
+
+class SearchCache:
+    """
+    Short-lived cache of search hits per collection, query vector, filters and limit.
+
+    Query embeddings are themselves cached, so a repeated question produces the
+    same vector and hits here for RETRIEVAL_CACHE_TTL seconds. Least recently
+    used entries are dropped beyond RETRIEVAL_CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, List[NodeWithScore]]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(collection: str, embedding: List[float], filters: Optional["RetrievalFilters"], limit: int) -> str:
+        digest = hashlib.blake2b(np.asarray(embedding, dtype=np.float32).tobytes(), digest_size=16).hexdigest()
+        return f"{collection}|{limit}|{digest}{filters.cache_key() if filters else ''}"
+
+    def get(self, key: str) -> Optional[List[NodeWithScore]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return entry[1]
+
+    def put(self, key: str, nodes: List[NodeWithScore]) -> None:
+        if self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, nodes)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self, collection: Optional[str] = None) -> None:
+        for key in [key for key in self._entries if collection is None or key.startswith(collection + "|")]:
+            del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "entries": len(self._entries)}
+
+
+search_cache = SearchCache(settings.RETRIEVAL_CACHE_TTL, settings.RETRIEVAL_CACHE_MAX_ENTRIES)
+
+
+class RetrievalEngine:
+    """
+    Fan-out retrieval over one or more Qdrant collections.
+
+    Each collection is searched concurrently with the precomputed query
+    embedding, over-fetching RETRIEVAL_CANDIDATE_MULTIPLIER x top_k candidates.
+    Searches go straight to Qdrant through the shared client pool, fetch only
+    RETRIEVAL_PAYLOAD_FIELDS (not the serialized node llama_index stores next to
+    them) and are cached briefly in `search_cache`.
+    With RETRIEVAL_HYBRID the pooled candidates are also ranked with BM25, and
+    all rankings (one dense ranking per collection plus BM25) are combined with
+    reciprocal rank fusion. Chunks from the same article URL are then collapsed
+    to at most RETRIEVAL_MAX_CHUNKS_PER_ARTICLE before the top_k are returned.
+    """
+
+    def __init__(self, collections: Sequence[str], top_k: int):
+        self.collections = list(collections)
+        self.top_k = top_k
+        self.pool = model_registry.get("qdrant_search_pool")
+        self.payload_fields = [field.strip() for field in settings.RETRIEVAL_PAYLOAD_FIELDS.split(",") if field.strip()]
+        self.search_params = search_params()
+
+    @property
+    def scope(self) -> str:
+        """Name used to key caches on the set of collections searched."""
+        return "+".join(self.collections)
+
+    async def check(self) -> None:
+        """Raise if any collection is unreachable."""
+        client = model_registry.get("async_qdrant_client")
+        await asyncio.gather(*(client.get_collection(collection) for collection in self.collections))
+
+    async def aretrieve(self, query: str, embedding: List[float], filters: Optional[RetrievalFilters] = None, top_k: Optional[int] = None) -> List[NodeWithScore]:
+        """
+        Retrieve, fuse and dedupe nodes for a query.
+
+        Args:
+            query (str): The query text, used for BM25
+            embedding (List[float]): The query embedding
+            filters (RetrievalFilters, optional): Metadata filters
+            top_k (int, optional): Number of nodes to return; defaults to the engine's top_k
+
+        Returns:
+            List[NodeWithScore]: The best nodes, scored by fused rank
+        """
+        top_k = top_k or self.top_k
+        candidates = top_k * settings.RETRIEVAL_CANDIDATE_MULTIPLIER
+        qdrant_filter = filters.to_qdrant() if filters else None
+
+        with stage("qdrant_search"):
+            results = await asyncio.gather(*(
+                self._asearch(collection, embedding, candidates, filters, qdrant_filter)
+                for collection in self.collections
+            ))
+
+        with stage("rerank"):
+            return self._fuse(query, results, top_k)
+
+    async def _asearch(self, collection: str, embedding: List[float], limit: int, filters: Optional[RetrievalFilters], qdrant_filter: Optional[models.Filter]) -> List[NodeWithScore]:
+        key = search_cache.key(collection, embedding, filters, limit)
+        cached = search_cache.get(key)
+        if cached is not None:
+            return cached
+
+        response = await self.pool.client().query_points(
+            collection,
+            query=embedding,
+            using=settings.RETRIEVAL_VECTOR_NAME or None,
+            query_filter=qdrant_filter,
+            search_params=self.search_params,
+            limit=limit,
+            with_payload=self.payload_fields,
+        )
+        nodes = [NodeWithScore(node=self._node(point), score=point.score) for point in response.points]
+        search_cache.put(key, nodes)
+        return nodes
+
+    @staticmethod
+    def _node(point: models.ScoredPoint) -> TextNode:
+        payload = dict(point.payload or {})
+        text = payload.pop("content", "") or ""
+        return TextNode(id_=str(point.id), text=text, metadata=payload)
+
+    def _fuse(self, query: str, results: List[List[NodeWithScore]], top_k: int) -> List[NodeWithScore]:
+        pool: Dict[str, NodeWithScore] = {}
+        rankings = []
+        for collection, nodes in zip(self.collections, results):
+            ranking = []
+            for node in nodes:
+                key = f"{collection}:{node.node.node_id}"
+                pool.setdefault(key, node)
+                ranking.append(key)
+            rankings.append(ranking)
+
+        if not pool:
+            return []
+
+        if settings.RETRIEVAL_HYBRID:
+            keys = list(pool)
+            scores = bm25_scores(query, [pool[key].node.get_content() for key in keys])
+            rankings.append([key for key, score in sorted(zip(keys, scores), key=lambda pair: -pair[1]) if score > 0])
+
+        fused = reciprocal_rank_fusion(rankings, settings.RETRIEVAL_RRF_K)
+        selected: List[NodeWithScore] = []
+        per_article: Dict[str, int] = {}
+        for key in sorted(fused, key=fused.get, reverse=True):
+            node = pool[key]
+            article = node.node.metadata.get("url") or key
+            if per_article.get(article, 0) >= settings.RETRIEVAL_MAX_CHUNKS_PER_ARTICLE:
+                continue
+            per_article[article] = per_article.get(article, 0) + 1
+            selected.append(NodeWithScore(node=node.node, score=fused[key]))
+            if len(selected) >= top_k:
+                break
+        return selected
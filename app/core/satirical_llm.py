@@ -1,105 +1,130 @@
-from llama_index.core import VectorStoreIndex
-from llama_index.vector_stores.qdrant import QdrantVectorStore
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.llms.ollama import Ollama
-from llama_index.core.base.query_pipeline.query import QueryBundle
-from qdrant_client import QdrantClient
+from llama_index.core.schema import NodeWithScore
 from app.core.config import get_settings
-from typing import List, Tuple, Optional
+from app.core.llm_gateway import GatewayLLM
+from app.core.model_registry import model_registry
+from typing import AsyncIterator, Dict, List, Tuple, Optional
 from pydantic import BaseModel
-from app.core.llm import ArticleMetadata
-from detoxify import Detoxify
+from app.core.llm import ArticleMetadata, extract_articles
+from app.core.toxicity import toxicity_scorer
+from app.core.metrics import stage
+from app.core.embedding_service import embedding_service
+from app.core.streaming import StreamEvent, moderated_stream
+from app.core.context_packer import context_packer
+from app.core.response_cache import response_cache
+from app.core.retrieval import RetrievalEngine, RetrievalFilters
 settings = get_settings()
 
 
+NO_INSPIRATION_RESPONSE = "I couldn't find any satirical inspiration for this topic. Maybe it's too serious?"
+CACHE_MODE = "satirical"
+
+# Instructions that encourage satirical responses, sent as the system message
+SATIRICAL_INSTRUCTIONS = (
+    "You are a witty and satirical AI assistant. "
+    "Use the following context to create a humorous and satirical response "
+    "while maintaining a light-hearted tone. "
+    "Make sure to incorporate elements from the provided articles "
+    "in a clever and entertaining way.\n\n"
+    "Include emojis in your response to make it more engaging and fun"
+)
+
+
 class SatiricalLLMService:
+    TOXICITY_THRESHOLD = 0.6
+
     def __init__(self):
-        # Initialize Qdrant client
-        self.qdrant_client = QdrantClient(url=settings.QDRANT_URL, prefer_grpc=False)
+        # Fan-out retrieval over the satirical collections, fewer nodes for more focused results
+        self.retriever = RetrievalEngine(settings.SATIRICAL_RETRIEVAL_COLLECTIONS.split(","), top_k=3)
         
-        # Initialize vector store for satirical articles
-        self.vector_store = QdrantVectorStore(
-            client=self.qdrant_client,
-            collection_name="satirical_articles",
-            text_key="content",
-        )
-        
-        # Initialize embedding model
-        self.embed_model = HuggingFaceEmbedding(model_name=settings.EMBEDDING_MODEL)
-        
-        # Initialize index
-        self.index = VectorStoreIndex.from_vector_store(
-            vector_store=self.vector_store,
-            embed_model=self.embed_model
-        )
+        # Shared embedding model
+        self.embed_model = model_registry.get("embed_model")
         
-        # Initialize Ollama LLM with higher temperature for more creative responses
-        self.llm = Ollama(
-            model=settings.OLLAMA_MODEL,
-            request_timeout=120.0,
+        # Ollama LLM through the shared gateway, with higher temperature for more creative responses
+        self.llm = GatewayLLM(
             temperature=0.9,  # Higher temperature for more creative/satirical responses
             context_window=4096,
         )
-        
-        # Initialize query engine
-        self.query_engine = self.index.as_query_engine(
-            similarity_top_k=3,  # Reduced to get more focused results
-            llm=self.llm
-        )
 
-    def generate_satirical_response(self, query: str, system_prompt: str = None, context: Optional[str] = None) -> Tuple[str, List[ArticleMetadata]]:
+
+    async def agenerate_satirical_response(self, query: str, system_prompt: str = None, context: Optional[str] = None, filters: Optional[RetrievalFilters] = None) -> Tuple[str, List[ArticleMetadata]]:
         """
         Generate a satirical response based on the user's query and relevant satirical articles.
         
         Args:
             query (str): The user's query
             system_prompt (str, optional): Additional context or instructions for the LLM
+            filters (RetrievalFilters, optional): Source / date filters for retrieval
             
         Returns:
             Tuple[str, List[SatiricalArticleMetadata]]: The satirical response and list of referenced articles
         """
-        # Construct a prompt that encourages satirical responses
-        satirical_prompt = (
-            "You are a witty and satirical AI assistant. "
-            "Use the following context to create a humorous and satirical response "
-            "while maintaining a light-hearted tone. "
-            "Make sure to incorporate elements from the provided articles "
-            "in a clever and entertaining way.\n\n"
-            "Include emojis in your response to make it more engaging and fun"
-        )
-        
-        if system_prompt:
-            satirical_prompt += system_prompt + "\n\n"
-        
-        if context:
-            satirical_prompt += context + "\n\n"
-        else:
-            satirical_prompt += query + "\n\n"
-        
-        # Retrieve relevant nodes
-        nodes = self.query_engine.retrieve(satirical_prompt + query)
-        nodes = [node for node in nodes if node]
+        mode = self._cache_mode(filters)
+        question, embedding = await self._aembed(query, context)
+        hit = await response_cache.lookup(mode, system_prompt, self.retriever.scope, embedding)
+        if hit:
+            return hit.response, [ArticleMetadata(**article) for article in hit.articles]
+
+        nodes = await self._aretrieve(question, embedding, filters)
 
         if not nodes:
-            return "I couldn't find any satirical inspiration for this topic. Maybe it's too serious?", []
-
-        # Extract metadata from nodes
-        articles = []
-        for node in nodes:
-            if hasattr(node, 'metadata') and node.metadata:
-                metadata = node.metadata
-                if 'title' in metadata and 'url' in metadata:
-                    articles.append(ArticleMetadata(
-                        title=metadata['title'],
-                        url=metadata['url'],
-                    ))
-        query_bundle = QueryBundle(query_str=satirical_prompt + query)
-        response = self.query_engine.synthesize(nodes=nodes, query_bundle=query_bundle)
-        response = self._detoxify(str(response))
+            return NO_INSPIRATION_RESPONSE, []
+
+        articles = extract_articles(nodes)
+        messages, _ = context_packer.build_messages(self.llm, question, nodes, self._instructions(system_prompt), CACHE_MODE)
+        with stage("llm_synthesis"):
+            response = await self.llm.achat(messages)
+        response = await self._adetoxify(response.message.content or "")
+        await response_cache.store(mode, system_prompt, self.retriever.scope, embedding, response, articles)
         
         return str(response), articles
+
+    async def astream_satirical_response(self, query: str, system_prompt: str = None, context: Optional[str] = None, filters: Optional[RetrievalFilters] = None) -> AsyncIterator[StreamEvent]:
+        """
+        Stream a satirical response as events: the articles once retrieval finishes, then tokens.
+
+        Yields:
+            StreamEvent: ("articles", List[ArticleMetadata]), ("token", str), ("retract", scores) and ("done", str)
+        """
+        mode = self._cache_mode(filters)
+        question, embedding = await self._aembed(query, context)
+        hit = await response_cache.lookup(mode, system_prompt, self.retriever.scope, embedding)
+        if hit:
+            yield "articles", [ArticleMetadata(**article) for article in hit.articles]
+            yield "token", hit.response
+            yield "done", hit.response
+            return
+
+        nodes = await self._aretrieve(question, embedding, filters)
+        articles = extract_articles(nodes)
+        yield "articles", articles
+
+        if not nodes:
+            yield "token", NO_INSPIRATION_RESPONSE
+            yield "done", NO_INSPIRATION_RESPONSE
+            return
+
+        messages, _ = context_packer.build_messages(self.llm, question, nodes, self._instructions(system_prompt), CACHE_MODE)
+        async for event, data in moderated_stream(self.llm, messages, self._score_toxicity, self.TOXICITY_THRESHOLD, self._rewrite_prompt):
+            if event == "done":
+                await response_cache.store(mode, system_prompt, self.retriever.scope, embedding, data, articles)
+            yield event, data
+
+    async def _aembed(self, query: str, context: Optional[str] = None) -> Tuple[str, List[float]]:
+        # Embed only what the user asked: the satirical instructions add nothing to
+        # the search but dilute the query vector and defeat the embedding cache
+        question = f"{context}\n\n{query}" if context else query
+        return question, await embedding_service.aget_query_embedding(question)
+
+    def _instructions(self, system_prompt: Optional[str] = None) -> str:
+        return f"{SATIRICAL_INSTRUCTIONS}\n\n{system_prompt}" if system_prompt else SATIRICAL_INSTRUCTIONS
+
+    async def _aretrieve(self, query: str, embedding: List[float], filters: Optional[RetrievalFilters] = None) -> List[NodeWithScore]:
+        return await self.retriever.aretrieve(query, embedding, filters)
+
+    def _cache_mode(self, filters: Optional[RetrievalFilters]) -> str:
+        return CACHE_MODE + filters.cache_key() if filters else CACHE_MODE
     
-    def _detoxify(self, text: str) -> str:
+    async def _adetoxify(self, text: str) -> str:
             """
             Detoxify the input text using the Detoxify library.
 
@@ -109,14 +134,17 @@ class SatiricalLLMService:
             Returns:
                 str: The detoxified text.
             """
-            detoxifier = Detoxify('original')
-            toxicityResult = detoxifier.predict(text)
-            if any(value > 0.6 for value in toxicityResult.values()):
-                toxicityResultString = ", ".join([f"{key} is {round(float(value), 2)}" for key, value in toxicityResult.items()])
-                response = self.llm.complete(f"Toxicity analysis detected problematic content ({toxicityResultString}). Rewrite the following text using respectful language while preserving the essential meaning and include emojis and keep the satirical and light-hearted tone: {text}")
+            toxicityResult = await self._score_toxicity(text)
+            if any(value > self.TOXICITY_THRESHOLD for value in toxicityResult.values()):
+                with toxicity_scorer.stages.time("rewrite"):
+                    response = await self.llm.acomplete(self._rewrite_prompt(toxicityResult, text))
                 return str(response)
 
             return text
 
+    async def _score_toxicity(self, text: str) -> Dict[str, float]:
+        return await toxicity_scorer.score(text)
 
-satirical_llm_service = SatiricalLLMService() 
\ No newline at end of file
+    def _rewrite_prompt(self, toxicityResult: Dict[str, float], text: str) -> str:
+        toxicityResultString = ", ".join([f"{key} is {round(float(value), 2)}" for key, value in toxicityResult.items()])
+        return f"Toxicity analysis detected problematic content ({toxicityResultString}). Rewrite the following text using respectful language while preserving the essential meaning and include emojis and keep the satirical and light-hearted tone: {text}"
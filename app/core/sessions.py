@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.llms import LLM, ChatMessage, MessageRole
+from llama_index.core.schema import NodeWithScore
+from app.core.config import get_settings
+from app.core.context_packer import count_tokens
+from app.core.metrics import stage
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and a news assistant. "
+    "Merge the new exchanges into the existing summary. Keep names, places, dates and open questions; "
+    "drop pleasantries. Reply with the summary only, in at most {words} words."
+)
+
+
+@dataclass
+class Turn:
+    role: MessageRole
+    content: str
+    tokens: int
+
+
+class ConversationSession:
+    """
+    Server-side state of one conversation.
+
+    Holds the recent turns (within SESSION_HISTORY_TOKENS, older ones folded
+    into `summary`), the system prompt chosen on the first turn, and the nodes
+    retrieved so far (at most SESSION_MAX_NODES) so follow-up questions can
+    reuse them. `lock` serialises turns of the same session.
+    """
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.turns: List[Turn] = []
+        self.summary = ""
+        self.system_prompt: Optional[str] = None
+        self.system_prompt_id: Optional[int] = None
+        self.nodes: List[NodeWithScore] = []
+        self.filters_key: Optional[str] = None
+        self.last_embedding: Optional[List[float]] = None
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.compaction: Optional[asyncio.Task] = None
+        self.stats = {"turns": 0, "retrievals": 0, "retrievals_reused": 0, "compactions": 0}
+
+    @property
+    def history_tokens(self) -> int:
+        return sum(turn.tokens for turn in self.turns)
+
+    def history_messages(self) -> List[ChatMessage]:
+        return [ChatMessage(role=turn.role, content=turn.content) for turn in self.turns]
+
+    def last_question(self) -> Optional[str]:
+        return next((turn.content for turn in reversed(self.turns) if turn.role == MessageRole.USER), None)
+
+    def can_reuse(self, embedding: List[float], filters_key: str) -> bool:
+        """True when the new question is close enough to the last one to answer from the same nodes."""
+        if not self.nodes or self.last_embedding is None or filters_key != self.filters_key:
+            return False
+        a, b = np.asarray(embedding), np.asarray(self.last_embedding)
+        denominator = float(np.linalg.norm(a) * np.linalg.norm(b)) or 1.0
+        return float(a @ b) / denominator >= settings.SESSION_REUSE_THRESHOLD
+
+    def remember_nodes(self, nodes: List[NodeWithScore], embedding: List[float], filters_key: str) -> List[NodeWithScore]:
+        """Merge fresh nodes in front of the ones kept from earlier turns and return the merged list."""
+        if filters_key != self.filters_key:
+            self.nodes = []
+        merged: Dict[str, NodeWithScore] = {}
+        for node in [*nodes, *self.nodes]:
+            merged.setdefault(node.node.node_id, node)
+        self.nodes = list(merged.values())[:settings.SESSION_MAX_NODES]
+        self.last_embedding = embedding
+        self.filters_key = filters_key
+        return self.nodes
+
+    def record(self, question: str, answer: str) -> None:
+        self.turns.append(Turn(MessageRole.USER, question, count_tokens(question)))
+        self.turns.append(Turn(MessageRole.ASSISTANT, answer, count_tokens(answer)))
+        self.stats["turns"] += 1
+        self.last_used = time.monotonic()
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "session_id": self.id,
+            "created_at": self.created_at,
+            "history_turns": len(self.turns),
+            "history_tokens": self.history_tokens,
+            "summary": self.summary,
+            "nodes": len(self.nodes),
+            "system_prompt_id": self.system_prompt_id,
+        }
+
+
+class SessionStore:
+    """
+    In-process conversation sessions with memory limits.
+
+    At most SESSION_MAX_COUNT sessions are kept (least recently used evicted
+    first) and sessions idle for SESSION_IDLE_TTL seconds are dropped by a
+    background sweep. After each turn, once a session's history exceeds
+    SESSION_HISTORY_TOKENS the oldest turns are summarised into its rolling
+    summary in the background; the next turn waits for that to finish.
+
+    Sessions live in the worker that created them. Pre-forked workers share one
+    socket, so a follow-up turn could land on any of them; with more than one
+    worker the store is disabled and the session endpoints answer 501.
+    """
+
+    def __init__(self):
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self.enabled = True
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._stats = {"created": 0, "evicted_idle": 0, "evicted_capacity": 0, "compactions": 0, "compaction_errors": 0}
+
+    def create(self) -> ConversationSession:
+        session = ConversationSession(uuid.uuid4().hex)
+        self._sessions[session.id] = session
+        self._stats["created"] += 1
+        while len(self._sessions) > settings.SESSION_MAX_COUNT:
+            _, evicted = self._sessions.popitem(last=False)
+            self._discard(evicted)
+            self._stats["evicted_capacity"] += 1
+        return session
+
+    def get(self, session_id: str) -> ConversationSession:
+        """
+        Look up a live session.
+
+        Raises:
+            KeyError: The session does not exist or has expired
+        """
+        session = self._sessions.get(session_id)
+        if session is None or time.monotonic() - session.last_used > settings.SESSION_IDLE_TTL:
+            raise KeyError(session_id)
+        self._sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._discard(session)
+        return session is not None
+
+    def _discard(self, session: ConversationSession) -> None:
+        if session.compaction is not None:
+            session.compaction.cancel()
+
+    def evict_idle(self) -> int:
+        cutoff = time.monotonic() - settings.SESSION_IDLE_TTL
+        idle = [session_id for session_id, session in self._sessions.items() if session.last_used < cutoff and not session.lock.locked()]
+        for session_id in idle:
+            self._discard(self._sessions.pop(session_id))
+        self._stats["evicted_idle"] += len(idle)
+        return len(idle)
+
+    async def ready(self, session: ConversationSession) -> None:
+        """Wait for a compaction scheduled by the previous turn."""
+        if session.compaction is not None:
+            try:
+                await session.compaction
+            except Exception:
+                pass  # Already logged; a failed compaction leaves the turns in the history
+            session.compaction = None
+
+    def schedule_compaction(self, session: ConversationSession, llm: LLM) -> None:
+        if session.history_tokens > settings.SESSION_HISTORY_TOKENS:
+            session.compaction = asyncio.create_task(self.compact(session, llm))
+
+    async def compact(self, session: ConversationSession, llm: LLM) -> None:
+        """
+        Fold the oldest turns into the session summary until the history is within half its budget.
+
+        Args:
+            session (ConversationSession): The session to compact
+            llm (LLM): The model that writes the summary
+        """
+        excess = session.history_tokens - settings.SESSION_HISTORY_TOKENS // 2
+        count = 0
+        while count < len(session.turns) and excess > 0:
+            # Turns are folded in question/answer pairs so the history never starts with an answer
+            excess -= sum(turn.tokens for turn in session.turns[count:count + 2])
+            count += 2
+        folded: List[Turn] = session.turns[:count]
+        if not folded:
+            return
+
+        transcript = "\n".join(f"{turn.role.value.capitalize()}: {turn.content}" for turn in folded)
+        messages = [
+            ChatMessage(role=MessageRole.SYSTEM, content=SUMMARY_INSTRUCTIONS.format(words=settings.SESSION_SUMMARY_TOKENS * 3 // 4)),
+            ChatMessage(role=MessageRole.USER, content=f"Summary so far:\n{session.summary or '(none)'}\n\nNew exchanges:\n{transcript}"),
+        ]
+        try:
+            with stage("session_summary"):
+                response = await llm.achat(messages)
+            summary = (response.message.content or "").strip()
+        except Exception as e:
+            self._stats["compaction_errors"] += 1
+            logger.warning("Failed to summarise session %s, keeping %d turns: %s", session.id, len(folded), e)
+            return
+        # The next turn waits for this task, so nothing was added to the history meanwhile
+        del session.turns[:len(folded)]
+        session.summary = self._truncate(summary, settings.SESSION_SUMMARY_TOKENS)
+        session.stats["compactions"] += 1
+        self._stats["compactions"] += 1
+
+    @staticmethod
+    def _truncate(text: str, max_tokens: int) -> str:
+        words = text.split()
+        while words and count_tokens(" ".join(words)) > max_tokens:
+            words = words[:int(len(words) * 0.9)]
+        return " ".join(words)
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, settings.SESSION_IDLE_TTL / 10))
+            self.evict_idle()
+
+    async def start(self) -> None:
+        if self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            try:
+                await self._sweep_task
+            except asyncio.CancelledError:
+                pass
+            self._sweep_task = None
+        for session in self._sessions.values():
+            self._discard(session)
+
+    def stats(self) -> Dict[str, Any]:
+        sessions = list(self._sessions.values())
+        return {
+            **self._stats,
+            "active": len(sessions),
+            "history_tokens": sum(session.history_tokens for session in sessions),
+            "cached_nodes": sum(len(session.nodes) for session in sessions),
+        }
+
+
+session_store = SessionStore()
@@ -0,0 +1,153 @@
+import asyncio
+import re
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from llama_index.core.llms import ChatMessage, LLM, MessageRole
+from llama_index.core.prompts.default_prompt_selectors import DEFAULT_TEXT_QA_PROMPT_SEL
+from app.core.metrics import observe_stage
+
+# A sentence ends at ., ! or ? (optionally followed by a closing quote/bracket) and whitespace
+SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]?\s+")
+
+StreamEvent = Tuple[str, Any]
+
+
+def qa_messages(llm: LLM, context_str: str, query_str: str, system_prompt: Optional[str] = None) -> List[ChatMessage]:
+    """Format the default text-QA prompt, with the system prompt folded into its system message."""
+    messages = DEFAULT_TEXT_QA_PROMPT_SEL.select(llm).format_messages(
+        llm=llm,
+        context_str=context_str,
+        query_str=query_str,
+    )
+    if system_prompt:
+        if messages and messages[0].role == MessageRole.SYSTEM:
+            messages[0] = ChatMessage(role=MessageRole.SYSTEM, content=f"{system_prompt}\n\n{messages[0].content}")
+        else:
+            messages.insert(0, ChatMessage(role=MessageRole.SYSTEM, content=system_prompt))
+    return messages
+
+
+def conversation_messages(llm: LLM, context_str: str, query_str: str, history: Sequence[ChatMessage], system_prompt: Optional[str] = None, summary: Optional[str] = None) -> List[ChatMessage]:
+    """
+    Format the text-QA prompt for one turn of a conversation.
+
+    Earlier turns go between the system message and the new question, and the
+    retrieved context only appears in the last message, so everything before it
+    is identical from one turn to the next and the model server can reuse its
+    cached prompt prefix.
+    """
+    messages = qa_messages(llm, context_str, query_str, system_prompt)
+    system, turn = (messages[:1], messages[1:]) if messages and messages[0].role == MessageRole.SYSTEM else ([], messages)
+    if summary:
+        content = system[0].content if system else ""
+        system = [ChatMessage(role=MessageRole.SYSTEM, content=f"{content}\n\nSummary of the conversation so far:\n{summary}".strip())]
+    return [*system, *history, *turn]
+
+
+class SentenceWindows:
+    """
+    Split a token stream into overlapping windows of complete sentences.
+
+    Every completed sentence produces one window made of it and the
+    `size - 1` sentences before it, so toxicity spanning a boundary is still seen.
+    """
+
+    def __init__(self, size: int = 2):
+        self.size = size
+        self.sentences: List[str] = []
+        self.pending = ""
+
+    def feed(self, delta: str) -> List[str]:
+        self.pending += delta
+        parts = SENTENCE_END.split(self.pending)
+        self.pending = parts.pop()
+        windows = []
+        for sentence in parts:
+            if sentence.strip():
+                self.sentences.append(sentence)
+                windows.append(" ".join(self.sentences[-self.size:]))
+        return windows
+
+    def flush(self) -> Optional[str]:
+        if not self.pending.strip():
+            return None
+        self.sentences.append(self.pending)
+        self.pending = ""
+        return " ".join(self.sentences[-self.size:])
+
+
+def _flagged(checks: Sequence[asyncio.Future], threshold: float) -> Optional[Dict[str, float]]:
+    for check in checks:
+        if check.done():
+            scores = check.result()
+            if any(value > threshold for value in scores.values()):
+                return scores
+    return None
+
+
+async def moderated_stream(
+    llm: LLM,
+    messages: List[ChatMessage],
+    score: Callable[[str], Awaitable[Dict[str, float]]],
+    threshold: float,
+    rewrite_prompt: Callable[[Dict[str, float], str], str],
+    window_size: int = 2,
+) -> AsyncIterator[StreamEvent]:
+    """
+    Stream a chat completion while scoring it for toxicity sentence by sentence.
+
+    Tokens are forwarded as soon as they arrive and each completed sentence window
+    is scored in the background. As soon as a window crosses `threshold` the
+    generation is abandoned, a ``retract`` event tells the client to drop what it
+    has shown, and a respectful rewrite of the text so far is streamed instead.
+
+    Yields:
+        StreamEvent: ("token", str), ("retract", scores) and finally ("done", full_text)
+    """
+    windows = SentenceWindows(window_size)
+    checks: List[asyncio.Future] = []
+    text = ""
+    flagged = None
+
+    started = time.perf_counter()
+    first_token = True
+    stream = await llm.astream_chat(messages)
+    try:
+        async for chunk in stream:
+            delta = chunk.delta or ""
+            text += delta
+            if first_token:
+                observe_stage("llm_first_token", time.perf_counter() - started)
+                first_token = False
+            yield "token", delta
+
+            for window in windows.feed(delta):
+                checks.append(asyncio.ensure_future(score(window)))
+            flagged = _flagged(checks, threshold)
+            if flagged:
+                break
+
+        if not flagged:
+            # Score the trailing sentence, then wait for the windows still in flight
+            window = windows.flush()
+            if window:
+                checks.append(asyncio.ensure_future(score(window)))
+            await asyncio.gather(*checks)
+            flagged = _flagged(checks, threshold)
+    finally:
+        observe_stage("llm_stream", time.perf_counter() - started)
+        for check in checks:
+            check.cancel()
+        await stream.aclose()
+
+    if flagged:
+        yield "retract", {key: round(float(value), 2) for key, value in flagged.items()}
+        draft, text = text, ""
+        rewrite = await llm.astream_complete(rewrite_prompt(flagged, draft))
+        async for chunk in rewrite:
+            delta = chunk.delta or ""
+            text += delta
+            yield "token", delta
+
+    yield "done", text
@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+from app.core.batching import MicroBatcher
+from app.core.config import get_settings
+from app.core.model_registry import model_registry
+from app.core.metrics import observe_stage
+
+settings = get_settings()
+
+
+class OnnxDetoxify:
+    """
+    Detoxify classifier running on onnxruntime instead of torch.
+
+    The torch checkpoint is exported once to TOXICITY_ONNX_PATH (and dynamically
+    quantized to int8 when TOXICITY_QUANTIZE is set); later loads only read the
+    ONNX file. `predict` has the same signature and output as `Detoxify.predict`.
+    """
+
+    def __init__(self, model_type: str, path: str, quantize: bool = False):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise RuntimeError("TOXICITY_BACKEND=onnx requires the 'onnxruntime' package") from e
+        from detoxify import Detoxify
+
+        detoxifier = Detoxify(model_type)
+        self.tokenizer = detoxifier.tokenizer
+        self.class_names = detoxifier.class_names
+        if not os.path.exists(path):
+            self._export(detoxifier, path, quantize)
+        del detoxifier
+
+        self.session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _export(self, detoxifier, path: str, quantize: bool) -> None:
+        import torch
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        sample = self.tokenizer(["export"], return_tensors="pt", padding=True)
+        export_path = path + ".fp32" if quantize else path
+        torch.onnx.export(
+            detoxifier.model.eval(),
+            (sample["input_ids"], sample["attention_mask"]),
+            export_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=17,
+        )
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(export_path, path, weight_type=QuantType.QInt8)
+            os.remove(export_path)
+
+    def predict(self, text):
+        inputs = self.tokenizer(text, return_tensors="np", truncation=True, padding=True)
+        feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self.input_names}
+        logits = self.session.run(None, feed)[0]
+        scores = 1 / (1 + np.exp(-logits))
+        return {
+            name: float(scores[0][i]) if isinstance(text, str) else scores[:, i].tolist()
+            for i, name in enumerate(self.class_names)
+        }
+
+
+def build_detoxifier():
+    """Build the Detoxify model selected by DETOXIFY_MODEL / TOXICITY_BACKEND / TOXICITY_QUANTIZE."""
+    if settings.TOXICITY_BACKEND == "onnx":
+        return OnnxDetoxify(settings.DETOXIFY_MODEL, settings.TOXICITY_ONNX_PATH, settings.TOXICITY_QUANTIZE)
+
+    from detoxify import Detoxify
+    detoxifier = Detoxify(settings.DETOXIFY_MODEL)
+    if settings.TOXICITY_QUANTIZE:
+        import torch
+        detoxifier.model = torch.quantization.quantize_dynamic(detoxifier.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return detoxifier
+
+
+def _predict_batch(texts: List[str]) -> List[Dict[str, float]]:
+    # Runs in the scorer's pool; with a process pool each worker owns its own model
+    scores = model_registry.get("detoxifier").predict(texts)
+    return [{name: float(values[i]) for name, values in scores.items()} for i in range(len(texts))]
+
+
+class StageStats:
+    """Count, total and max latency per named stage."""
+
+    def __init__(self):
+        self._stages: Dict[str, Tuple[int, float, float]] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        count, total, worst = self._stages.get(stage, (0, 0.0, 0.0))
+        self._stages[stage] = (count + 1, total + seconds, max(worst, seconds))
+        observe_stage(f"toxicity_{stage}", seconds)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage: {
+                "count": count,
+                "avg_ms": round(1000 * total / count, 3),
+                "max_ms": round(1000 * worst, 3),
+            }
+            for stage, (count, total, worst) in self._stages.items()
+        }
+
+
+class ToxicityScorer:
+    """
+    Shared toxicity scoring for both LLM services.
+
+    Texts from concurrent requests are micro-batched into one model forward pass
+    on a dedicated pool (TOXICITY_POOL = thread | process, TOXICITY_WORKERS wide),
+    and scores for texts seen recently come from an LRU cache. Latency is recorded
+    per request ("score": batching wait + inference), per model batch ("batch")
+    and for the LLM rewrites the services run ("rewrite").
+    """
+
+    def __init__(self):
+        self._cache: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._pool: Executor = None
+        self._batcher = MicroBatcher(
+            _predict_batch,
+            max_batch_size=settings.TOXICITY_BATCH_MAX_SIZE,
+            max_wait_ms=settings.TOXICITY_BATCH_WAIT_MS,
+            runner=self._run_in_pool,
+        )
+        self.stages = StageStats()
+        self._stats = {"hits": 0, "misses": 0}
+
+    @property
+    def pool(self) -> Executor:
+        if self._pool is None:
+            if settings.TOXICITY_POOL == "process":
+                self._pool = ProcessPoolExecutor(max_workers=settings.TOXICITY_WORKERS)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=settings.TOXICITY_WORKERS, thread_name_prefix="toxicity")
+        return self._pool
+
+    async def _run_in_pool(self, fn, texts: List[str]) -> List[Dict[str, float]]:
+        # fn must be a module-level function so process pools can pickle it
+        with self.stages.time("batch"):
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, texts)
+
+    async def score(self, text: str) -> Dict[str, float]:
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self._stats["hits"] += 1
+            return cached
+
+        self._stats["misses"] += 1
+        with self.stages.time("score"):
+            scores = await self._batcher.submit(text)
+
+        self._cache[key] = scores
+        while len(self._cache) > settings.TOXICITY_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return scores
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "backend": settings.TOXICITY_BACKEND,
+            "model": settings.DETOXIFY_MODEL,
+            "pool": settings.TOXICITY_POOL,
+            "cached": len(self._cache),
+            "batches": self._batcher.batches,
+            "avg_batch_size": round(self._batcher.items / self._batcher.batches, 2) if self._batcher.batches else 0.0,
+            "stages": self.stages.report(),
+        }
+
+
+toxicity_scorer = ToxicityScorer()
@@ -0,0 +1,67 @@
+"""
+Evaluate system prompts against a question set.
+
+    python -m app.evaluation questions.jsonl --prompt-ids 3 7 12
+    python -m app.evaluation --resume <job id>
+
+Every question is retrieved once and answered under each prompt; the answers
+are appended to EVALUATION_DIR/<job id>.jsonl. An interrupted job continues
+where it stopped with --resume. Point OLLAMA_HOSTS at servers that do not
+serve users to keep the job from competing with interactive traffic.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from dataclasses import asdict
+
+from app.core.kafka_service import kafka_service
+from app.core.llm_gateway import llm_gateway
+from app.database.database import async_engine
+from app.evaluation.jobs import EvaluationJob, EvaluationSpec
+
+
+async def evaluate(job: EvaluationJob) -> EvaluationSpec:
+    try:
+        return await job.run()
+    finally:
+        await llm_gateway.stop()
+        await async_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Evaluate system prompts against a question set")
+    parser.add_argument("questions", nargs="?", help=".jsonl or .csv file with a `question` field")
+    parser.add_argument("--prompt-ids", nargs="+", type=int, help="System prompts to evaluate")
+    parser.add_argument("--resume", metavar="JOB_ID", help="Continue an interrupted job")
+    parser.add_argument("--concurrency", type=int, help="Questions in flight (default: EVALUATION_CONCURRENCY)")
+    parser.add_argument("--publish", action="store_true", help="Also send the answers to the RLHF Kafka topic")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.resume:
+        try:
+            job = EvaluationJob.load(args.resume)
+        except KeyError:
+            parser.error(f"no evaluation {args.resume}")
+        if args.concurrency:
+            job.spec.concurrency = args.concurrency
+    elif args.questions and args.prompt_ids:
+        job = EvaluationJob.create(args.prompt_ids, args.questions, concurrency=args.concurrency, publish=args.publish)
+    else:
+        parser.error("pass a question file and --prompt-ids, or --resume")
+    logging.info("Evaluation %s, results in %s", job.spec.job_id, job.output_path)
+
+    try:
+        spec = asyncio.run(evaluate(job))
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    if spec.publish:
+        kafka_service.close()
+    print(json.dumps(asdict(spec), indent=2))
+    sys.exit(0 if spec.status == "completed" else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+import asyncio
+import csv
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+from sqlalchemy import select
+from app.api.schemas import RLHFMessage
+from app.core.admission import admission_controller
+from app.core.config import get_settings
+from app.core.container import container
+from app.core.kafka_service import kafka_service
+from app.database.database import AsyncSessionLocal
+from app.models.models import SystemPrompt
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+QUESTION_FIELDS = ("question", "prompt", "query")
+
+
+def read_questions(path: str) -> Iterator[Dict[str, str]]:
+    """
+    Stream questions from a JSONL or CSV file.
+
+    Each record needs `question` (or `prompt` / `query`) and may carry an `id`.
+    Records without one are numbered by position, so the file must not be
+    reordered between a run and its resume.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows: Iterator[Dict[str, Any]] = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for index, row in enumerate(rows):
+            question = next((str(row[key]).strip() for key in QUESTION_FIELDS if row.get(key)), "")
+            if question:
+                yield {"id": str(row.get("id") or index), "question": question}
+
+
+async def load_prompts(prompt_ids: List[int]) -> List[SystemPrompt]:
+    """
+    Load system prompts in the given order.
+
+    Raises:
+        ValueError: Some of the prompts do not exist
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(SystemPrompt).where(SystemPrompt.id.in_(prompt_ids)))
+        prompts = {prompt.id: prompt for prompt in result.scalars()}
+    missing = [prompt_id for prompt_id in prompt_ids if prompt_id not in prompts]
+    if missing:
+        raise ValueError(f"System prompts not found: {missing}")
+    return [prompts[prompt_id] for prompt_id in prompt_ids]
+
+
+@dataclass
+class EvaluationSpec:
+    """What a job runs and how far it got; saved as `<job_id>.json`."""
+
+    job_id: str
+    questions_path: str
+    prompt_ids: List[int]
+    concurrency: int
+    publish: bool = False
+    status: str = "pending"  # pending, running, completed, cancelled or failed
+    questions: int = 0
+    completed: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+
+class EvaluationJob:
+    """
+    Run a question set against one or more system prompts through LLMService.
+
+    Each question is embedded and retrieved once and answered under every
+    prompt concurrently (`LLMService.aevaluate`), with up to `concurrency`
+    questions in flight. The answers to a question are appended to
+    `<job_id>.jsonl` in one write, one line per prompt, so the results file is
+    also the checkpoint: a resumed job skips every question it already holds.
+    With `publish`, answers are also sent to KAFKA_TOPIC as RLHFMessage records
+    with reward 0 (unrated).
+
+    `should_pause` is checked before each question; the API passes
+    `admission_controller.busy` so jobs step aside while users are queueing.
+
+    A run holds an exclusive `flock` on `<job_id>.lock` from start to finish,
+    so API workers and the CLI never run (or truncate the results of) the same
+    job twice. `cancel` leaves a `<job_id>.cancel` marker that the run checks
+    before each question, whichever process it is in.
+    """
+
+    def __init__(self, spec: EvaluationSpec, directory: Optional[str] = None):
+        self.spec = spec
+        self.directory = directory or settings.EVALUATION_DIR
+        self._cancelled = False
+        self._lock: Optional[IO] = None
+
+    @classmethod
+    def create(
+        cls,
+        prompt_ids: List[int],
+        questions_path: Optional[str] = None,
+        questions: Optional[List[str]] = None,
+        concurrency: Optional[int] = None,
+        publish: bool = False,
+        directory: Optional[str] = None,
+    ) -> "EvaluationJob":
+        """
+        Create and save a new job.
+
+        Args:
+            prompt_ids (List[int]): System prompts to evaluate
+            questions_path (str, optional): A .jsonl or .csv question file
+            questions (List[str], optional): Inline questions, saved next to the job instead
+            concurrency (int, optional): Questions in flight; defaults to EVALUATION_CONCURRENCY
+            publish (bool): Also send the answers to Kafka
+            directory (str, optional): Defaults to EVALUATION_DIR
+
+        Returns:
+            EvaluationJob: The saved, not yet started job
+        """
+        directory = directory or settings.EVALUATION_DIR
+        os.makedirs(directory, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        if questions is not None:
+            questions_path = os.path.join(directory, f"{job_id}.questions.jsonl")
+            with open(questions_path, "w", encoding="utf-8") as f:
+                for index, question in enumerate(questions):
+                    f.write(json.dumps({"id": str(index), "question": question}) + "\n")
+        if not questions_path:
+            raise ValueError("No questions given")
+
+        spec = EvaluationSpec(
+            job_id=job_id,
+            questions_path=os.path.abspath(questions_path),
+            prompt_ids=list(prompt_ids),
+            concurrency=max(1, concurrency or settings.EVALUATION_CONCURRENCY),
+            publish=publish,
+        )
+        job = cls(spec, directory)
+        job.save()
+        return job
+
+    @classmethod
+    def load(cls, job_id: str, directory: Optional[str] = None) -> "EvaluationJob":
+        """
+        Load a saved job.
+
+        Raises:
+            KeyError: No job with this id
+        """
+        directory = directory or settings.EVALUATION_DIR
+        path = os.path.join(directory, f"{os.path.basename(job_id)}.json")
+        if not os.path.exists(path):
+            raise KeyError(job_id)
+        with open(path, encoding="utf-8") as f:
+            return cls(EvaluationSpec(**json.load(f)), directory)
+
+    @property
+    def spec_path(self) -> str:
+        return os.path.join(self.directory, f"{self.spec.job_id}.json")
+
+    @property
+    def output_path(self) -> str:
+        return os.path.join(self.directory, f"{self.spec.job_id}.jsonl")
+
+    @property
+    def lock_path(self) -> str:
+        return os.path.join(self.directory, f"{self.spec.job_id}.lock")
+
+    @property
+    def cancel_path(self) -> str:
+        return os.path.join(self.directory, f"{self.spec.job_id}.cancel")
+
+    def save(self) -> None:
+        tmp = self.spec_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(asdict(self.spec), f)
+        os.replace(tmp, self.spec_path)
+
+    def acquire(self) -> None:
+        """
+        Take the run lock of the job; a no-op if this instance already holds it.
+
+        Raises:
+            ValueError: The job is running, here or in another process
+        """
+        if self._lock is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        lock = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            raise ValueError(f"Evaluation {self.spec.job_id} is already running")
+        self._lock = lock
+        if os.path.exists(self.cancel_path):
+            os.remove(self.cancel_path)  # Left by a cancel that arrived after the last run ended
+
+    def release(self) -> None:
+        if self._lock is not None:
+            self._lock.close()  # Closing the file drops the lock
+            self._lock = None
+
+    def is_running(self) -> bool:
+        """True while some process holds the run lock of the job."""
+        if self._lock is not None:
+            return True
+        try:
+            with open(self.lock_path) as lock:
+                fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except FileNotFoundError:
+            return False
+        except BlockingIOError:
+            return True
+        return False
+
+    def cancel(self) -> None:
+        """Stop the run after the questions in flight, also when it runs in another process."""
+        self._cancelled = True
+        open(self.cancel_path, "a").close()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._cancelled and os.path.exists(self.cancel_path):
+            self._cancelled = True
+        return self._cancelled
+
+    def _completed(self) -> Set[str]:
+        """
+        Ids of the questions answered under every prompt. Cuts off a partly written last question,
+        so only call it while holding the run lock.
+        """
+        if not os.path.exists(self.output_path):
+            return set()
+        answered: Dict[str, Set[int]] = {}
+        lines: List[Tuple[str, int]] = []  # (question id, offset where the line starts)
+        offset = 0
+        with open(self.output_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                answered.setdefault(record["question_id"], set()).add(record["prompt_id"])
+                lines.append((record["question_id"], offset))
+                offset += len(line)
+
+        expected = set(self.spec.prompt_ids)
+        while lines and answered[lines[-1][0]] < expected:
+            question_id, offset = lines.pop()
+            answered[question_id].clear()
+        if offset < os.path.getsize(self.output_path):
+            with open(self.output_path, "r+b") as f:
+                f.truncate(offset)
+        return {question_id for question_id, prompt_ids in answered.items() if prompt_ids >= expected}
+
+    async def run(self, should_pause: Optional[Callable[[], bool]] = None) -> EvaluationSpec:
+        """
+        Answer every question not answered yet.
+
+        Args:
+            should_pause (Callable[[], bool], optional): Hold off new questions while this returns True
+
+        Returns:
+            EvaluationSpec: The final state; failures are recorded there, not raised
+
+        Raises:
+            ValueError: The job is already running, here or in another process
+        """
+        self.acquire()
+        self._cancelled = False
+        self.spec.status, self.spec.error, self.spec.finished_at = "running", None, None
+        try:
+            prompts = await load_prompts(self.spec.prompt_ids)
+            llm_service = await container.aget("llm_service")
+            done = self._completed()
+            self.spec.questions = sum(1 for _ in read_questions(self.spec.questions_path))
+            self.spec.completed, self.spec.failed = len(done), 0
+            self.save()
+
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.spec.concurrency * 2)
+            with open(self.output_path, "a", encoding="utf-8") as output:
+                async def worker():
+                    while (question := await queue.get()) is not None:
+                        while should_pause is not None and should_pause() and not self.cancelled:
+                            await asyncio.sleep(0.5)
+                        if not self.cancelled:
+                            await self._evaluate(llm_service, question, prompts, output)
+
+                workers = [asyncio.create_task(worker()) for _ in range(self.spec.concurrency)]
+                try:
+                    for question in read_questions(self.spec.questions_path):
+                        if self.cancelled:
+                            break
+                        if question["id"] not in done:
+                            await queue.put(question)
+                    for _ in workers:
+                        await queue.put(None)
+                    await asyncio.gather(*workers)
+                finally:
+                    for task in workers:
+                        task.cancel()
+            self.spec.status = "cancelled" if self.cancelled else "completed"
+        except asyncio.CancelledError:
+            self.spec.status = "cancelled"
+            raise
+        except Exception as e:
+            logger.exception("Evaluation job %s failed", self.spec.job_id)
+            self.spec.status, self.spec.error = "failed", str(e)
+        finally:
+            self.spec.finished_at = time.time()
+            self.save()
+            if os.path.exists(self.cancel_path):
+                os.remove(self.cancel_path)
+            self.release()
+        return self.spec
+
+    async def _evaluate(self, llm_service, question: Dict[str, str], prompts: List[SystemPrompt], output: TextIO) -> None:
+        started = time.perf_counter()
+        try:
+            responses, articles = await llm_service.aevaluate(question["question"], [prompt.prompt for prompt in prompts])
+        except Exception as e:
+            # Left out of the results, so a resume retries it
+            self.spec.failed += 1
+            logger.warning("Question %s of evaluation %s failed: %s", question["id"], self.spec.job_id, e)
+            return
+
+        seconds = round(time.perf_counter() - started, 3)
+        records = [
+            {
+                "job_id": self.spec.job_id,
+                "question_id": question["id"],
+                "question": question["question"],
+                "prompt_id": prompt.id,
+                "system_prompt": prompt.prompt,
+                "response": response,
+                "articles": [article.model_dump() for article in articles],
+                "seconds": seconds,
+            }
+            for prompt, response in zip(prompts, responses)
+        ]
+        output.write("".join(json.dumps(record) + "\n" for record in records))
+        output.flush()
+        self.spec.completed += 1
+        if self.spec.publish:
+            kafka_service.send_batch(settings.KAFKA_TOPIC, [
+                RLHFMessage(prompt=record["question"], response=record["response"], system_prompt=record["system_prompt"], reward=0.0)
+                for record in records
+            ])
+        if self.spec.completed % 100 == 0:
+            self.save()
+
+
+class EvaluationManager:
+    """
+    Evaluation jobs started through the API, run as background tasks of this worker.
+
+    Whether a job is running is read from its run lock, so every worker can
+    report and cancel a job another worker (or the CLI) is running.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, EvaluationJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self, job: EvaluationJob) -> None:
+        """
+        Run a job in the background.
+
+        Raises:
+            ValueError: The job is already running, here or in another process
+        """
+        job_id = job.spec.job_id
+        job.acquire()
+        self._jobs[job_id] = job
+        task = asyncio.create_task(job.run(should_pause=admission_controller.busy))
+
+        def finished(_: asyncio.Task) -> None:
+            self._tasks.pop(job_id, None)
+            self._jobs.pop(job_id, None)
+            job.release()  # A task cancelled before it started never reaches run()'s cleanup
+
+        task.add_done_callback(finished)
+        self._tasks[job_id] = task
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self._tasks or self.get(job_id).is_running()
+
+    def get(self, job_id: str) -> EvaluationJob:
+        """
+        Look up a job running here, or its saved state (kept current by whichever process runs it).
+
+        Raises:
+            KeyError: No job with this id
+        """
+        return self._jobs.get(job_id) or EvaluationJob.load(job_id)
+
+    def list(self) -> List[EvaluationSpec]:
+        directory = settings.EVALUATION_DIR
+        if not os.path.isdir(directory):
+            return []
+        job_ids = [name[:-len(".json")] for name in os.listdir(directory) if name.endswith(".json")]
+        return sorted((self.get(job_id).spec for job_id in job_ids), key=lambda spec: spec.created_at)
+
+    async def stop(self) -> None:
+        # Interrupted jobs keep their results and can be resumed
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+evaluation_jobs = EvaluationManager()
@@ -0,0 +1,52 @@
+"""
+Load or refresh an article collection.
+
+    python -m app.ingestion articles.jsonl --collection articles
+    python -m app.ingestion satire.csv --collection satirical_articles --nice 10
+
+Re-running over the same file only writes articles that are new or changed, and
+a crashed run picks up from its state file. A run that changed anything bumps
+the collection's version, and every API worker drops its cached answers for the
+collection within SEMANTIC_CACHE_CHECK_INTERVAL. Pass --api-url to drop them
+right away on the worker that answers the call.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+
+import httpx
+from app.ingestion.pipeline import IngestionPipeline
+
+
+async def ingest(pipeline: IngestionPipeline, paths) -> None:
+    for path in paths:
+        await pipeline.run(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest articles into a Qdrant collection")
+    parser.add_argument("paths", nargs="+", help=".jsonl or .csv files")
+    parser.add_argument("--collection", default="articles")
+    parser.add_argument("--state", help="State file (default: INGEST_STATE_DIR/<collection>.json)")
+    parser.add_argument("--force", action="store_true", help="Re-embed every article, even unchanged ones")
+    parser.add_argument("--nice", type=int, default=10, help="Lower CPU priority so serving traffic comes first")
+    parser.add_argument("--api-url", help="API to ask for an immediate cache invalidation afterwards, e.g. http://localhost:8000")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.nice and hasattr(os, "nice"):
+        os.nice(args.nice)
+
+    pipeline = IngestionPipeline(args.collection, args.state, args.force)
+    asyncio.run(ingest(pipeline, args.paths))
+    print(json.dumps(pipeline.report(), indent=2))
+
+    if args.api_url and pipeline.stats.ingested:
+        response = httpx.post(f"{args.api_url.rstrip('/')}/api/llm/cache/invalidate", params={"collection": args.collection})
+        response.raise_for_status()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from llama_index.core.schema import MetadataMode, NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+from qdrant_client import models
+from app.core.config import get_settings
+from app.core.context_packer import count_tokens
+from app.core.executor import run_cpu
+from app.core.model_registry import model_registry
+from app.core.qdrant import bump_collection_version
+from app.core.streaming import SENTENCE_END
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+METADATA_FIELDS = ("title", "url", "source", "published_at")
+
+
+def read_articles(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream articles from a JSONL or CSV file.
+
+    Each record needs `content` (or `text`) and should carry `title`, `url`,
+    `source` and `published_at`. Records without content are skipped.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows: Iterator[Dict[str, Any]] = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            content = (row.get("content") or row.get("text") or "").strip()
+            if not content:
+                continue
+            article = {field: row.get(field) or "" for field in METADATA_FIELDS}
+            article["content"] = content
+            article["published_at"] = _normalize_date(article["published_at"])
+            yield article
+
+
+def _normalize_date(value: str) -> str:
+    # The date filter needs RFC 3339; keep whatever we cannot parse as is
+    if not value:
+        return value
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).isoformat()
+    except ValueError:
+        return value
+
+
+def document_id(article: Dict[str, Any]) -> str:
+    """Stable id of an article: its URL, or its title and content when it has none."""
+    key = article["url"] or article["title"] + "\n" + article["content"]
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+
+
+def content_hash(article: Dict[str, Any]) -> str:
+    payload = json.dumps([article[field] for field in (*METADATA_FIELDS, "content")])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def chunk_point_id(doc_id: str, index: int) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, f"{doc_id}#{index}"))
+
+
+def chunk_text(text: str, max_tokens: int, overlap_tokens: int) -> List[str]:
+    """
+    Split text into chunks of whole sentences of at most `max_tokens`.
+
+    Consecutive chunks share trailing sentences worth up to `overlap_tokens`.
+    A single sentence longer than `max_tokens` becomes a chunk of its own.
+    """
+    sentences = [(sentence, count_tokens(sentence)) for sentence in SENTENCE_END.split(text.strip()) if sentence.strip()]
+    chunks: List[str] = []
+    current: List[Tuple[str, int]] = []
+    size = 0
+    for sentence, tokens in sentences:
+        if current and size + tokens > max_tokens:
+            chunks.append(" ".join(s for s, _ in current))
+            # Carry the tail of this chunk into the next one
+            carried: List[Tuple[str, int]] = []
+            carried_size = 0
+            for s, t in reversed(current[1:]):
+                if carried_size + t > overlap_tokens:
+                    break
+                carried.insert(0, (s, t))
+                carried_size += t
+            current, size = carried, carried_size
+        current.append((sentence, tokens))
+        size += tokens
+    if current:
+        chunks.append(" ".join(s for s, _ in current))
+    return chunks
+
+
+@dataclass
+class IngestionStats:
+    """Counts for one ingestion run."""
+
+    read: int = 0
+    unchanged: int = 0
+    ingested: int = 0
+    chunks: int = 0
+    stale_chunks_deleted: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class _Document:
+    doc_id: str
+    hash: str
+    nodes: List[TextNode]
+    in_store: bool = False  # Found in Qdrant without a state entry
+
+
+class IngestionState:
+    """
+    Content hashes of the documents already written to a collection.
+
+    Saved atomically after every completed batch, so a crashed run can be
+    restarted and only redoes the batches that had not finished.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.documents: Dict[str, List[Any]] = {}  # doc_id -> [content hash, chunk count]
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.documents = json.load(f).get("documents", {})
+
+    def unchanged(self, doc_id: str, digest: str) -> bool:
+        entry = self.documents.get(doc_id)
+        return entry is not None and entry[0] == digest
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"documents": self.documents}, f)
+        os.replace(tmp, self.path)
+
+
+class IngestionPipeline:
+    """
+    Incremental loader for an article collection.
+
+    Articles are streamed from the input, chunked into sentence windows of
+    INGEST_CHUNK_TOKENS and embedded INGEST_EMBED_BATCH_SIZE chunks at a time
+    with EMBEDDING_MODEL. Points carry the same payload QdrantVectorStore
+    writes (node JSON, `doc_id`, plus the text under "content"), so the
+    retrieval engine reads them unchanged. Up to INGEST_UPSERT_WORKERS batches
+    are upserted while the next one is embedded.
+
+    Documents whose content hash matches the state file, or the hash stored on
+    their first chunk in Qdrant, are skipped. When a document changes, chunks
+    it no longer has are deleted. A run that wrote anything bumps the
+    collection's version marker, which the response cache fingerprints.
+    """
+
+    def __init__(self, collection: str, state_path: Optional[str] = None, force: bool = False):
+        self.collection = collection
+        self.state = IngestionState(state_path or os.path.join(settings.INGEST_STATE_DIR, f"{collection}.json"))
+        self.force = force
+        self.stats = IngestionStats()
+
+    @property
+    def client(self):
+        return model_registry.get("async_qdrant_client")
+
+    @property
+    def embed_model(self):
+        return model_registry.get("embed_model")
+
+    async def run(self, path: str) -> IngestionStats:
+        """
+        Ingest every article in `path`.
+
+        Args:
+            path (str): A .jsonl or .csv file
+
+        Returns:
+            IngestionStats: What was read, skipped and written
+        """
+        started = time.perf_counter()
+        ingested = self.stats.ingested
+        await self._ensure_collection()
+        writers: set = set()
+        for batch in self._batches(read_articles(path)):
+            documents = await self._drop_unchanged(batch)
+            if not documents:
+                continue
+            nodes = [node for document in documents for node in document.nodes]
+            embeddings = await run_cpu(self._embed, [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes])
+            for node, embedding in zip(nodes, embeddings):
+                node.embedding = embedding
+
+            writers.add(asyncio.create_task(self._write(documents)))
+            if len(writers) >= settings.INGEST_UPSERT_WORKERS:
+                done, writers = await asyncio.wait(writers, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        await asyncio.gather(*writers)
+        if self.stats.ingested > ingested:
+            # Tells every API worker's response cache that the collection changed, even when its size did not
+            await bump_collection_version(self.client, self.collection)
+        self.stats.seconds = round(self.stats.seconds + time.perf_counter() - started, 2)
+        return self.stats
+
+    def _batches(self, articles: Iterator[Dict[str, Any]]) -> Iterator[List[_Document]]:
+        batch: List[_Document] = []
+        chunks = 0
+        for article in articles:
+            self.stats.read += 1
+            doc_id, digest = document_id(article), content_hash(article)
+            if not self.force and self.state.unchanged(doc_id, digest):
+                self.stats.unchanged += 1
+                continue
+            document = _Document(doc_id, digest, self._nodes(doc_id, digest, article))
+            batch.append(document)
+            chunks += len(document.nodes)
+            if chunks >= settings.INGEST_EMBED_BATCH_SIZE:
+                yield batch
+                batch, chunks = [], 0
+        if batch:
+            yield batch
+
+    def _nodes(self, doc_id: str, digest: str, article: Dict[str, Any]) -> List[TextNode]:
+        metadata = {field: article[field] for field in METADATA_FIELDS if article[field]}
+        metadata["content_hash"] = digest
+        texts = chunk_text(article["content"], settings.INGEST_CHUNK_TOKENS, settings.INGEST_CHUNK_OVERLAP)
+        return [
+            TextNode(
+                id_=chunk_point_id(doc_id, index),
+                text=text,
+                metadata=metadata,
+                # Only the title goes into the embedding; nothing but title and source into the prompt
+                excluded_embed_metadata_keys=["url", "source", "published_at", "content_hash"],
+                excluded_llm_metadata_keys=["url", "published_at", "content_hash"],
+                relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=doc_id)},
+            )
+            for index, text in enumerate(texts)
+        ]
+
+    async def _drop_unchanged(self, batch: List[_Document]) -> List[_Document]:
+        # Documents missing from the state file may still be in Qdrant, e.g. after losing the state
+        unknown = [document for document in batch if document.doc_id not in self.state.documents]
+        if self.force or not unknown:
+            return batch
+        points = await self.client.retrieve(
+            self.collection, [chunk_point_id(document.doc_id, 0) for document in unknown], with_payload=["content_hash"]
+        )
+        stored = {str(point.id): (point.payload or {}).get("content_hash") for point in points}
+        kept = []
+        for document in batch:
+            point_id = chunk_point_id(document.doc_id, 0)
+            if stored.get(point_id) == document.hash:
+                self.stats.unchanged += 1
+                self.state.documents[document.doc_id] = [document.hash, len(document.nodes)]
+                continue
+            document.in_store = point_id in stored
+            kept.append(document)
+        return kept
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        embed_model = self.embed_model
+        if hasattr(embed_model, "_embed"):
+            return embed_model._embed(texts, prompt_name="text")
+        return embed_model.get_text_embedding_batch(texts)
+
+    async def _write(self, documents: List[_Document]) -> None:
+        points = []
+        for document in documents:
+            for node in document.nodes:
+                payload = node_to_metadata_dict(node, remove_text=False, flat_metadata=False)
+                payload["content"] = node.get_content()
+                payload["content_hash"] = document.hash
+                points.append(models.PointStruct(id=node.node_id, vector=node.embedding, payload=payload))
+
+        size = settings.INGEST_UPSERT_BATCH_SIZE
+        await asyncio.gather(*(
+            self.client.upsert(self.collection, points[i:i + size], wait=True)
+            for i in range(0, len(points), size)
+        ))
+
+        for document in documents:
+            previous = self.state.documents.get(document.doc_id)
+            if previous and previous[1] > len(document.nodes):
+                stale = [chunk_point_id(document.doc_id, index) for index in range(len(document.nodes), previous[1])]
+                await self.client.delete(self.collection, models.PointIdsList(points=stale))
+                self.stats.stale_chunks_deleted += len(stale)
+            elif document.in_store:
+                # Old chunk count unknown: delete whatever else belongs to the document
+                await self.client.delete(self.collection, models.Filter(
+                    must=[models.FieldCondition(key="doc_id", match=models.MatchValue(value=document.doc_id))],
+                    must_not=[models.HasIdCondition(has_id=[node.node_id for node in document.nodes])],
+                ))
+            self.state.documents[document.doc_id] = [document.hash, len(document.nodes)]
+
+        self.stats.ingested += len(documents)
+        self.stats.chunks += len(points)
+        self.state.save()
+        logger.info("Ingested %d documents (%d chunks) into %s", self.stats.ingested, self.stats.chunks, self.collection)
+
+    async def _ensure_collection(self) -> None:
+        if await self.client.collection_exists(self.collection):
+            return
+        size = len((await run_cpu(self._embed, ["probe"]))[0])
+        await self.client.create_collection(
+            self.collection,
+            vectors_config=models.VectorParams(size=size, distance=models.Distance.COSINE),
+        )
+        # Indexes for the retrieval filters
+        await self.client.create_payload_index(self.collection, settings.RETRIEVAL_SOURCE_FIELD, models.PayloadSchemaType.KEYWORD)
+        await self.client.create_payload_index(self.collection, settings.RETRIEVAL_DATE_FIELD, models.PayloadSchemaType.DATETIME)
+        logger.info("Created collection %s (%d dimensions)", self.collection, size)
+
+    def report(self) -> Dict[str, Any]:
+        return asdict(self.stats)
@@ -8,6 +8,7 @@ class SystemPrompt(Base):
     id = Column(Integer, primary_key=True, index=True)
     prompt = Column(String, unique=True)
     likes = Column(Integer, default=0)
+    dislikes = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_used = Column(DateTime(timezone=True), nullable=True)
     used = Column(Integer, default=0)
\ No newline at end of file
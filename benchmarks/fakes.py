@@ -0,0 +1,367 @@
+"""
+Local stand-ins for the external services the API talks to.
+
+- `HashEmbedding`: deterministic bag-of-words embedding with a configurable cost
+- `FakeDetoxify`: keyword based toxicity scores with the `Detoxify.predict` shape
+- `FakeOllamaServer`: an HTTP server speaking the Ollama /api/chat and
+  /api/generate protocol with configurable first-token and per-token latency,
+  and injectable failures
+- `FakeKafkaProducer`: records sends in memory and acknowledges them at once,
+  or refuses them while marked unavailable
+- `seed_collections`: synthetic articles written to in-memory Qdrant clients
+
+Nothing here is imported by the app itself; the benchmarks and tests install
+these through `model_registry.override`, OLLAMA_URL and the Kafka producer factory.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+from pydantic import PrivateAttr
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+TOPICS = [
+    "election", "inflation", "climate", "football", "vaccine", "startup", "housing",
+    "parliament", "drought", "museum", "railway", "satellite", "festival", "tariff",
+]
+PLACES = ["Bucharest", "Cluj", "Iasi", "Timisoara", "Constanta", "Brasov", "Sibiu", "Oradea"]
+FILLER = (
+    "Officials said the decision followed weeks of debate. Residents reacted with a mix "
+    "of relief and concern. Analysts expect further announcements in the coming days. "
+    "The ministry did not respond to a request for comment."
+)
+SOURCES = ["wire", "daily", "local"]
+TOXIC_WORDS = ("idiot", "stupid", "moron")
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+
+
+class HashEmbedding(BaseEmbedding):
+    """
+    Deterministic bag-of-words embedding.
+
+    Texts that share words get similar vectors, so retrieval over the seeded
+    articles behaves plausibly. `item_cost_ms` / `batch_cost_ms` emulate the
+    encoder's CPU time per text and per forward pass.
+    """
+
+    model_name: str = "hash-embedding"
+    dim: int = 384
+    item_cost_ms: float = 0.0
+    batch_cost_ms: float = 0.0
+    _calls: int = PrivateAttr(default=0)
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in _WORD.findall(text.lower()):
+            h = _token_hash(token)
+            vector[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        else:
+            vector[0] = 1.0
+        return vector.tolist()
+
+    def _embed(self, texts: List[str], prompt_name: Optional[str] = None) -> List[List[float]]:
+        self._calls += 1
+        cost = self.batch_cost_ms + self.item_cost_ms * len(texts)
+        if cost:
+            time.sleep(cost / 1000)
+        return [self._vector(text) for text in texts]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed([query])[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+
+class FakeDetoxify:
+    """Keyword based stand-in with the output shape of `Detoxify.predict`."""
+
+    CLASSES = ("toxicity", "severe_toxicity", "obscene", "threat", "insult", "identity_attack")
+
+    def __init__(self, item_cost_ms: float = 0.0):
+        self.item_cost_ms = item_cost_ms
+
+    def _score(self, text: str) -> float:
+        lowered = text.lower()
+        return 0.92 if any(word in lowered for word in TOXIC_WORDS) else 0.01
+
+    def predict(self, text):
+        texts = [text] if isinstance(text, str) else list(text)
+        if self.item_cost_ms:
+            time.sleep(self.item_cost_ms * len(texts) / 1000)
+        scores = [self._score(t) for t in texts]
+        result = {name: [s if name in ("toxicity", "insult") else s / 10 for s in scores] for name in self.CLASSES}
+        if isinstance(text, str):
+            return {name: values[0] for name, values in result.items()}
+        return result
+
+
+class _FakeFuture:
+    def add_callback(self, fn, *args, **kwargs):
+        fn(*args, None, **kwargs)
+        return self
+
+    def add_errback(self, fn, *args, **kwargs):
+        return self
+
+
+class FakeKafkaProducer:
+    """In-memory producer: every send is acknowledged immediately, unless `available` is False."""
+
+    def __init__(self):
+        self.sent = 0
+        self.bytes = 0
+        self.values: List[bytes] = []
+        self.available = True
+
+    def send(self, topic: str, value: bytes = None, **kwargs):
+        if not self.available:
+            raise ConnectionError("broker unavailable")
+        self.sent += 1
+        self.values.append(value)
+        self.bytes += len(value or b"")
+        return _FakeFuture()
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self, timeout=None):
+        pass
+
+
+def synthetic_articles(count: int, seed: int = 7) -> List[Dict[str, str]]:
+    rng = random.Random(seed)
+    articles = []
+    for i in range(count):
+        topic, place = rng.choice(TOPICS), rng.choice(PLACES)
+        other = rng.choice(TOPICS)
+        articles.append({
+            "title": f"{place} {topic} update #{i}",
+            "url": f"https://news.example.com/{topic}/{i}",
+            "source": rng.choice(SOURCES),
+            "published_at": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T08:00:00Z",
+            "content": (
+                f"{place} faces new {topic} developments. Local leaders linked the {topic} "
+                f"situation to {other} policy. {FILLER}"
+            ),
+        })
+    return articles
+
+
+def seed_collections(sync_client, async_client, embed_model: HashEmbedding, collections: List[str], count: int) -> None:
+    """Create each collection in both clients and upsert the same synthetic articles, two chunks each."""
+    from qdrant_client import models
+
+    chunks = []
+    for article in synthetic_articles(count):
+        lead, _, rest = article["content"].partition(". ")
+        metadata = {key: article[key] for key in ("title", "url", "source", "published_at")}
+        chunks += [(lead + ".", metadata), (rest, metadata)]
+    vectors = embed_model._embed([text for text, _ in chunks])
+    points = []
+    for i, ((text, metadata), vector) in enumerate(zip(chunks, vectors)):
+        node = TextNode(text=text, metadata=metadata)
+        payload = node_to_metadata_dict(node, remove_text=False, flat_metadata=False)
+        payload["content"] = text
+        points.append(models.PointStruct(id=i + 1, vector=vector, payload=payload))
+
+    params = models.VectorParams(size=embed_model.dim, distance=models.Distance.COSINE)
+
+    async def _seed_async():
+        for name in collections:
+            await async_client.create_collection(name, vectors_config=params)
+            await async_client.upsert(name, points)
+
+    for name in collections:
+        sync_client.create_collection(name, vectors_config=params)
+        sync_client.upsert(name, points)
+    asyncio.run(_seed_async())
+
+
+class FakeOllamaServer:
+    """
+    Ollama-compatible HTTP server with deterministic output.
+
+    Each reply is `tokens` words derived from the prompt. The first token arrives
+    after `first_token_ms` plus `prompt_token_ms` per prompt token (estimated at
+    4 characters each, to model prompt evaluation) and every further token after
+    `token_ms`. At most `parallel` generations run at once, like
+    OLLAMA_NUM_PARALLEL; the rest queue.
+
+    The model starts unloaded: the first request after startup, or after the
+    request's `keep_alive` has expired, first pays `load_ms`. A /api/generate
+    call without a prompt only loads the model, as with real Ollama.
+
+    Failures can be switched on at any time: `fail_status` answers every
+    generation with that HTTP status, and `fail_after` cuts streamed replies
+    off after that many chunks.
+    """
+
+    def __init__(self, tokens: int = 40, first_token_ms: float = 150.0, token_ms: float = 10.0, parallel: int = 4, prompt_token_ms: float = 0.0, load_ms: float = 0.0):
+        self.tokens = tokens
+        self.load_ms = load_ms
+        self.loads = 0
+        self._loaded_until = 0.0
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.prompt_token_ms = prompt_token_ms
+        self.parallel = parallel
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.fail_status: Optional[int] = None
+        self.fail_after: Optional[int] = None
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _words(self, prompt: str) -> List[str]:
+        rng = random.Random(_token_hash(prompt))
+        words = [rng.choice(TOPICS + PLACES + FILLER.split()) for _ in range(self.tokens)]
+        # Full stops every few words so sentence windows get scored while streaming
+        return [w + ("." if i % 8 == 7 else "") + " " for i, w in enumerate(words)]
+
+    def _app(self):
+        from starlette.applications import Starlette
+        from starlette.responses import JSONResponse, StreamingResponse
+        from starlette.routing import Route
+
+        slots = asyncio.Semaphore(self.parallel)
+        loading = asyncio.Lock()
+        server = self
+
+        async def ensure_loaded(body: Dict[str, Any]):
+            async with loading:
+                if time.monotonic() >= server._loaded_until:
+                    server.loads += 1
+                    await asyncio.sleep(server.load_ms / 1000)
+                server._loaded_until = time.monotonic() + _keep_alive_seconds(body.get("keep_alive"))
+
+        async def generate(words: List[str], prompt_tokens: int, wrap):
+            async with slots:
+                await asyncio.sleep((server.first_token_ms + server.prompt_token_ms * prompt_tokens) / 1000)
+                for i, word in enumerate(words):
+                    if i:
+                        await asyncio.sleep(server.token_ms / 1000)
+                    yield wrap(word, False)
+                yield wrap("", True)
+
+        async def handle(body: Dict[str, Any], prompt: str, full_prompt: str, wrap):
+            server.requests += 1
+            if server.fail_status is not None:
+                return JSONResponse({"error": "injected failure"}, status_code=server.fail_status)
+            await ensure_loaded(body)
+            prompt_tokens = len(full_prompt) // 4
+            server.prompt_tokens += prompt_tokens
+            words = server._words(prompt)
+            done = {"done": True, "done_reason": "stop", "prompt_eval_count": prompt_tokens, "eval_count": server.tokens}
+            if body.get("stream", True):
+                async def lines():
+                    sent = 0
+                    async for text, last in generate(words, prompt_tokens, lambda *chunk: chunk):
+                        if server.fail_after is not None and sent >= server.fail_after:
+                            raise ConnectionError("injected disconnect")  # Drops the connection mid-reply
+                        yield json.dumps(wrap(text, done if last else {"done": False})) + "\n"
+                        sent += 1
+                return StreamingResponse(lines(), media_type="application/x-ndjson")
+            text = ""
+            async for word, _ in generate(words, prompt_tokens, lambda *chunk: chunk):
+                text += word
+            return JSONResponse(wrap(text, done))
+
+        async def chat(request):
+            body = await request.json()
+            messages = body.get("messages") or [{}]
+            model = body.get("model", "fake")
+            return await handle(
+                body,
+                messages[-1].get("content", ""),
+                "".join(message.get("content", "") for message in messages),
+                lambda text, fields: {"model": model, "message": {"role": "assistant", "content": text}, **fields},
+            )
+
+        async def generate_endpoint(request):
+            body = await request.json()
+            model = body.get("model", "fake")
+            prompt = body.get("prompt", "")
+            if not prompt:
+                await ensure_loaded(body)
+                return JSONResponse({"model": model, "response": "", "done": True, "done_reason": "load"})
+            return await handle(
+                body,
+                prompt,
+                body.get("system", "") + prompt,
+                lambda text, fields: {"model": model, "response": text, **fields},
+            )
+
+        async def tags(request):
+            return JSONResponse({"models": [{"name": "fake", "model": "fake"}]})
+
+        return Starlette(routes=[
+            Route("/api/chat", chat, methods=["POST"]),
+            Route("/api/generate", generate_endpoint, methods=["POST"]),
+            Route("/api/tags", tags, methods=["GET"]),
+        ])
+
+    def start(self) -> "FakeOllamaServer":
+        import uvicorn
+
+        config = uvicorn.Config(self._app(), host="127.0.0.1", port=self.port, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="fake-ollama", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake Ollama server did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+
+def _keep_alive_seconds(value) -> float:
+    """Parse Ollama's keep_alive ("30m", "1h", 300, -1); defaults to 5 minutes."""
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)(ms|s|m|h)?", str(value).strip())
+    if not match:
+        return 300.0
+    number = float(match.group(1))
+    if number < 0:
+        return float("inf")
+    return number * {"ms": 0.001, "s": 1, None: 1, "m": 60, "h": 3600}[match.group(2)]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,93 @@
+"""
+Concurrency load test for /api/llm/prompt.
+
+Runs batches of concurrent prompts against a running server at increasing
+concurrency levels while polling /api/health in the background. With the async
+pipeline, throughput should grow with concurrency while per-request latency
+and health-check latency stay flat.
+
+Usage:
+    python benchmarks/load_test.py --url http://localhost:8000 --levels 1 8 32
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _prompt(client: httpx.AsyncClient, payload: dict, latencies: list, errors: list):
+    started = time.perf_counter()
+    try:
+        response = await client.post("/api/llm/prompt", json=payload)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    except Exception as e:
+        errors.append(str(e))
+
+
+async def _poll_health(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get("/api/health")
+        except Exception:
+            pass
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.25)
+
+
+async def run_level(client: httpx.AsyncClient, payload: dict, concurrency: int, rounds: int) -> dict:
+    latencies, errors, health_latencies = [], [], []
+    stop = asyncio.Event()
+    health_task = asyncio.create_task(_poll_health(client, stop, health_latencies))
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(_prompt(client, payload, latencies, errors) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await health_task
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_s": round(statistics.median(latencies), 3) if latencies else None,
+        "latency_p95_s": round(_percentile(latencies, 95), 3) if latencies else None,
+        "health_p95_s": round(_percentile(health_latencies, 95), 3) if health_latencies else None,
+    }
+
+
+async def main(args):
+    payload = {"prompt": args.prompt, "mode": args.mode}
+    limits = httpx.Limits(max_connections=max(args.levels) + 4)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        print(f"{'conc':>5} {'reqs':>5} {'err':>4} {'rps':>8} {'p50 s':>8} {'p95 s':>8} {'health p95':>11}")
+        for level in args.levels:
+            result = await run_level(client, payload, level, args.rounds)
+            print(
+                f"{result['concurrency']:>5} {result['requests']:>5} {result['errors']:>4} "
+                f"{result['throughput_rps']:>8} {result['latency_p50_s']!s:>8} "
+                f"{result['latency_p95_s']!s:>8} {result['health_p95_s']!s:>11}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--prompt", default="What happened in the news today?")
+    parser.add_argument("--mode", default="satirical")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,234 @@
+"""
+Memory and startup time of independent workers vs pre-forked workers sharing the models.
+
+independent: `uvicorn --workers N`. Every worker is spawned, imports the app
+             and loads its own copy of the models during the lifespan.
+shared:      `PreforkServer`. The parent loads the models once and forks N
+             workers that share them copy-on-write.
+
+The models are stand-ins with real weight memory: `--embed-mb` / `--detox-mb`
+of float32 arrays (split into many tensors, like a transformer checkpoint)
+behind the hash embedding and keyword Detoxify from `benchmarks.fakes`. Qdrant
+is in-memory and Ollama is a local fake, so nothing needs to be running.
+
+Memory is summed over the server's process tree as RSS (shared pages counted
+in every process), USS (pages private to each process) and PSS (shared pages
+split between the processes sharing them). PSS is the number to compare.
+
+Usage:
+    python -m benchmarks.prefork --workers 2 4
+    python -m benchmarks.prefork --workers 4 --embed-mb 1300 --detox-mb 480 --output prefork.json
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import psutil
+
+ROOT = Path(__file__).resolve().parent.parent
+MODES = ("independent", "shared")
+APP = "benchmarks.prefork:app"
+
+
+def _weights(mb: float, tensors: int = 256) -> List[np.ndarray]:
+    # Random values so every page is really allocated, as with loaded weights
+    rng = np.random.default_rng(0)
+    size = int(mb * 1024 * 1024 / 4 / tensors)
+    return [rng.standard_normal(size, dtype=np.float32) for _ in range(tensors)]
+
+
+def _build_embed_model():
+    from pydantic import PrivateAttr
+    from benchmarks.fakes import HashEmbedding
+
+    class WeightedHashEmbedding(HashEmbedding):
+        _weights: list = PrivateAttr(default_factory=list)
+
+    model = WeightedHashEmbedding()
+    model._weights = _weights(float(os.environ["BENCH_EMBED_MB"]))
+    return model
+
+
+def _build_detoxifier():
+    from benchmarks.fakes import FakeDetoxify
+    model = FakeDetoxify()
+    model.weights = _weights(float(os.environ["BENCH_DETOX_MB"]))
+    return model
+
+
+def _build_app():
+    """Register the stand-in models, then wrap the lifespan to report when each worker is ready."""
+    sys.path.insert(0, str(ROOT))
+    from qdrant_client import AsyncQdrantClient, QdrantClient
+    from app.core.model_registry import model_registry
+
+    model_registry.register("embed_model", _build_embed_model, shareable=True)
+    model_registry.register("detoxifier", _build_detoxifier, shareable=True)
+    model_registry.register("qdrant_client", lambda: QdrantClient(":memory:"))
+    model_registry.register("async_qdrant_client", lambda: AsyncQdrantClient(":memory:"))
+
+    import main
+
+    lifespan = main.app.router.lifespan_context
+
+    @asynccontextmanager
+    async def reporting_lifespan(app):
+        async with lifespan(app) as state:
+            report = model_registry.memory_report()
+            Path(os.environ["BENCH_READY_DIR"], str(os.getpid())).write_text(json.dumps(report))
+            yield state
+
+    main.app.router.lifespan_context = reporting_lifespan
+    return main.app
+
+
+def __getattr__(name: str) -> Any:
+    # Built on first access so only the server processes install the stand-ins
+    if name == "app":
+        globals()["app"] = _build_app()
+        return globals()["app"]
+    raise AttributeError(name)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _tree_memory(pid: int) -> Dict[str, Any]:
+    parent = psutil.Process(pid)
+    processes = [parent, *parent.children(recursive=True)]
+    totals = {"rss": 0, "uss": 0, "pss": 0}
+    for process in processes:
+        info = process.memory_full_info()
+        for key in totals:
+            totals[key] += getattr(info, key)
+    return {
+        "processes": len(processes),
+        **{f"{key}_mb": round(value / (1024 * 1024), 1) for key, value in totals.items()},
+    }
+
+
+def _run_mode(mode: str, workers: int, args, env: Dict[str, str]) -> Dict[str, Any]:
+    import httpx
+
+    port = _free_port()
+    ready_dir = tempfile.mkdtemp(prefix="udllm-prefork-ready-")
+    env = {**env, "BENCH_READY_DIR": ready_dir}
+    if mode == "independent":
+        command = [sys.executable, "-m", "uvicorn", APP, "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "benchmarks.prefork", "--serve", "--port", str(port), "--workers", str(workers)]
+
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while len(os.listdir(ready_dir)) < workers:
+            if server.poll() is not None:
+                raise RuntimeError(f"{mode} server exited with status {server.returncode}")
+            if time.perf_counter() - started > args.timeout:
+                raise RuntimeError(f"{mode} server not ready after {args.timeout}s")
+            time.sleep(0.05)
+        startup = time.perf_counter() - started
+
+        errors = 0
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            for _ in range(args.requests):
+                if client.get("/api/health/ready").status_code != 200:
+                    errors += 1
+        time.sleep(args.settle)
+        memory = _tree_memory(server.pid)
+        reports = [json.loads(path.read_text()) for path in Path(ready_dir).iterdir()]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    return {
+        "mode": mode,
+        "workers": workers,
+        "startup_seconds": round(startup, 2),
+        "memory": memory,
+        "worker_rss_mb": sorted(report["process_rss_mb"] for report in reports),
+        "errors": errors,
+    }
+
+
+def _serve(args) -> None:
+    sys.path.insert(0, str(ROOT))
+    from app.core.prefork import PreforkServer
+    PreforkServer(APP, "127.0.0.1", args.port, args.workers[0]).run()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Independent vs pre-forked worker memory benchmark")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--workers", nargs="+", type=int, default=[2, 4])
+    parser.add_argument("--embed-mb", type=float, default=1300, help="Weight memory of the embedding model (bge-large is ~1.3GB in fp32)")
+    parser.add_argument("--detox-mb", type=float, default=480, help="Weight memory of the Detoxify model")
+    parser.add_argument("--requests", type=int, default=50, help="Readiness requests sent once every worker is up")
+    parser.add_argument("--settle", type=float, default=1.0, help="Seconds to wait before measuring memory")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=8000, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        _serve(args)
+        return
+
+    sys.path.insert(0, str(ROOT))
+    from benchmarks.fakes import FakeOllamaServer
+    from benchmarks.run import _git_commit
+
+    workdir = tempfile.mkdtemp(prefix="udllm-prefork-bench-")
+    ollama = FakeOllamaServer().start()
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "OLLAMA_URL": ollama.url,
+        "OLLAMA_HOSTS": ollama.url,
+        "STARTUP_WARMUP": "eager",
+        "QDRANT_GRPC_POOL_SIZE": "1",
+        "PREFORK_MODELS": "embed_model,detoxifier",
+        "BENCH_EMBED_MB": str(args.embed_mb),
+        "BENCH_DETOX_MB": str(args.detox_mb),
+    }
+
+    results = []
+    try:
+        for workers in args.workers:
+            for mode in args.modes:
+                result = _run_mode(mode, workers, args, env)
+                memory = result["memory"]
+                print(
+                    f"{mode:12} workers={workers:<3} startup={result['startup_seconds']:7.2f}s  "
+                    f"pss={memory['pss_mb']:9.1f}MB  uss={memory['uss_mb']:9.1f}MB  rss={memory['rss_mb']:9.1f}MB  "
+                    f"processes={memory['processes']}  errors={result['errors']}"
+                )
+                results.append(result)
+    finally:
+        ollama.stop()
+
+    if args.output:
+        report = {"git": _git_commit(), "config": {k: v for k, v in vars(args).items() if k not in ("serve", "port")}, "results": results}
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Offline benchmark suite for the API.
+
+Drives `main.app` in-process (httpx ASGI transport) with every external service
+replaced by a local stand-in from `benchmarks.fakes`: in-memory Qdrant seeded
+with synthetic articles, a fake Ollama server with configurable token latency,
+a hash embedding, keyword Detoxify and an in-memory Kafka producer. Nothing
+needs to be running and no model weights are downloaded.
+
+For every scenario (normal, satirical, ab, reward) and concurrency level it
+reports throughput, p50/p95/p99 latency and process memory, and writes the
+results as JSON tagged with the git commit so runs can be compared.
+
+Usage:
+    python -m benchmarks.run --levels 1 8 32 --requests 64
+    python -m benchmarks.run --scenarios normal ab --compare benchmarks/results/<old>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import psutil
+
+ROOT = Path(__file__).resolve().parent.parent
+SCENARIOS = ("normal", "satirical", "ab", "reward")
+SYSTEM_PROMPTS = [
+    "You are a concise news assistant. Answer in two sentences.",
+    "You are a friendly explainer for curious readers.",
+    "You summarise the news for busy commuters.",
+]
+
+
+def _git_commit() -> Dict[str, Any]:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+
+    try:
+        return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+def _install_fakes(args, workdir: str):
+    """Point the app at local stand-ins. Must run before anything under `app` is imported."""
+    from benchmarks.fakes import FakeOllamaServer
+
+    servers = [
+        FakeOllamaServer(
+            tokens=args.tokens,
+            first_token_ms=args.first_token_ms,
+            token_ms=args.token_ms,
+            prompt_token_ms=args.prompt_token_ms,
+            parallel=args.llm_parallel,
+            load_ms=args.load_ms,
+        ).start()
+        for _ in range(args.llm_hosts)
+    ]
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    os.environ["OLLAMA_URL"] = servers[0].url
+    os.environ["OLLAMA_HOSTS"] = ",".join(server.url for server in servers)
+    os.environ["OLLAMA_PARALLEL"] = str(args.llm_parallel)
+    os.environ["SEMANTIC_CACHE_ENABLED"] = "true" if args.cache else "false"
+    os.environ["STARTUP_WARMUP"] = "eager"
+    os.environ["QDRANT_GRPC_POOL_SIZE"] = "1"  # The in-memory client is the whole pool
+    sys.path.insert(0, str(ROOT))
+
+    from qdrant_client import AsyncQdrantClient, QdrantClient
+    from app.core.model_registry import model_registry
+    from benchmarks.fakes import FakeDetoxify, HashEmbedding, seed_collections
+
+    embed_model = HashEmbedding(item_cost_ms=args.embed_ms)
+    sync_client, async_client = QdrantClient(":memory:"), AsyncQdrantClient(":memory:")
+    seed_collections(sync_client, async_client, embed_model, ["articles", "satirical_articles"], args.articles)
+
+    model_registry.override("embed_model", embed_model)
+    model_registry.override("qdrant_client", sync_client)
+    model_registry.override("async_qdrant_client", async_client)
+    model_registry.override("detoxifier", FakeDetoxify(item_cost_ms=args.detox_ms))
+    return servers
+
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {}
+    values = np.array(latencies) * 1000
+    return {
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "mean": round(float(values.mean()), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+class _MemorySampler:
+    """Samples process RSS in a background thread while a level runs."""
+
+    def __init__(self, interval: float = 0.05):
+        self._process = psutil.Process()
+        self._interval = interval
+        self._stop = threading.Event()
+        self.start_mb = self.peak_mb = self.end_mb = 0.0
+
+    def _rss_mb(self) -> float:
+        return self._process.memory_info().rss / (1024 * 1024)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self.peak_mb = max(self.peak_mb, self._rss_mb())
+
+    def __enter__(self):
+        self.start_mb = self.peak_mb = self._rss_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end_mb = self._rss_mb()
+        self.peak_mb = max(self.peak_mb, self.end_mb)
+
+    def report(self) -> Dict[str, float]:
+        return {"start": round(self.start_mb, 1), "peak": round(self.peak_mb, 1), "end": round(self.end_mb, 1)}
+
+
+def _request_factory(scenario: str) -> Callable[[int], tuple]:
+    from benchmarks.fakes import PLACES, TOPICS
+
+    def query(i: int) -> str:
+        return f"What is the latest {TOPICS[i % len(TOPICS)]} news from {PLACES[i % len(PLACES)]}? ({i})"
+
+    if scenario == "reward":
+        return lambda i: ("/api/rlhf/reward", {
+            "prompt": query(i), "response": "A generated answer.", "system_prompt": SYSTEM_PROMPTS[0], "reward": 1.0
+        })
+    mode = "satirical" if scenario == "satirical" else "qa"
+    return lambda i: ("/api/llm/prompt", {"prompt": query(i), "mode": mode})
+
+
+async def _run_level(client, scenario: str, concurrency: int, total: int, offset: int) -> Dict[str, Any]:
+    make_request = _request_factory(scenario)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+
+    async def one(i: int):
+        path, payload = make_request(offset + i)
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                key = type(e).__name__
+                errors[key] = errors.get(key, 0) + 1
+
+    with _MemorySampler() as memory:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": _percentiles(latencies),
+        "rss_mb": memory.report(),
+    }
+
+
+async def _bench(args) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    import httpx
+    import main
+    from app.core.config import get_settings
+    from app.core.container import container
+    from app.core.kafka_service import kafka_service
+    from benchmarks.fakes import FakeKafkaProducer
+
+    settings = get_settings()
+    producer = FakeKafkaProducer()
+    kafka_service._producer_factory = lambda: producer
+
+    results = []
+    async with main.app.router.lifespan_context(main.app):
+        startup = container.startup_report()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            for prompt in SYSTEM_PROMPTS:
+                (await client.post("/api/system-prompts", json={"prompt": prompt})).raise_for_status()
+
+            offset = 0
+            for scenario in args.scenarios:
+                # A/B traffic always samples a second prompt; plain traffic never does
+                settings.MULTIPLE_PROMPT_PROB = 1.0 if scenario == "ab" else 0.0
+                await _run_level(client, scenario, 1, args.warmup, offset)
+                offset += args.warmup
+                for level in args.levels:
+                    result = await _run_level(client, scenario, level, args.requests, offset)
+                    offset += args.requests
+                    results.append(result)
+                    print(
+                        f"{scenario:<10} c={level:<4} {result['throughput_rps']:>8.2f} rps  "
+                        f"p50={result['latency_ms'].get('p50', 0):>8.1f}ms  "
+                        f"p95={result['latency_ms'].get('p95', 0):>8.1f}ms  "
+                        f"p99={result['latency_ms'].get('p99', 0):>8.1f}ms  "
+                        f"rss={result['rss_mb']['peak']:.0f}MB  errors={sum(result['errors'].values())}"
+                    )
+    print(f"kafka records acknowledged: {producer.sent}")
+    return results, startup
+
+
+def _compare(current: List[Dict[str, Any]], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\nCompared with {baseline_path}:")
+    for result in current:
+        old = baseline.get((result["scenario"], result["concurrency"]))
+        if not old or not result["latency_ms"] or not old["latency_ms"]:
+            continue
+        print(
+            f"{result['scenario']:<10} c={result['concurrency']:<4} "
+            f"rps {delta(result['throughput_rps'], old['throughput_rps']):>8}  "
+            f"p50 {delta(result['latency_ms']['p50'], old['latency_ms']['p50']):>8}  "
+            f"p95 {delta(result['latency_ms']['p95'], old['latency_ms']['p95']):>8}  "
+            f"p99 {delta(result['latency_ms']['p99'], old['latency_ms']['p99']):>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the API against local stand-ins")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per scenario and level")
+    parser.add_argument("--warmup", type=int, default=4)
+    parser.add_argument("--articles", type=int, default=500, help="Synthetic articles per collection")
+    parser.add_argument("--tokens", type=int, default=40, help="Tokens per fake LLM reply")
+    parser.add_argument("--first-token-ms", type=float, default=150.0)
+    parser.add_argument("--token-ms", type=float, default=10.0)
+    parser.add_argument("--prompt-token-ms", type=float, default=0.2, help="Fake prompt evaluation cost per prompt token")
+    parser.add_argument("--llm-parallel", type=int, default=4, help="Concurrent generations in the fake LLM")
+    parser.add_argument("--llm-hosts", type=int, default=1, help="Fake Ollama servers to balance across")
+    parser.add_argument("--load-ms", type=float, default=2000.0, help="Fake model load time when not kept alive")
+    parser.add_argument("--embed-ms", type=float, default=2.0, help="Fake embedding cost per text")
+    parser.add_argument("--detox-ms", type=float, default=1.0, help="Fake Detoxify cost per text")
+    parser.add_argument("--cache", action="store_true", help="Keep the semantic response cache enabled")
+    parser.add_argument("--output", default=str(ROOT / "benchmarks" / "results"), help="Directory for the JSON results")
+    parser.add_argument("--compare", help="Earlier results file to diff against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        servers = _install_fakes(args, workdir)
+        try:
+            results, startup = asyncio.run(_bench(args))
+        finally:
+            for server in servers:
+                server.stop()
+
+    git = _git_commit()
+    report = {
+        "git": git,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "startup": startup,
+        "llm": {
+            "requests": sum(server.requests for server in servers),
+            "requests_per_host": [server.requests for server in servers],
+            "model_loads": sum(server.loads for server in servers),
+            "avg_prompt_tokens": (
+                round(sum(server.prompt_tokens for server in servers) / sum(server.requests for server in servers), 1)
+                if any(server.requests for server in servers) else 0.0
+            ),
+        },
+        "results": results,
+    }
+    print(
+        f"fake LLM calls: {report['llm']['requests_per_host']} per host, "
+        f"model loads: {report['llm']['model_loads']}, avg prompt tokens: {report['llm']['avg_prompt_tokens']}"
+    )
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    name = f"{datetime.now():%Y%m%d-%H%M%S}-{(git['commit'] or 'nogit')[:8]}{'-dirty' if git['dirty'] else ''}.json"
+    with open(output / name, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output / name}")
+
+    if args.compare:
+        _compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,61 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.api.endpoints import router
-from app.database.database import engine
-from app.models.models import Base
+from app.database.database import async_engine, engine
 from app.core.config import get_settings
+from app.core.container import container
+from app.core.kafka_service import kafka_service
+from app.core.llm_gateway import llm_gateway
+from app.core.model_registry import model_registry
+from app.core.sessions import session_store
+from app.evaluation.jobs import evaluation_jobs
+from app.core.counters import counter_aggregator
+from app.core.toxicity import toxicity_scorer
+from app.core.metrics import MetricsMiddleware, instrument_engine, metrics_endpoint
 from fastapi.middleware.cors import CORSMiddleware
 
 # Load settings
 settings = get_settings()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Time every SQL statement as a pipeline stage
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tables, models and services are built here (per STARTUP_WARMUP), not at import
+    counter_aggregator.start()
+    await container.start()
+    await llm_gateway.start(prewarm=settings.STARTUP_WARMUP != "lazy")
+    await session_store.start()
+    yield
+    await evaluation_jobs.stop()
+    await session_store.stop()
+    await llm_gateway.stop()
+    await container.stop()
+    if model_registry.is_loaded("qdrant_search_pool"):
+        await model_registry.get("qdrant_search_pool").close()
+    # Write prompt counters and deliver whatever is still spooled before the worker exits
+    counter_aggregator.stop()
+    kafka_service.close()
+    toxicity_scorer.shutdown()
+    await async_engine.dispose()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="UDLLM API",
     description="API for querying news articles using LLM",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Include routers
 app.include_router(router, prefix="/api")
 
+# Prometheus metrics
+app.add_middleware(MetricsMiddleware)
+app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+
 # Include cors
 origins = [
     "*",
@@ -35,11 +70,10 @@ app.add_middleware(
 )
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True  # Enable auto-reload during development
-    )
-
+    if settings.SERVER_RELOAD:
+        import uvicorn
+        # Development: one process, restarted on code changes
+        uvicorn.run("main:app", host=settings.SERVER_HOST, port=settings.SERVER_PORT, reload=True)
+    else:
+        from app.core.prefork import PreforkServer
+        PreforkServer("main:app", settings.SERVER_HOST, settings.SERVER_PORT, settings.SERVER_WORKERS).run()
@@ -0,0 +1,24 @@
+import pytest
+
+from benchmarks.fakes import FakeOllamaServer, _free_port
+
+
+@pytest.fixture
+def ollama():
+    """Start fake Ollama servers on demand; all of them are stopped after the test."""
+    servers = []
+
+    def start(**options) -> FakeOllamaServer:
+        server = FakeOllamaServer(**{"tokens": 6, "first_token_ms": 20, "token_ms": 5, **options}).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def dead_url() -> str:
+    # Nothing listens here, so connections are refused
+    return f"http://127.0.0.1:{_free_port()}"
@@ -0,0 +1,69 @@
+import json
+import time
+
+import pytest
+
+from app.api.schemas import RLHFMessage
+from app.core.config import get_settings
+from app.core.kafka_service import KafkaService
+from benchmarks.fakes import FakeKafkaProducer
+
+settings = get_settings()
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "KAFKA_RETRY_BACKOFF_SECONDS", 0.02)
+
+
+def message(i: int) -> RLHFMessage:
+    return RLHFMessage(prompt=f"question {i}", response="answer", system_prompt="Be brief.", reward=1.0)
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_records_are_spooled_while_the_broker_is_down():
+    producer = FakeKafkaProducer()
+    producer.available = False
+    service = KafkaService(lambda: producer)
+    try:
+        service.send_batch("rlhf", [message(i) for i in range(3)])
+        time.sleep(0.1)
+        assert service.metrics()["delivered"] == 0
+        assert service.metrics()["enqueued"] == 3
+
+        producer.available = True
+        wait_for(lambda: service.metrics()["delivered"] == 3)
+    finally:
+        service.close(timeout=1)
+
+    assert [json.loads(value)["prompt"] for value in producer.values] == ["question 0", "question 1", "question 2"]
+    assert service.metrics()["queue_depth"] == 0
+
+
+def test_records_are_delivered_once_the_producer_can_be_created():
+    producer = FakeKafkaProducer()
+    attempts = []
+
+    def factory():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise ConnectionError("no brokers available")
+        return producer
+
+    service = KafkaService(factory)
+    try:
+        service.send_message("rlhf", message(0))
+        service.send_message("rlhf", message(1))
+        wait_for(lambda: service.metrics()["delivered"] == 2)
+    finally:
+        service.close(timeout=1)
+
+    assert len(attempts) == 3
+    assert producer.sent == 2
+    assert service.metrics()["dropped"] == 0
@@ -0,0 +1,135 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.llm_gateway import LLMGateway
+
+MESSAGES = [{"role": "user", "content": "What happened in Cluj?"}]
+
+
+def run(coroutine_function, gateway: LLMGateway):
+    async def main():
+        try:
+            return await coroutine_function()
+        finally:
+            await gateway.stop()
+    return asyncio.run(main())
+
+
+async def collect(gateway: LLMGateway, chunks: list) -> str:
+    async for chunk in gateway.stream_chat("fake", MESSAGES, {}):
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+def test_stream_fails_over_when_a_host_refuses_connections(ollama, dead_url):
+    live = ollama()
+    gateway = LLMGateway([dead_url, live.url])
+
+    answer = run(lambda: collect(gateway, []), gateway)
+
+    assert answer.strip()
+    assert live.requests == 1
+    assert gateway.stats()["retries"] == 1
+    assert not gateway.hosts[0].available
+
+
+def test_stream_fails_over_on_server_errors(ollama):
+    failing, live = ollama(), ollama()
+    failing.fail_status = 503
+    gateway = LLMGateway([failing.url, live.url])
+
+    answer = run(lambda: collect(gateway, []), gateway)
+
+    assert answer.strip()
+    assert (failing.requests, live.requests) == (1, 1)
+    assert not gateway.hosts[0].available
+
+
+def test_stream_is_not_restarted_once_tokens_were_sent(ollama):
+    failing, live = ollama(), ollama()
+    failing.fail_after = 2
+    gateway = LLMGateway([failing.url, live.url])
+    chunks = []
+
+    async def main():
+        with pytest.raises(httpx.TransportError):
+            await collect(gateway, chunks)
+        # The host that dropped the stream is skipped by the next request
+        return await collect(gateway, [])
+
+    answer = run(main, gateway)
+
+    assert len(chunks) == 2
+    assert answer.strip()
+    assert (failing.requests, live.requests) == (1, 1)
+
+
+def test_client_errors_are_not_retried(ollama):
+    rejecting, live = ollama(), ollama()
+    rejecting.fail_status = 400
+    gateway = LLMGateway([rejecting.url, live.url])
+
+    async def main():
+        with pytest.raises(httpx.HTTPStatusError):
+            await gateway.generate("fake", "What happened in Cluj?", {})
+
+    run(main, gateway)
+
+    assert live.requests == 0
+    assert gateway.hosts[0].available
+
+
+def test_identical_requests_share_one_generation(ollama):
+    server = ollama()
+    gateway = LLMGateway([server.url])
+
+    async def main():
+        return await asyncio.gather(*(gateway.generate("fake", "What happened in Cluj?", {}) for _ in range(3)))
+
+    answers = run(main, gateway)
+
+    assert len(set(answers)) == 1 and answers[0].strip()
+    assert server.requests == 1
+    assert gateway.stats()["coalesced"] == 2
+
+
+def test_cancelling_one_caller_does_not_fail_the_others(ollama):
+    server = ollama(first_token_ms=200)
+    gateway = LLMGateway([server.url])
+
+    async def main():
+        first = asyncio.create_task(gateway.generate("fake", "What happened in Cluj?", {}))
+        second = asyncio.create_task(gateway.generate("fake", "What happened in Cluj?", {}))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        answer = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return answer
+
+    answer = run(main, gateway)
+
+    assert answer.strip()
+    assert server.requests == 1
+
+
+def test_generation_is_cancelled_when_every_caller_leaves(ollama):
+    server = ollama(first_token_ms=200)
+    gateway = LLMGateway([server.url])
+
+    async def main():
+        callers = [asyncio.create_task(gateway.generate("fake", "What happened in Cluj?", {})) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        shared = next(iter(gateway._inflight.values())).task
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        return shared
+
+    shared = run(main, gateway)
+
+    assert shared.cancelled()
+    assert gateway.stats()["inflight_unique"] == 0
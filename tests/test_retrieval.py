@@ -0,0 +1,114 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+from llama_index.core.schema import NodeWithScore, TextNode
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+from app.core.model_registry import model_registry
+from app.core.qdrant import QdrantClientPool
+from app.core.retrieval import RetrievalEngine, RetrievalFilters, SearchCache, search_cache
+from benchmarks.fakes import HashEmbedding, seed_collections, synthetic_articles
+
+EMBEDDING = [0.1, 0.2, 0.3]
+
+
+def nodes(*texts: str):
+    return [NodeWithScore(node=TextNode(text=text), score=1.0) for text in texts]
+
+
+def test_search_cache_hits_and_misses():
+    cache = SearchCache(ttl=30, max_entries=8)
+    key = cache.key("articles", EMBEDDING, None, 10)
+
+    assert cache.get(key) is None
+    cache.put(key, nodes("a"))
+    assert cache.get(key)[0].node.get_content() == "a"
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def test_search_cache_keys_separate_filters_limits_and_collections():
+    key = SearchCache.key
+    by_source = RetrievalFilters.build(sources=["wire", "daily"])
+    by_date = RetrievalFilters.build(published_after=datetime(2025, 1, 1))
+
+    keys = {
+        key("articles", EMBEDDING, None, 10),
+        key("articles", EMBEDDING, by_source, 10),
+        key("articles", EMBEDDING, by_date, 10),
+        key("articles", EMBEDDING, None, 20),
+        key("satirical_articles", EMBEDDING, None, 10),
+        key("articles", [0.1, 0.2, 0.4], None, 10),
+    }
+    assert len(keys) == 6
+    # Source order does not matter
+    assert key("articles", EMBEDDING, RetrievalFilters.build(sources=["daily", "wire"]), 10) == key("articles", EMBEDDING, by_source, 10)
+
+
+def test_search_cache_expires_and_evicts():
+    cache = SearchCache(ttl=0.05, max_entries=2)
+    first, second, third = (cache.key("articles", EMBEDDING, None, limit) for limit in (1, 2, 3))
+    cache.put(first, nodes("a"))
+    cache.put(second, nodes("b"))
+    cache.put(third, nodes("c"))
+
+    assert cache.get(first) is None  # Least recently used, evicted
+    assert cache.get(third) is not None
+    time.sleep(0.06)
+    assert cache.get(third) is None
+
+
+def test_search_cache_clears_one_collection():
+    cache = SearchCache(ttl=30, max_entries=8)
+    articles = cache.key("articles", EMBEDDING, None, 10)
+    satirical = cache.key("satirical_articles", EMBEDDING, None, 10)
+    cache.put(articles, nodes("a"))
+    cache.put(satirical, nodes("b"))
+
+    cache.clear("articles")
+
+    assert cache.get(articles) is None
+    assert cache.get(satirical) is not None
+
+
+@pytest.fixture
+def engine():
+    embed_model = HashEmbedding()
+    sync_client, async_client = QdrantClient(":memory:"), AsyncQdrantClient(":memory:")
+    seed_collections(sync_client, async_client, embed_model, ["articles"], 40)
+    model_registry.override("async_qdrant_client", async_client)
+    model_registry.override("qdrant_search_pool", QdrantClientPool(async_client, 1))
+    search_cache.clear()
+    yield RetrievalEngine(["articles"], top_k=5), embed_model
+    search_cache.clear()
+
+
+def test_retrieval_fetches_only_the_payload_fields_and_caches_searches(engine):
+    engine, embed_model = engine
+    query = "Cluj football news"
+    embedding = embed_model.get_query_embedding(query)
+    hits_before = search_cache.stats()["hits"]
+
+    first = asyncio.run(engine.aretrieve(query, embedding))
+    second = asyncio.run(engine.aretrieve(query, embedding))
+
+    assert first and all(node.node.get_content() for node in first)
+    # The serialized node llama_index stores next to the fields is not fetched
+    assert all(set(node.node.metadata) <= {"title", "url"} for node in first)
+    assert [node.node.node_id for node in second] == [node.node.node_id for node in first]
+    assert search_cache.stats()["hits"] == hits_before + 1
+
+
+def test_retrieval_applies_filters_and_caches_them_separately(engine):
+    engine, embed_model = engine
+    query = "Cluj football news"
+    embedding = embed_model.get_query_embedding(query)
+    sources = {article["url"]: article["source"] for article in synthetic_articles(40)}
+
+    unfiltered = asyncio.run(engine.aretrieve(query, embedding))
+    filtered = asyncio.run(engine.aretrieve(query, embedding, RetrievalFilters.build(sources=["wire"])))
+
+    assert filtered and {sources[node.node.metadata["url"]] for node in filtered} == {"wire"}
+    assert {sources[node.node.metadata["url"]] for node in unfiltered} != {"wire"}
+    assert search_cache.stats()["entries"] == 2